@@ -0,0 +1,113 @@
+"""Admission control for incoming updates.
+
+Every update is admitted through one AdmissionController, which tracks how
+many updates are in flight and how long the oldest of them has been waiting.
+Given a ``backlog`` (the application's update processor), it also counts the
+updates still queued there and ages every update from its arrival rather than
+from its admission, so a growing queue is seen before the handlers reach it.
+Past the configured thresholds new updates are served in a cheaper mode:
+
+* ``degraded`` - product details from cache only, text replies without images
+* ``shed``     - replies only if everything is cached, otherwise "busy, retry"
+
+Modes step back down only once the backlog is below ``recover_ratio`` of the
+threshold that triggered them, so the bot does not flap at the boundary.
+"""
+import contextlib
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+MODE_NORMAL = "normal"
+MODE_DEGRADED = "degraded"
+MODE_SHED = "shed"
+_MODE_LEVELS = {MODE_NORMAL: 0, MODE_DEGRADED: 1, MODE_SHED: 2}
+
+
+class AdmissionController:
+    """
+    Global in-flight and queue-age tracker with hysteresis.
+    Args:
+        degrade_in_flight (int): In-flight updates at which new updates are degraded.
+        shed_in_flight (int): In-flight updates at which new updates are shed.
+        degrade_age (float): Age in seconds of the oldest in-flight update that triggers degraded mode.
+        shed_age (float): Oldest-update age that triggers shedding.
+        recover_ratio (float): Fraction of a threshold the load must fall below to leave its mode.
+        backlog: Optional source of queued updates, with a ``pending`` count (running or
+            queued) and ``oldest_arrival()`` (``clock`` time, or None when nothing is pending).
+    """
+
+    def __init__(self, degrade_in_flight=64, shed_in_flight=256, degrade_age=5.0, shed_age=15.0,
+                 recover_ratio=0.5, clock=time.monotonic, backlog=None):
+        self.degrade_in_flight = degrade_in_flight
+        self.shed_in_flight = shed_in_flight
+        self.degrade_age = degrade_age
+        self.shed_age = shed_age
+        self.recover_ratio = recover_ratio
+        self._clock = clock
+        self.backlog = backlog
+        self._tickets = itertools.count()
+        # Start (arrival) time of each admitted update, by ticket.
+        self._started = {}
+        self.mode = MODE_NORMAL
+        self.admitted = {mode: 0 for mode in _MODE_LEVELS}
+
+    @property
+    def in_flight(self) -> int:
+        if self.backlog is None:
+            return len(self._started)
+        return max(len(self._started), self.backlog.pending)
+
+    def oldest_age(self) -> float:
+        oldest = min(self._started.values(), default=None)
+        if self.backlog is not None:
+            arrived = self.backlog.oldest_arrival()
+            if arrived is not None and (oldest is None or arrived < oldest):
+                oldest = arrived
+        return 0.0 if oldest is None else self._clock() - oldest
+
+    def _mode_for(self, in_flight, age, scale=1.0):
+        if in_flight >= self.shed_in_flight * scale or age >= self.shed_age * scale:
+            return MODE_SHED
+        if in_flight >= self.degrade_in_flight * scale or age >= self.degrade_age * scale:
+            return MODE_DEGRADED
+        return MODE_NORMAL
+
+    def update_mode(self) -> str:
+        in_flight, age = self.in_flight, self.oldest_age()
+        target = self._mode_for(in_flight, age)
+        if _MODE_LEVELS[target] < _MODE_LEVELS[self.mode]:
+            # Only step down as far as the lowered (recovery) thresholds allow.
+            recovered = min(self.mode, self._mode_for(in_flight, age, self.recover_ratio), key=_MODE_LEVELS.get)
+            target = max(target, recovered, key=_MODE_LEVELS.get)
+        if target != self.mode:
+            log = logger.warning if _MODE_LEVELS[target] > _MODE_LEVELS[self.mode] else logger.info
+            log("Admission mode %s -> %s (in flight: %s, oldest: %.1fs)", self.mode, target, in_flight, age)
+            self.mode = target
+        return self.mode
+
+    def admit(self, arrived_at=None):
+        """
+        Register a new update that arrived at ``arrived_at`` (``clock`` time, default now);
+        returns ``(ticket, mode)`` for it.
+        """
+        mode = self.update_mode()
+        ticket = next(self._tickets)
+        self._started[ticket] = self._clock() if arrived_at is None else arrived_at
+        self.admitted[mode] += 1
+        return ticket, mode
+
+    def release(self, ticket) -> None:
+        self._started.pop(ticket, None)
+        self.update_mode()
+
+    @contextlib.contextmanager
+    def track(self, arrived_at=None):
+        """``with controller.track() as mode:`` - admit for the duration of the block."""
+        ticket, mode = self.admit(arrived_at)
+        try:
+            yield mode
+        finally:
+            self.release(ticket)
@@ -1,28 +1,237 @@
 
+import json
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict, deque
+from typing import NamedTuple
+
 import requests
 from bs4 import BeautifulSoup
 
+logger = logging.getLogger(__name__)
+
+# Script globals under which AliExpress product pages embed their state as JSON.
+PAGE_STATE_MARKERS = ("window.runParams", "_init_data_", "__INIT_DATA__", "window._d_c_.DCData")
+PRICE_KEYS = ("formatedActivityPrice", "salePriceString", "formatedPrice", "formatedAmount", "minActivityAmount")
+CURRENCY_KEYS = ("currencyCode", "currency", "baseCurrencyCode")
+STOCK_KEYS = ("totalAvailQuantity", "availQuantity", "totalQuantity")
+COIN_TEXT_REGEX = re.compile(r'coins?\b.*\d|\d.*\bcoins?\b', re.IGNORECASE)
+CURRENCY_CODE_REGEX = re.compile(r'^[A-Z]{3}$')
+_json_decoder = json.JSONDecoder()
+
+
+def _decode_state_objects(script_text, marker):
+    """Yield the JSON objects assigned after ``marker`` in a script body."""
+    position = script_text.find(marker)
+    while position != -1:
+        start = script_text.find("{", position)
+        # runParams is `{ data: {...} }` (not strict JSON), so retry from the next brace a few times.
+        for _ in range(4):
+            if start == -1:
+                break
+            try:
+                state, _ = _json_decoder.raw_decode(script_text, start)
+                yield state
+                break
+            except ValueError:
+                start = script_text.find("{", start + 1)
+        position = script_text.find(marker, position + len(marker))
+
+
+def _walk_state(state, max_nodes=200000):
+    """Breadth-first (key, value) pairs of a decoded state tree."""
+    queue = deque([state])
+    seen = 0
+    while queue and seen < max_nodes:
+        node = queue.popleft()
+        seen += 1
+        if isinstance(node, dict):
+            for key, value in node.items():
+                yield key, value
+                if isinstance(value, (dict, list)):
+                    queue.append(value)
+        elif isinstance(node, list):
+            queue.extend(item for item in node if isinstance(item, (dict, list)))
+
 
-def get_aliexpress_product_info(product_url):
+def extract_page_state(html):
     """
-    Extract product name from AliExpress without Selenium
+    Extract price details from the JSON state embedded in a product page's scripts.
+    Args:
+        html (str): Product page HTML
+    Returns:
+        dict: {'price', 'currency', 'coin_discount', 'stock'}; values are None when not found.
+    """
+    record = {'price': None, 'currency': None, 'coin_discount': None, 'stock': None}
+    for marker in PAGE_STATE_MARKERS:
+        if marker not in html:
+            continue
+        for state in _decode_state_objects(html, marker):
+            found = {}
+            for key, value in _walk_state(state):
+                if isinstance(value, str):
+                    if key in PRICE_KEYS and value.strip() and any(ch.isdigit() for ch in value):
+                        found.setdefault(('price', PRICE_KEYS.index(key)), value.strip())
+                    elif key in CURRENCY_KEYS and CURRENCY_CODE_REGEX.match(value):
+                        found.setdefault(('currency', CURRENCY_KEYS.index(key)), value)
+                    elif 'coin' in key.lower() and COIN_TEXT_REGEX.search(value):
+                        found.setdefault(('coin_discount', 0), value.strip())
+                    elif value.startswith('Coins to save'):
+                        found.setdefault(('coin_discount', 1), value.strip())
+                elif key in STOCK_KEYS and isinstance(value, int) and not isinstance(value, bool):
+                    found.setdefault(('stock', STOCK_KEYS.index(key)), value)
+            for (field, _), value in sorted(found.items()):
+                if record[field] is None:
+                    record[field] = value
+            if record['price'] is not None:
+                return record
+    return record
+
+
+PAGE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+PAGE_COOKIES = {"x-hng": "lang=en-US", "intl_locale": "en_US"}
+
+
+class PageFetch(NamedTuple):
+    status: int | None
+    content: bytes | None
+    encoding: str | None
+    etag: str | None
+    last_modified: str | None
+
+
+class CachedPage(NamedTuple):
+    record: dict
+    etag: str | None
+    last_modified: str | None
+    html_z: bytes
+    encoding: str
+    parser_version: int
+    fetched_at: float
+
+
+# Bump when parse_product_page extracts something new: cached pages are then
+# re-parsed from their stored HTML on the next 304 instead of being downloaded again.
+PAGE_PARSER_VERSION = 1
+PAGE_CACHE_MAX_ENTRIES = 5000
+PAGE_CACHE_MAX_HTML_BYTES = 64 * 1024 * 1024
+
+
+class ScrapedPageCache:
+    """
+    Scraped product pages by URL: the extracted record, the ETag / Last-Modified
+    validators to revalidate it with, and the page HTML (zlib-compressed).
+    Least recently used pages are dropped past ``max_entries``; past
+    ``max_html_bytes`` the oldest pages only lose their HTML.
+    """
+
+    def __init__(self, max_entries=PAGE_CACHE_MAX_ENTRIES, max_html_bytes=PAGE_CACHE_MAX_HTML_BYTES):
+        self.max_entries = max_entries
+        self.max_html_bytes = max_html_bytes
+        self._pages = OrderedDict()
+        self._html_sizes = OrderedDict()
+        self._lock = threading.Lock()
+        self.html_bytes = 0
+        self.revalidated = 0
+        self.downloaded = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, url):
+        with self._lock:
+            page = self._pages.get(url)
+            if page is not None:
+                self._pages.move_to_end(url)
+            return page
+
+    def _forget_html(self, url):
+        self.html_bytes -= self._html_sizes.pop(url, 0)
+
+    def put(self, url, page):
+        with self._lock:
+            self._forget_html(url)
+            self._pages[url] = page
+            self._pages.move_to_end(url)
+            if page.html_z:
+                self._html_sizes[url] = len(page.html_z)
+                self.html_bytes += len(page.html_z)
+            while len(self._pages) > self.max_entries:
+                oldest, _ = self._pages.popitem(last=False)
+                self._forget_html(oldest)
+            while self.html_bytes > self.max_html_bytes and self._html_sizes:
+                oldest = next(iter(self._html_sizes))
+                self._forget_html(oldest)
+                self._pages[oldest] = self._pages[oldest]._replace(html_z=b"")
+
+
+page_cache = ScrapedPageCache()
+
+
+def fetch_product_page_conditional(product_url, cached=None, timeout=15):
+    """
+    Download a product page, revalidating ``cached`` (a CachedPage) when it has validators.
     Args:
         product_url (str): AliExpress product page URL
+        cached (CachedPage): Earlier copy of the page, if any.
+        timeout (float): Request timeout in seconds.
+    Returns:
+        PageFetch: status 304 with no content if the cached copy is still current,
+        status None if the request failed.
+    """
+    headers = dict(PAGE_HEADERS)
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    try:
+        response = requests.get(product_url, headers=headers, cookies=PAGE_COOKIES, timeout=timeout)
+        if response.status_code == 304:
+            return PageFetch(304, None, None, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        if response.status_code != 200:
+            logger.warning("Failed to load %s: HTTP %s", product_url, response.status_code)
+            return PageFetch(response.status_code, None, None, None, None)
+        return PageFetch(200, response.content, response.encoding or "utf-8",
+                         response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    except Exception as e:
+        logger.warning("Error fetching %s: %s", product_url, e)
+        return PageFetch(None, None, None, None, None)
+
+
+def parse_and_pack_page(content, encoding="utf-8"):
+    """
+    parse_product_page plus the compressed page for the cache; CPU-bound, runs in a worker process.
     Returns:
-        str: product name
+        tuple: (record or None, zlib-compressed content)
+    """
+    return parse_product_page(content, encoding), zlib.compress(content, 6)
+
+
+def reparse_cached_page(cached):
+    """Re-extract a cached page's record from its stored HTML (no download)."""
+    return parse_product_page(zlib.decompress(cached.html_z), cached.encoding)
+
+
+def parse_product_page(content, encoding="utf-8"):
+    """
+    Extract product name, image and embedded price state from a downloaded page.
+    CPU-bound; takes raw bytes so it can run in a worker process.
+    Args:
+        content (bytes): Page body as downloaded.
+        encoding (str): Charset reported by the server.
+    Returns:
+        dict: {'title', 'image_url', 'price', 'currency', 'coin_discount', 'stock'} or None if failed.
     """
     product_name = None # Initialize product_name
     img_url = None # Initialize img_url
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        cookies = {"x-hng": "lang=en-US", "intl_locale": "en_US"}
-        response = requests.get(product_url, headers=headers, cookies=cookies, timeout=15)
-        if response.status_code != 200:
-            print(f"Failed to load page: {response.status_code}")
-            return None, None # Return None for both if page fails
-        soup = BeautifulSoup(response.text, "html.parser")
+        html = content.decode(encoding, errors="replace")
+        soup = BeautifulSoup(html, "html.parser")
         
         # Try finding the specific h1 tag first
         root_div = soup.find("div", id="root")
@@ -75,26 +284,21 @@ def get_aliexpress_product_info(product_url):
         # --- Clean up Product Name ---
         if product_name:
             # Remove common AliExpress suffixes, potentially followed by numbers
-            import re
             # Regex: " - AliExpress" optionally followed by space and digits, at the end of the string
             product_name = re.sub(r'\s*-\s*AliExpress(\s+\d+)?$', '', product_name).strip()
             # Also handle case without leading space before hyphen
             product_name = re.sub(r'-AliExpress(\s+\d+)?$', '', product_name).strip()
 
-
-        return product_name, img_url
+        # --- Price / coins / stock from the embedded page state (same fetch) ---
+        record = extract_page_state(html)
+        record['title'] = product_name
+        record['image_url'] = img_url
+        return record
     except Exception as e:
-        print(f"An error occurred in get_aliexpress_product_info: {str(e)}") # Added function name for clarity
-        return None, None # Return None for both on error
+        logger.warning("Error parsing product page: %s", e)
+        return None
 
-def get_product_details_by_id(product_id):
-    """
-    Constructs URL from product ID and fetches product details.
-    Args:
-        product_id (str or int): The AliExpress product ID.
-    Returns:
-        tuple: (product_name, img_url) or (None, None) if failed.
-    """
-    product_url = f"https://vi.aliexpress.com/item/{product_id}.html"
-    print(f"Constructed URL: {product_url}")
-    return get_aliexpress_product_info(product_url)
+
+def product_page_url(product_id):
+    """Product page URL scraped for ``product_id`` (see fetch_product_page_conditional)."""
+    return f"https://vi.aliexpress.com/item/{product_id}.html"
@@ -1,22 +1,60 @@
 
+import sys
+
+if __name__ == "__main__":
+    # ``python app.py``: run the bot from the importable ``app`` module instead of this copy.
+    # Processes started with spawn (parse pool, bot workers) re-run the parent's main script
+    # before their job; a main module without a file leaves them to import what the job needs.
+    import types
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    import app
+    app.main()
+    sys.exit()
+
 import logging
 import os
 import re
 import json
 import asyncio
 import time
+import tempfile
+import hashlib
+import contextlib
+import html
 from datetime import datetime, timedelta
-from urllib.parse import urlparse, urlunparse, urlencode
-from concurrent.futures import ThreadPoolExecutor
-import aiohttp
+from typing import NamedTuple, TYPE_CHECKING
+from urllib.parse import urlparse, urlunparse, urlencode, unquote
 from dotenv import load_dotenv
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, JobQueue
-from telegram.constants import ParseMode, ChatAction
+from telegram import (
+    Update, User, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultArticle, InlineQueryResultPhoto, InputTextMessageContent, InputMediaPhoto,
+)
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, InlineQueryHandler, ChosenInlineResultHandler, CallbackQueryHandler,
+    filters, ContextTypes, JobQueue,
+)
+from telegram.constants import ParseMode, ChatAction, MediaGroupLimit, MessageLimit
+from telegram.error import Forbidden
 
 import iop
-from aliexpress_utils import get_product_details_by_id
+from log_pipeline import setup_logging, sampled_logger
+from cache import CacheWithExpiry, PrefixCodec, RecordCodec, SharedCacheStore
+from batching import MicroBatcher
+from admission import AdmissionController, MODE_NORMAL, MODE_DEGRADED, MODE_SHED
+from pools import io_pool, parse_pool, shutdown_pools
+from bulk import BulkStats, iter_file_lines, iter_text_lines, run_bulk_job
+from broadcast import BroadcastStore, TokenBucket, run_broadcast, STATUS_CANCELLED
+from price_history import PriceHistoryStore, parse_price
+from storage import Database, db
+from user_settings import UserSettingsStore
+from supervisor import PRIMARY_WORKER, Supervisor, serve_worker
+from update_processor import ChatOrderedUpdateProcessor
+import deadline
+
+if TYPE_CHECKING:
+    # Imported on first use (get_http_session) to keep cold starts fast.
+    import aiohttp
 
 load_dotenv()
 
@@ -27,17 +65,82 @@ TARGET_CURRENCY = os.getenv('TARGET_CURRENCY', '')
 TARGET_LANGUAGE = os.getenv('TARGET_LANGUAGE', 'en')
 QUERY_COUNTRY = os.getenv('QUERY_COUNTRY', 'US')
 ALIEXPRESS_TRACKING_ID = os.getenv('ALIEXPRESS_TRACKING_ID', 'default')
-ALIEXPRESS_API_URL = 'https://api-sg.aliexpress.com/sync'
+ALIEXPRESS_API_URL = os.getenv('ALIEXPRESS_API_URL', 'https://api-sg.aliexpress.com/sync')
 QUERY_FIELDS = 'product_main_image_url,target_sale_price,product_title,target_sale_price_currency'
 CACHE_EXPIRY_DAYS = 1
 CACHE_EXPIRY_SECONDS = CACHE_EXPIRY_DAYS * 24 * 60 * 60
-MAX_WORKERS = 10
-
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+PRODUCT_DETAIL_BATCH_SIZE = 20
+# link.generate limits: URLs per call and total length of the comma-joined source_values.
+LINK_GENERATE_BATCH_SIZE = 50
+LINK_GENERATE_MAX_CHARS = 12000
+# How long a product-detail miss waits for others with the same locale before the API call.
+PRODUCT_DETAIL_BATCH_DELAY = float(os.getenv('PRODUCT_DETAIL_BATCH_DELAY', '0.01'))
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', '4'))
+BULK_MAX_LINKS = int(os.getenv('BULK_MAX_LINKS', '20000'))
+BULK_MAX_FILE_BYTES = 20 * 1024 * 1024  # Bot API download limit
+BULK_PROGRESS_INTERVAL = 5.0
+INLINE_FILL_BUDGET = float(os.getenv('INLINE_FILL_BUDGET', '8'))
+# Typing/sticker are only shown when a reply takes longer than this.
+LOADING_INDICATOR_DELAY = float(os.getenv('LOADING_INDICATOR_DELAY', '1.0'))
+# Repeated link sets: ignored in the same chat, replies reused across chats.
+DEDUP_CHAT_WINDOW = float(os.getenv('DEDUP_CHAT_WINDOW', '60'))
+DEDUP_GLOBAL_WINDOW = float(os.getenv('DEDUP_GLOBAL_WINDOW', '300'))
+TYPING_REFRESH_SECONDS = 4.5  # a chat action is displayed for about 5 seconds
+LOADING_STICKER_ID = "CAACAgIAAxkBAAIU1GYOk5jWvCvtykd7TZkeiFFZRdUYAAIjAAMoD2oUJ1El54wgpAY0BA"
+# Telegram user IDs allowed to run /broadcast (comma or space separated).
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').replace(',', ' ').split()}
+# Telegram allows about 30 messages per second to different chats; stay below it.
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '8'))
+BROADCAST_CHANNEL = os.getenv('BROADCAST_CHANNEL', '')
+# /watch: refresh period, default alert (fraction below the price when watched) and per-user limit.
+WATCH_REFRESH_INTERVAL = float(os.getenv('WATCH_REFRESH_INTERVAL', '21600'))
+WATCH_DEFAULT_DROP = float(os.getenv('WATCH_DEFAULT_DROP', '0.05'))
+WATCH_MAX_PER_CHAT = int(os.getenv('WATCH_MAX_PER_CHAT', '50'))
+WATCH_REFRESH_CONCURRENCY = 4
+# /search: products per message, per product.query call (the unit that is cached) and cache lifetime.
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '5'))
+SEARCH_API_PAGE_SIZE = 20
+SEARCH_MAX_PAGES = 20
+SEARCH_CACHE_SECONDS = int(os.getenv('SEARCH_CACHE_SECONDS', '3600'))
+SEARCH_FIELDS = 'product_id,product_title,target_sale_price,target_sale_price_currency,promotion_link'
+
+# Latency budget per link message, shared by every stage (short links, API, scraping, sending);
+# the last UPDATE_SEND_RESERVE seconds are kept for sending whatever is ready by then.
+UPDATE_BUDGET = float(os.getenv('UPDATE_BUDGET', '20'))
+UPDATE_SEND_RESERVE = 4.0
+# Per-stage caps, further limited by what is left of the budget.
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', '10'))
+SHORT_LINK_TIMEOUT = 5
+SHORT_LINK_REFETCH_TIMEOUT = 10
+SCRAPE_TIMEOUT = 15
+SCRAPE_MIN_BUDGET = 2.0
+
+# Updates processed at the same time (per process); a chat's own updates still run one by one.
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '64'))
+# Overload thresholds on the updates pending in this process (running or queued, from arrival):
+# by default degrade once every slot is busy and shed once four updates wait per slot.
+ADMISSION_DEGRADE_IN_FLIGHT = int(os.getenv('ADMISSION_DEGRADE_IN_FLIGHT', str(UPDATE_CONCURRENCY)))
+ADMISSION_SHED_IN_FLIGHT = int(os.getenv('ADMISSION_SHED_IN_FLIGHT', str(UPDATE_CONCURRENCY * 4)))
+ADMISSION_DEGRADE_AGE = float(os.getenv('ADMISSION_DEGRADE_AGE', '5'))
+ADMISSION_SHED_AGE = float(os.getenv('ADMISSION_SHED_AGE', '15'))
+# Worker processes (see supervisor.py); above 1 the product, link and short-link caches
+# also go through a SQLite file shared by the workers.
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH') or (os.path.join('cache', 'shared.db') if BOT_WORKERS > 1 else '')
+# /locale choices are read from the bot database through a local cache. With several workers it is
+# kept short: a change made through one worker reaches the others once their cached copy expires.
+USER_LOCALE_CACHE_SECONDS = 3600 if BOT_WORKERS == 1 else 30
+
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '20'))
+
+setup_logging(
+    level=logging.INFO,
+    fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Per-request / per-cache-hit messages: only one in LOG_SAMPLE_EVERY is emitted.
+hot_logger = sampled_logger(f"{__name__}.hot", LOG_SAMPLE_EVERY)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -50,21 +153,10 @@ try:
     aliexpress_client = iop.IopClient(ALIEXPRESS_API_URL, ALIEXPRESS_APP_KEY, ALIEXPRESS_APP_SECRET)
     logger.info("AliExpress API client initialized.")
 except Exception as e:
-    logger.exception(f"Error initializing AliExpress API client: {e}")
+    logger.exception("Error initializing AliExpress API client: %s", e)
     exit()
 
 
-
-executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
-
-
-import re
-
-URL_REGEX = re.compile(
-    r'https?://[^\s<>"]+|www\.[^\s<>"]+|\b(?:s\.click\.|a\.)?aliexpress\.(?:com|ru|es|fr|pt|it|pl|nl|co\.kr|co\.jp|com\.br|com\.tr|com\.vn|us|id|th|ar)(?:\.[\w-]+)?/[^\s<>"]*',
-    re.IGNORECASE
-)
-
 PRODUCT_ID_REGEX = re.compile(
     r'(?:/item/(\d+)\.html|[\?&]productIds=(\d+)|/ssr/\d+/(?:\w+/)?(\d+))',
     re.IGNORECASE
@@ -75,45 +167,51 @@ STANDARD_ALIEXPRESS_DOMAIN_REGEX = re.compile(
     re.IGNORECASE
 )
 
-SHORT_LINK_DOMAIN_REGEX = re.compile(
-    r'https?://(?:s\.click\.aliexpress\.com/e/|a\.aliexpress\.com/_)[\w-]+/?',
-    re.IGNORECASE
-)
-
-COMBINED_DOMAIN_REGEX = re.compile(
-    r'(?:https?://)?(?:www\.)?(?:'
-    r'a\.aliexpress\.com/[\w-]+|'  # liens courts
-    r's\.click\.aliexpress\.com/[\w-]+|'  # liens d'affiliation
-    r'(?:[\w-]+\.)?aliexpress\.(?:com|ru|es|fr|pt|it|pl|nl|co\.kr|co\.jp|com\.br|com\.tr|com\.vn|us|id|th|ar)/(?:item|store|p/coin-index/index\.html|promo|bundle|brand|category|superdeals|flashdeals|hot|ssr)[^\s<>"]*'
+# Single-pass scanner used by the update dispatcher: every AliExpress link in a
+# message is found and classified in one regex pass over the text.
+LINK_SCAN_REGEX = re.compile(
+    r'(?<![\w.@/-])(?:https?://)?(?:'
+    r'(?P<short>(?:s\.click\.aliexpress\.com/e/|a\.aliexpress\.com/_)[\w-]+/?)|'
+    r'(?P<standard>(?:[\w-]+\.)?aliexpress\.(?:com|ru|es|fr|pt|it|pl|nl|co\.kr|co\.jp|com\.br|com\.tr|com\.vn|us|id|th|ar)(?:\.[\w-]+)?/[^\s<>"]*)'
     r')',
     re.IGNORECASE
 )
 
-COIN_LINK_REGEX = re.compile(
-    r'https?://(?:m|www)\.aliexpress\.com/p/coin-index/index\.html\?(?:[^&]*&)*productIds=(\d+)',
-    re.IGNORECASE
-)
+LINK_KIND_SHORT = "short"
+LINK_KIND_PRODUCT = "product"
+LINK_KIND_PAGE = "page"
 
-SSR_LINK_REGEX = re.compile(
-    r'https?://(?:www\.)?aliexpress\.com/ssr/\d+/(?:\w+/)?(?:\?|&)?[^\s<>"]*',
-    re.IGNORECASE
-)
 
-SPECIAL_PAGE_LINK_REGEX = re.compile(
-    r'https?://(?:m|www)\.aliexpress\.com/(?:promo|p/coin-index|bundle|brand|category|superdeals|flashdeals|hot|ssr)/[^\s<>"]*',
-    re.IGNORECASE
-)
+class LinkRecord(NamedTuple):
+    kind: str
+    url: str
+    product_id: str | None
 
-ALL_PRODUCT_LINKS_REGEX = re.compile(
-    r'(https?://(?:[\w-]+\.)?aliexpress\.(?:com|ru|es|fr|pt|it|pl|nl|co\.kr|co\.jp|com\.br|com\.tr|com\.vn|us|id|th|ar)/('
-    r'item/\d+\.html|'
-    r'p/coin-index/index\.html\?.*productIds=\d+|'
-    r'[\w-]+-\d+\.html|'
-    r'[^\s"/]*?/item-[\w-]+\.html|'
-    r'ssr/\d+/\w+)'
-    r')',
-    re.IGNORECASE
-)
+
+class Locale(NamedTuple):
+    currency: str
+    language: str
+    country: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.currency}|{self.language}|{self.country}"
+
+
+DEFAULT_LOCALE = Locale(TARGET_CURRENCY, TARGET_LANGUAGE, QUERY_COUNTRY)
+LOCALE_ARG_PATTERNS = (re.compile(r'^[A-Z]{3}$'), re.compile(r'^[A-Z]{2}$'), re.compile(r'^[A-Z]{2}$'))
+
+
+async def get_user_locale(user: User | None) -> Locale:
+    """The user's /locale settings (DEFAULT_LOCALE if none), from the bot database shared by all workers."""
+    if user is None:
+        return DEFAULT_LOCALE
+    locale = await user_locales.get(user.id)
+    if locale is None:
+        stored = await io_pool.run(user_settings.get_locale, user.id)
+        locale = Locale(*stored) if stored else DEFAULT_LOCALE
+        await user_locales.set(user.id, locale)
+    return locale
 
 OFFER_PARAMS = {
     "coin": {
@@ -137,95 +235,196 @@ OFFER_PARAMS = {
 }
 
 OFFER_ORDER = ["coin", "bundle"]
-class CacheWithExpiry:
-    def __init__(self, expiry_seconds):
-        self.cache = {}
-        self.expiry_seconds = expiry_seconds
-        self._lock = asyncio.Lock()
-
-    async def get(self, key):
-        async with self._lock:
-            if key in self.cache:
-                item, timestamp = self.cache[key]
-                if time.time() - timestamp < self.expiry_seconds:
-                    logger.debug(f"Cache hit for key: {key}")
-                    return item
-                else:
-                    logger.debug(f"Cache expired for key: {key}")
-                    del self.cache[key]
-            logger.debug(f"Cache miss for key: {key}")
-            return None
 
-    async def set(self, key, value):
-        async with self._lock:
-            self.cache[key] = (value, time.time())
-            logger.debug(f"Cached value for key: {key}")
-
-    async def clear_expired(self):
-        async with self._lock:
-            current_time = time.time()
-            expired_keys = [k for k, (_, t) in self.cache.items()
-                            if current_time - t >= self.expiry_seconds]
-            count = 0
-            for key in expired_keys:
-                try:
-                    del self.cache[key]
-                    count += 1
-                except KeyError:
-                    pass
-            return count
-
-product_cache = CacheWithExpiry(CACHE_EXPIRY_SECONDS)
-link_cache = CacheWithExpiry(CACHE_EXPIRY_SECONDS)
-resolved_url_cache = CacheWithExpiry(CACHE_EXPIRY_SECONDS)
-
-async def resolve_short_link(short_url: str, session: aiohttp.ClientSession) -> str | None:
-    cached_final_url = await resolved_url_cache.get(short_url)
+BUSY_REPLY_TEXT = "⏳ The bot is very busy right now. Please send your link again in a minute."
+REPEATED_LINKS_TEXT = "☝️ These links were already answered above."
+# Shared link-reply builds, most complete first: a request may join a build of its own mode or a more complete one.
+SHARED_BUILD_MODES = (MODE_NORMAL, MODE_DEGRADED, MODE_SHED)
+
+SHARE_URL_PREFIX = "https://star.aliexpress.com/share/share.htm?platform=AE&businessType=ProductDetail&redirectUrl="
+SHORT_LINK_PREFIXES = [
+    "https://s.click.aliexpress.com/e/", "http://s.click.aliexpress.com/e/",
+    "https://a.aliexpress.com/", "http://a.aliexpress.com/",
+]
+PRODUCT_URL_PREFIXES = [
+    "https://www.aliexpress.com/item/", "https://aliexpress.com/item/", "https://vi.aliexpress.com/item/",
+    "https://m.aliexpress.com/item/", "http://www.aliexpress.com/item/",
+]
+IMAGE_URL_PREFIXES = [f"https://ae{n:02d}.alicdn.com/kf/" for n in range(1, 5)] + ["https://ae-pic-a1.aliexpress-media.com/kf/"]
+
+# Title, price and currency depend on the locale and are keyed by product_cache_key(id, locale);
+# images do not, so they are stored once per product and shared by every locale.
+# Entries are stored compactly: integer product keys, records as single bytes objects
+# instead of dicts and URLs split into a shared prefix and their own suffix.
+# With several workers, entries are also written to (and looked up in) the shared cache file.
+shared_cache = SharedCacheStore(Database(SHARED_CACHE_PATH)) if SHARED_CACHE_PATH else None
+
+
+def _shared_product_key(key: int | str) -> int | str:
+    # Locale IDs are numbered per process: other workers need the locale itself.
+    if isinstance(key, str):
+        return key
+    product_id, locale_id = divmod(key, LOCALE_KEY_SLOTS)
+    return f"{product_id}|{_locale_keys[locale_id]}"
+
+
+product_cache = CacheWithExpiry(CACHE_EXPIRY_SECONDS, value_codec=RecordCodec(('price', 'currency', 'title')),
+                                shared=shared_cache, namespace="product", shared_key=_shared_product_key)
+product_image_cache = CacheWithExpiry(CACHE_EXPIRY_SECONDS, value_codec=PrefixCodec(IMAGE_URL_PREFIXES),
+                                      shared=shared_cache, namespace="product_image")
+link_cache = CacheWithExpiry(
+    CACHE_EXPIRY_SECONDS,
+    key_codec=PrefixCodec([SHARE_URL_PREFIX + prefix for prefix in ("https://aliexpress.com/item/", "https://www.aliexpress.com/item/")] + [SHARE_URL_PREFIX]),
+    value_codec=PrefixCodec(SHORT_LINK_PREFIXES),
+    shared=shared_cache, namespace="link",
+)
+resolved_url_cache = CacheWithExpiry(CACHE_EXPIRY_SECONDS, key_codec=PrefixCodec(SHORT_LINK_PREFIXES), value_codec=PrefixCodec(PRODUCT_URL_PREFIXES),
+                                     shared=shared_cache, namespace="resolved_url")
+# Update-level dedup: "<chat_id>|<link set key>" -> True, and link set key -> LinkReplies.
+recent_chat_requests = CacheWithExpiry(DEDUP_CHAT_WINDOW)
+recent_link_replies = CacheWithExpiry(DEDUP_GLOBAL_WINDOW)
+link_replies_in_flight: dict[tuple[str, str], asyncio.Future] = {}
+_dedup_pruned_at = time.monotonic()
+LOCALE_KEY_SLOTS = 1 << 12
+_locale_ids: dict[Locale, int] = {}
+_locale_keys: list[str] = []
+bulk_jobs_in_progress: set[int] = set()
+# Runs updates of different chats concurrently and those of one chat in order; records queue wait.
+update_processor = ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY)
+# Decides per update whether it gets a full, degraded (cache-only details, no image) or shed reply.
+admission = AdmissionController(ADMISSION_DEGRADE_IN_FLIGHT, ADMISSION_SHED_IN_FLIGHT, ADMISSION_DEGRADE_AGE, ADMISSION_SHED_AGE,
+                                backlog=update_processor)
+# Background fills started for inline queries that missed the cache, by (locale, result key).
+inline_fills: dict[tuple[Locale, str], asyncio.Task] = {}
+# Subscribers (everyone who sent /start) and broadcast checkpoints, in the bot database.
+broadcast_store = BroadcastStore(db)
+# Paces every bulk send (broadcasts and price alerts) together, as they count against one bot-wide limit.
+bulk_send_bucket = TokenBucket(BROADCAST_RATE)
+# The running broadcast, if any: one at a time, since they share Telegram's rate limit.
+broadcast_job: tuple[int, asyncio.Task] | None = None
+# /watch lists and the price series of watched products.
+price_history = PriceHistoryStore(db)
+# /locale choices by user ID, in the bot database, and the cache get_user_locale reads them through.
+user_settings = UserSettingsStore(db)
+user_locales = CacheWithExpiry(USER_LOCALE_CACHE_SECONDS)
+# product.query results by "<locale>|<normalised query>|<API page>", the query behind each
+# search message's buttons by its short ID, and pages being fetched (user or prefetch).
+search_cache = CacheWithExpiry(SEARCH_CACHE_SECONDS)
+search_queries = CacheWithExpiry(SEARCH_CACHE_SECONDS)
+search_pages_in_flight: dict[str, asyncio.Future] = {}
+
+# Fire-and-forget tasks (warm-up, prefetches, broadcasts): the event loop only keeps weak references.
+background_tasks: set[asyncio.Task] = set()
+
+# Shared across updates so short-link resolution reuses pooled connections.
+http_session: 'aiohttp.ClientSession | None' = None
+
+async def get_http_session() -> 'aiohttp.ClientSession':
+    global http_session
+    if http_session is None or http_session.closed:
+        import aiohttp
+        http_session = aiohttp.ClientSession()
+    return http_session
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed", task.get_name(), exc_info=task.exception())
+
+def start_background_task(coro) -> asyncio.Task:
+    """Run ``coro`` without awaiting it: the task is kept alive until it finishes and its error is logged."""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+def _warm_lazy_imports() -> None:
+    import aiohttp  # noqa: F401
+    import requests  # noqa: F401
+    import aliexpress_utils  # noqa: F401
+
+async def warm_up(application: Application) -> None:
+    # Runs once polling is about to start: pull in the lazily imported HTTP and
+    # scraper modules on a worker thread instead of on the first user request.
+    start_background_task(io_pool.run(_warm_lazy_imports))
+
+async def close_http_session(application: Application) -> None:
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+
+def product_cache_key(product_id: str, locale: Locale | None = None) -> int | str:
+    # Integers are far smaller than "<id>|<locale>" strings: the locale takes the low bits.
+    if not product_id.isdigit():
+        return product_id if locale is None else f"{product_id}|{locale.key}"
+    if locale is None:
+        return int(product_id)
+    locale_id = _locale_ids.get(locale)
+    if locale_id is None:
+        locale_id = _locale_ids[locale] = len(_locale_ids)
+        _locale_keys.append(locale.key)
+    if locale_id >= LOCALE_KEY_SLOTS:
+        return f"{product_id}|{locale.key}"
+    return int(product_id) * LOCALE_KEY_SLOTS + locale_id
+
+async def get_cached_short_link(short_url: str, country: str = QUERY_COUNTRY) -> str | None:
+    return await resolved_url_cache.get(f"{short_url}|{country}")
+
+async def resolve_short_link(short_url: str, session: 'aiohttp.ClientSession', country: str = QUERY_COUNTRY) -> str | None:
+    import aiohttp
+
+    # The final URL carries the ship-to country, so resolutions are cached per country.
+    cache_key = f"{short_url}|{country}"
+    cached_final_url = await get_cached_short_link(short_url, country)
     if cached_final_url:
-        logger.info(f"Cache hit for resolved short link: {short_url} -> {cached_final_url}")
+        hot_logger.info("Cache hit for resolved short link: %s -> %s", short_url, cached_final_url)
         return cached_final_url
 
-    logger.info(f"Resolving short link: {short_url}")
+    timeout = deadline.timeout_for(SHORT_LINK_TIMEOUT)
+    if timeout <= 0:
+        hot_logger.info("No time left in the update budget to resolve %s", short_url)
+        return None
+
+    hot_logger.info("Resolving short link: %s", short_url)
     try:
-        async with session.get(short_url, allow_redirects=True, timeout=5) as response:
+        async with session.get(short_url, allow_redirects=True, timeout=timeout) as response:
             if response.status == 200 and response.url:
                 final_url = str(response.url)
-                logger.info(f"Resolved {short_url} to {final_url}")
+                hot_logger.info("Resolved %s to %s", short_url, final_url)
 
                 if '.aliexpress.us' in final_url:
                     final_url = final_url.replace('.aliexpress.us', '.aliexpress.com')
-                    logger.info(f"Converted US domain URL: {final_url}")
+                    logger.info("Converted US domain URL: %s", final_url)
 
-                if '_randl_shipto=' in final_url:
-                    final_url = re.sub(r'_randl_shipto=[^&]+', f'_randl_shipto={QUERY_COUNTRY}', final_url)
-                    logger.info(f"Updated URL with correct country: {final_url}")
+                if '_randl_shipto=' in final_url and not deadline.expired():
+                    final_url = re.sub(r'_randl_shipto=[^&]+', f'_randl_shipto={country}', final_url)
+                    logger.info("Updated URL with correct country: %s", final_url)
                     try:
-                        logger.info(f"Re-fetching URL with updated country parameter: {final_url}")
-                        async with session.get(final_url, allow_redirects=True, timeout=10) as country_response:
+                        logger.info("Re-fetching URL with updated country parameter: %s", final_url)
+                        async with session.get(final_url, allow_redirects=True, timeout=deadline.timeout_for(SHORT_LINK_REFETCH_TIMEOUT)) as country_response:
                             if country_response.status == 200 and country_response.url:
                                 final_url = str(country_response.url)
-                                logger.info(f"Re-fetched URL with correct country: {final_url}")
+                                logger.info("Re-fetched URL with correct country: %s", final_url)
                     except Exception as e:
-                        logger.warning(f"Error re-fetching URL with updated country parameter: {e}")
+                        logger.warning("Error re-fetching URL with updated country parameter: %s", e)
 
                 product_id = extract_product_id(final_url)
                 if STANDARD_ALIEXPRESS_DOMAIN_REGEX.match(final_url) and product_id:
-                    await resolved_url_cache.set(short_url, final_url)
+                    await resolved_url_cache.set(cache_key, final_url)
                     return final_url
                 else:
-                    logger.warning(f"Resolved URL {final_url} doesn't look like a valid AliExpress product page.")
+                    logger.warning("Resolved URL %s doesn't look like a valid AliExpress product page.", final_url)
                     return None
             else:
-                logger.error(f"Failed to resolve short link {short_url}. Status: {response.status}")
+                logger.error("Failed to resolve short link %s. Status: %s", short_url, response.status)
                 return None
     except asyncio.TimeoutError:
-        logger.error(f"Timeout resolving short link: {short_url}")
+        logger.error("Timeout resolving short link: %s", short_url)
         return None
     except aiohttp.ClientError as e:
-        logger.error(f"HTTP ClientError resolving short link {short_url}: {e}")
+        logger.error("HTTP ClientError resolving short link %s: %s", short_url, e)
         return None
     except Exception as e:
-        logger.exception(f"Unexpected error resolving short link {short_url}: {e}")
+        logger.exception("Unexpected error resolving short link %s: %s", short_url, e)
         return None
 
 def extract_product_id(url: str) -> str | None:
@@ -234,21 +433,38 @@ def extract_product_id(url: str) -> str | None:
 
     match = PRODUCT_ID_REGEX.search(url)
     if match:
-        return match.group(1)
+        return match.group(1) or match.group(2) or match.group(3)
 
     alt_patterns = [r'/p/[^/]+/([0-9]+)\.html', r'product/([0-9]+)']
     for pattern in alt_patterns:
         alt_match = re.search(pattern, url)
         if alt_match:
             product_id = alt_match.group(1)
-            logger.info(f"Extracted product ID {product_id} using alternative pattern {pattern}")
+            logger.info("Extracted product ID %s using alternative pattern %s", product_id, pattern)
             return product_id
 
-    logger.warning(f"Could not extract product ID from URL: {url}")
+    logger.warning("Could not extract product ID from URL: %s", url)
     return None
 
-def extract_potential_aliexpress_urls(text: str) -> list[str]:
-    return URL_REGEX.findall(text)
+def classify_message_links(text: str) -> list[LinkRecord]:
+    records = []
+    seen_urls = set()
+    for match in LINK_SCAN_REGEX.finditer(text):
+        url = match.group(0)
+        if not url.lower().startswith(('http://', 'https://')):
+            url = f"https://{url}"
+        if url in seen_urls:
+            continue
+        seen_urls.add(url)
+
+        if match.group('short'):
+            records.append(LinkRecord(LINK_KIND_SHORT, url, None))
+            continue
+
+        product_id = extract_product_id(url)
+        kind = LINK_KIND_PRODUCT if product_id else LINK_KIND_PAGE
+        records.append(LinkRecord(kind, url, product_id))
+    return records
 
 def clean_aliexpress_url(url: str, product_id: str) -> str | None:
     try:
@@ -262,7 +478,7 @@ def clean_aliexpress_url(url: str, product_id: str) -> str | None:
         ))
         return base_url
     except ValueError:
-        logger.warning(f"Could not parse or reconstruct URL: {url}")
+        logger.warning("Could not parse or reconstruct URL: %s", url)
         return None
 
 def build_url_with_offer_params(base_url: str, params_to_add: dict) -> str | None:
@@ -292,46 +508,110 @@ def build_url_with_offer_params(base_url: str, params_to_add: dict) -> str | Non
         ))
         return f"https://star.aliexpress.com/share/share.htm?platform=AE&businessType=ProductDetail&redirectUrl={reconstructed_url}"
     except ValueError:
-        logger.error(f"Error building URL with params for base: {base_url}")
+        logger.error("Error building URL with params for base: %s", base_url)
         return base_url # Return original on error? Or None? Returning base for now.
 
 async def periodic_cache_cleanup(context: ContextTypes.DEFAULT_TYPE):
     try:
         product_expired = await product_cache.clear_expired()
+        product_expired += await product_image_cache.clear_expired()
         link_expired = await link_cache.clear_expired()
         resolved_expired = await resolved_url_cache.clear_expired()
-        logger.info(f"Cache cleanup: Removed {product_expired} product, {link_expired} link, {resolved_expired} resolved URL items.")
-        logger.info(f"Cache stats: {len(product_cache.cache)} products, {len(link_cache.cache)} links, {len(resolved_url_cache.cache)} resolved URLs in cache.")
+        await search_cache.clear_expired()
+        await search_queries.clear_expired()
+        await user_locales.clear_expired()
+        logger.info("Cache cleanup: Removed %s product, %s link, %s resolved URL items.", product_expired, link_expired, resolved_expired)
+        logger.info("Cache stats: %s products, %s links, %s resolved URLs in cache.", len(product_cache), len(link_cache), len(resolved_url_cache))
+        logger.info("Pool stats: io=%s parse=%s", io_pool.stats(), parse_pool.stats())
+        logger.info("Update processor: %s", update_processor.stats())
+        from aliexpress_utils import page_cache
+        logger.info("Scraped pages: %s cached (%.1f MB HTML), %s revalidated, %s downloaded.",
+                    len(page_cache), page_cache.html_bytes / 1e6, page_cache.revalidated, page_cache.downloaded)
     except Exception as e:
-        logger.error(f"Error in periodic cache cleanup job: {e}")
+        logger.error("Error in periodic cache cleanup job: %s", e)
+
+async def fetch_product_details_v2(product_id: str, locale: Locale = DEFAULT_LOCALE) -> dict | None:
+    results = await fetch_product_details_batch([product_id], locale)
+    return results.get(product_id)
+
+async def get_cached_product_details(product_id: str, locale: Locale = DEFAULT_LOCALE) -> dict | None:
+    product_info = await product_cache.get(product_cache_key(product_id, locale))
+    if not product_info:
+        return None
+    return dict(product_info, image_url=await product_image_cache.get(product_cache_key(product_id)))
+
+async def fetch_product_details_batch(product_ids: list[str], locale: Locale = DEFAULT_LOCALE) -> dict[str, dict | None]:
+    results = {}
+    uncached_ids = []
+    for product_id in dict.fromkeys(product_ids):
+        cached_data = await get_cached_product_details(product_id, locale)
+        if cached_data:
+            hot_logger.info("Cache hit for product ID: %s (%s)", product_id, locale.key)
+            results[product_id] = cached_data
+        else:
+            results[product_id] = None
+            uncached_ids.append(product_id)
+
+    if uncached_ids:
+        # Misses from concurrent updates with the same locale share productdetail.get calls.
+        results.update(await product_detail_batcher.load_many(locale, uncached_ids))
+    return results
+
+async def _fetch_details_for_locale(locale: Locale, product_ids: list[str]) -> dict[str, dict]:
+    products = await _fetch_product_detail_chunk(product_ids, locale)
+
+    results = {}
+    expiry_date = datetime.now() + timedelta(days=CACHE_EXPIRY_DAYS)
+    for product_data in products or []:
+        product_id = str(product_data.get('product_id', ''))
+        if product_id not in product_ids:
+            if len(product_ids) != 1:
+                logger.warning("Received details for unexpected product ID: %s", product_id)
+                continue
+            product_id = product_ids[0]
+        image_url = product_data.get('product_main_image_url')
+        product_info = {
+             'price': product_data.get('target_sale_price'), 
+            'currency': product_data.get('sale_price_currency', locale.currency),
+            'title': product_data.get('product_title', f'Product {product_id}')
+        }
+        await product_cache.set(product_cache_key(product_id, locale), product_info)
+        if image_url:
+            await product_image_cache.set(product_cache_key(product_id), image_url)
+        results[product_id] = dict(product_info, image_url=image_url)
+        hot_logger.info("Cached product %s (%s) until %s", product_id, locale.key, expiry_date.strftime('%Y-%m-%d %H:%M:%S'))
+
+    return results
 
-async def fetch_product_details_v2(product_id: str) -> dict | None:
-    cached_data = await product_cache.get(product_id)
-    if cached_data:
-        logger.info(f"Cache hit for product ID: {product_id}")
-        return cached_data
+product_detail_batcher = MicroBatcher(_fetch_details_for_locale, PRODUCT_DETAIL_BATCH_SIZE, PRODUCT_DETAIL_BATCH_DELAY)
 
-    logger.info(f"Fetching product details for ID: {product_id}")
+async def _fetch_product_detail_chunk(product_ids: list[str], locale: Locale = DEFAULT_LOCALE) -> list[dict] | None:
+    product_ids_str = ",".join(product_ids)
+    hot_logger.info("Fetching product details for ID: %s", product_ids_str)
+
+    timeout = deadline.timeout_for(API_TIMEOUT)
+    if timeout <= 0:
+        hot_logger.info("No time left in the update budget for productdetail.get")
+        return None
 
     def _execute_api_call():
         try:
             request = iop.IopRequest('aliexpress.affiliate.productdetail.get')
             request.add_api_param('fields', QUERY_FIELDS)
-            request.add_api_param('product_ids', product_id)
-            request.add_api_param('target_currency', TARGET_CURRENCY)
-            request.add_api_param('target_language', TARGET_LANGUAGE)
+            request.add_api_param('product_ids', product_ids_str)
+            request.add_api_param('target_currency', locale.currency)
+            request.add_api_param('target_language', locale.language)
             request.add_api_param('tracking_id', ALIEXPRESS_TRACKING_ID)
-            request.add_api_param('country', QUERY_COUNTRY)
-            return aliexpress_client.execute(request)
+            request.add_api_param('country', locale.country)
+            return aliexpress_client.execute(request, timeout=timeout)
         except Exception as e:
-            logger.error(f"Error in API call thread for product {product_id}: {e}")
+            logger.error("Error in API call thread for product %s: %s", product_ids_str, e)
             return None
 
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(executor, _execute_api_call)
+    response = await io_pool.run(_execute_api_call)
 
     if not response or not response.body:
-        logger.error(f"Product detail API call failed or returned empty body for ID: {product_id}")
+        logger.error("Product detail API call failed or returned empty body for ID: %s", product_ids_str)
         return None
 
     try:
@@ -340,53 +620,70 @@ async def fetch_product_details_v2(product_id: str) -> dict | None:
             try:
                 response_data = json.loads(response_data)
             except json.JSONDecodeError as json_err:
-                logger.error(f"Failed to decode JSON response for product {product_id}: {json_err}. Response: {response_data[:500]}")
+                logger.error("Failed to decode JSON response for product %s: %s. Response: %s", product_ids_str, json_err, response_data[:500])
                 return None
 
         if 'error_response' in response_data:
             error_details = response_data.get('error_response', {})
-            logger.error(f"API Error for Product ID {product_id}: Code={error_details.get('code', 'N/A')}, Msg={error_details.get('msg', 'Unknown API error')}")
+            logger.error("API Error for Product ID %s: Code=%s, Msg=%s", product_ids_str, error_details.get('code', 'N/A'), error_details.get('msg', 'Unknown API error'))
             return None
 
         detail_response = response_data.get('aliexpress_affiliate_productdetail_get_response')
         if not detail_response:
-            logger.error(f"Missing 'aliexpress_affiliate_productdetail_get_response' key for ID {product_id}. Response: {response_data}")
+            logger.error("Missing 'aliexpress_affiliate_productdetail_get_response' key for ID %s. Response: %s", product_ids_str, response_data)
             return None
 
         resp_result = detail_response.get('resp_result')
         if not resp_result:
-             logger.error(f"Missing 'resp_result' key for ID {product_id}. Response: {detail_response}")
+             logger.error("Missing 'resp_result' key for ID %s. Response: %s", product_ids_str, detail_response)
              return None
 
         resp_code = resp_result.get('resp_code')
         if resp_code != 200:
-             logger.error(f"API response code not 200 for ID {product_id}. Code: {resp_code}, Msg: {resp_result.get('resp_msg', 'Unknown')}")
+             logger.error("API response code not 200 for ID %s. Code: %s, Msg: %s", product_ids_str, resp_code, resp_result.get('resp_msg', 'Unknown'))
              return None
 
         result = resp_result.get('result', {})
         products = result.get('products', {}).get('product', [])
 
         if not products:
-            logger.warning(f"No products found in API response for ID {product_id}")
+            logger.warning("No products found in API response for ID %s", product_ids_str)
             return None
 
-        product_data = products[0]
-        product_info = {
-            'image_url': product_data.get('product_main_image_url'),
-             'price': product_data.get('target_sale_price'), 
-            'currency': product_data.get('sale_price_currency', TARGET_CURRENCY),
-            'title': product_data.get('product_title', f'Product {product_id}')
-        }
-
-        await product_cache.set(product_id, product_info)
-        expiry_date = datetime.now() + timedelta(days=CACHE_EXPIRY_DAYS)
-        logger.info(f"Cached product {product_id} until {expiry_date.strftime('%Y-%m-%d %H:%M:%S')}")
-        return product_info
+        return products
 
     except Exception as e:
-        logger.exception(f"Error parsing product details response for ID {product_id}: {e}")
+        logger.exception("Error parsing product details response for ID %s: %s", product_ids_str, e)
         return None
 
+def _share_url(url: str) -> str:
+    if "star.aliexpress.com/share/share.htm" not in url:
+        return SHARE_URL_PREFIX + url
+    return url
+
+def _normalize_url(url: str) -> str:
+    # The API may echo source_value re-encoded, without scheme or with another host case;
+    # forwarded messages may carry links the same way.
+    value = unquote(url.strip())
+    value = re.sub(r'^https?://', '', value, flags=re.IGNORECASE).rstrip('/')
+    host, sep, rest = value.partition('/')
+    return host.lower() + sep + rest
+
+def _chunk_source_values(urls: list[str]) -> list[list[str]]:
+    chunks = []
+    current = []
+    length = 0
+    for url in urls:
+        if current and (len(current) >= LINK_GENERATE_BATCH_SIZE or length + len(url) + 1 > LINK_GENERATE_MAX_CHARS):
+            chunks.append(current)
+            current = []
+            length = 0
+        current.append(url)
+        length += len(url) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
 async def generate_affiliate_links_batch(target_urls: list[str]) -> dict[str, str | None]:
     results_dict = {}
     uncached_urls = []
@@ -394,44 +691,84 @@ async def generate_affiliate_links_batch(target_urls: list[str]) -> dict[str, st
     for url in target_urls:
         cached_link = await link_cache.get(url)
         if cached_link:
-            logger.info(f"Cache hit for affiliate link: {url}")
+            hot_logger.info("Cache hit for affiliate link: %s", url)
             results_dict[url] = cached_link
         else:
-            logger.debug(f"Cache miss for affiliate link: {url}")
+            logger.debug("Cache miss for affiliate link: %s", url)
             results_dict[url] = None
             uncached_urls.append(url)
 
     if not uncached_urls:
-        logger.info("All affiliate links retrieved from cache.")
+        hot_logger.info("All affiliate links retrieved from cache.")
         return results_dict
 
-    logger.info(f"Generating affiliate links for {len(uncached_urls)} uncached URLs...")
+    hot_logger.info("Generating affiliate links for %s uncached URLs...", len(uncached_urls))
 
+    # Normalised source_value -> requested URL, for both the share URL we send and the
+    # product URL inside it, so each returned link is matched with one dict lookup.
+    source_index = {}
     prefixed_urls = []
+    for url in dict.fromkeys(uncached_urls):
+        prefixed_url = _share_url(url)
+        prefixed_urls.append(prefixed_url)
+        source_index[_normalize_url(prefixed_url)] = url
+        _, _, redirect_url = prefixed_url.partition("redirectUrl=")
+        if redirect_url:
+            source_index.setdefault(_normalize_url(redirect_url), url)
+
+    chunks = _chunk_source_values(prefixed_urls)
+    chunk_links = await asyncio.gather(*(_fetch_affiliate_link_chunk(chunk) for chunk in chunks))
+
+    expiry_date = datetime.now() + timedelta(days=CACHE_EXPIRY_DAYS)
+    for links_data in chunk_links:
+        for link_info in links_data or []:
+            if not isinstance(link_info, dict):
+                logger.warning("Promotion link data item is not a dictionary: %s", link_info)
+                continue
+            source_url = link_info.get('source_value')
+            promo_link = link_info.get('promotion_link')
+            if not source_url or not promo_link:
+                logger.warning("Missing 'source_value' or 'promotion_link' in batch response item: %s", link_info)
+                continue
+
+            original_target_url = source_index.get(_normalize_url(source_url))
+            if original_target_url is None:
+                logger.warning("Received link for unexpected or unmatchable source_value: %s", source_url)
+                continue
+            results_dict[original_target_url] = promo_link
+            await link_cache.set(original_target_url, promo_link)
+            logger.debug("Cached affiliate link for %s until %s", original_target_url, expiry_date.strftime('%Y-%m-%d %H:%M:%S'))
+
     for url in uncached_urls:
-        if "star.aliexpress.com/share/share.htm" not in url:
-            prefixed_urls.append(f"https://star.aliexpress.com/share/share.htm?platform=AE&businessType=ProductDetail&redirectUrl={url}")
-        else:
-            prefixed_urls.append(url)
+        if results_dict.get(url) is None:
+            logger.warning("No affiliate link returned or processed for requested URL: %s", url)
+
+    return results_dict
+
+async def _fetch_affiliate_link_chunk(prefixed_urls: list[str]) -> list | None:
     source_values_str = ",".join(prefixed_urls)
 
+    timeout = deadline.timeout_for(API_TIMEOUT)
+    if timeout <= 0:
+        hot_logger.info("No time left in the update budget for link.generate")
+        return None
+
     def _execute_batch_link_api():
         try:
             request = iop.IopRequest('aliexpress.affiliate.link.generate')
             request.add_api_param('promotion_link_type', '0')
             request.add_api_param('source_values', source_values_str)
             request.add_api_param('tracking_id', ALIEXPRESS_TRACKING_ID)
-            return aliexpress_client.execute(request)
+            return aliexpress_client.execute(request, timeout=timeout)
         except Exception as e:
-            logger.error(f"Error in batch link API call thread for URLs: {e}")
+            logger.error("Error in batch link API call thread for URLs: %s", e)
             return None
 
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(executor, _execute_batch_link_api)
+    response = await io_pool.run(_execute_batch_link_api)
 
     if not response or not response.body:
-        logger.error(f"Batch link generation API call failed or returned empty body for {len(uncached_urls)} URLs.")
-        return results_dict
+        logger.error("Batch link generation API call failed or returned empty body for %s URLs.", len(prefixed_urls))
+        return None
 
     try:
         response_data = response.body
@@ -439,82 +776,51 @@ async def generate_affiliate_links_batch(target_urls: list[str]) -> dict[str, st
             try:
                 response_data = json.loads(response_data)
             except json.JSONDecodeError as json_err:
-                logger.error(f"Failed to decode JSON response for batch link generation: {json_err}. Response: {response_data[:500]}")
-                return results_dict
+                logger.error("Failed to decode JSON response for batch link generation: %s. Response: %s", json_err, response_data[:500])
+                return None
 
         if 'error_response' in response_data:
             error_details = response_data.get('error_response', {})
-            logger.error(f"API Error for Batch Link Generation: Code={error_details.get('code', 'N/A')}, Msg={error_details.get('msg', 'Unknown')}")
-            return results_dict
+            logger.error("API Error for Batch Link Generation: Code=%s, Msg=%s", error_details.get('code', 'N/A'), error_details.get('msg', 'Unknown'))
+            return None
 
         generate_response = response_data.get('aliexpress_affiliate_link_generate_response')
         if not generate_response:
-            logger.error(f"Missing 'aliexpress_affiliate_link_generate_response' key. Response: {response_data}")
-            return results_dict
+            logger.error("Missing 'aliexpress_affiliate_link_generate_response' key. Response: %s", response_data)
+            return None
 
         resp_result_outer = generate_response.get('resp_result')
         if not resp_result_outer:
-            logger.error(f"Missing 'resp_result' key. Response: {generate_response}")
-            return results_dict
+            logger.error("Missing 'resp_result' key. Response: %s", generate_response)
+            return None
 
         resp_code = resp_result_outer.get('resp_code')
         if resp_code != 200:
-            logger.error(f"API response code not 200 for batch link generation. Code: {resp_code}, Msg: {resp_result_outer.get('resp_msg', 'Unknown')}")
-            return results_dict
+            logger.error("API response code not 200 for batch link generation. Code: %s, Msg: %s", resp_code, resp_result_outer.get('resp_msg', 'Unknown'))
+            return None
 
         result = resp_result_outer.get('result', {})
         if not result:
-            logger.error(f"Missing 'result' key. Response: {resp_result_outer}")
-            return results_dict
+            logger.error("Missing 'result' key. Response: %s", resp_result_outer)
+            return None
 
         links_data = result.get('promotion_links', {}).get('promotion_link', [])
         if not links_data or not isinstance(links_data, list):
-            logger.warning(f"No 'promotion_links' found or not a list. Response: {result}")
-            return results_dict
-
-        expiry_date = datetime.now() + timedelta(days=CACHE_EXPIRY_DAYS)
-        logger.info(f"Processing {len(links_data)} links from batch API response.")
-        for link_info in links_data:
-            if isinstance(link_info, dict):
-                source_url = link_info.get('source_value')
-                promo_link = link_info.get('promotion_link')
-
-                if source_url and promo_link:
-                    # Find the original uncached URL that corresponds to this source_value
-                    # This assumes the API returns source_value exactly as sent
-                    original_target_url = None
-                    for target in uncached_urls:
-                        # Check if the source_url (which has the star prefix) contains the original target url
-                        if f"redirectUrl={target}" in source_url or target == source_url:
-                             original_target_url = target
-                             break
-                        # Fallback check if the source_url itself matches an original target (less likely)
-                        elif source_url == target:
-                             original_target_url = target
-                             break
-
-                    if original_target_url and original_target_url in results_dict:
-                        results_dict[original_target_url] = promo_link
-                        await link_cache.set(original_target_url, promo_link)
-                        logger.debug(f"Cached affiliate link for {original_target_url} until {expiry_date.strftime('%Y-%m-%d %H:%M:%S')}")
-                    else:
-                        logger.warning(f"Received link for unexpected or unmatchable source_value: {source_url}")
-                else:
-                    logger.warning(f"Missing 'source_value' or 'promotion_link' in batch response item: {link_info}")
-            else:
-                logger.warning(f"Promotion link data item is not a dictionary: {link_info}")
-
-        for url in uncached_urls:
-            if results_dict.get(url) is None:
-                logger.warning(f"No affiliate link returned or processed for requested URL: {url}")
+            logger.warning("No 'promotion_links' found or not a list. Response: %s", result)
+            return None
 
-        return results_dict
+        hot_logger.info("Processing %s links from batch API response.", len(links_data))
+        return links_data
 
     except Exception as e:
-        logger.exception(f"Error parsing batch link generation response: {e}")
-        return results_dict
+        logger.exception("Error parsing batch link generation response: %s", e)
+        return None
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        await io_pool.run(broadcast_store.add_subscriber, update.effective_chat.id)
+    except Exception as e:
+        logger.error("Failed to subscribe chat %s: %s", update.effective_chat.id, e)
     await update.message.reply_html(
         "👋 Welcome to the AliExpress Discount Bot! 🛍️\n\n"
         "👋 مرحبًا بك في بوت خصومات علي إكسبريس! 🛍️\n\n"
@@ -531,32 +837,119 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "🚀 Send a link to start! 🎁"
           "🚀 أرسل رابطًا للبدء! 🎁"
     )
-async def _get_product_data(product_id: str) -> tuple[dict | None, str]:
-    product_details = await fetch_product_details_v2(product_id)
+
+async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await io_pool.run(broadcast_store.remove_subscribers, [update.effective_chat.id])
+    await update.message.reply_text("🔕 You won't receive deals from the bot anymore. Send /start to subscribe again.")
+
+async def locale_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+    current = await get_user_locale(update.effective_user)
+    args = [arg.upper() for arg in context.args or []]
+
+    if not args:
+        await update.message.reply_html(
+            f"🌍 <b>Your settings:</b> currency <b>{current.currency or 'default'}</b>, "
+            f"language <b>{current.language}</b>, country <b>{current.country}</b>\n\n"
+            "Change them with <code>/locale CURRENCY [LANGUAGE] [COUNTRY]</code>, "
+            "e.g. <code>/locale EUR FR FR</code>, or <code>/locale reset</code>."
+        )
+        return
+
+    if args[0] == "RESET":
+        await io_pool.run(user_settings.reset_locale, user_id)
+        current = DEFAULT_LOCALE
+    else:
+        if len(args) > 3 or not all(pattern.match(arg) for pattern, arg in zip(LOCALE_ARG_PATTERNS, args)):
+            await update.message.reply_text("❌ Usage: /locale CURRENCY [LANGUAGE] [COUNTRY], e.g. /locale EUR FR FR")
+            return
+        current = Locale(*args, *current[len(args):])
+        await io_pool.run(user_settings.set_locale, user_id, *current)
+    await user_locales.set(user_id, current)
+
+    logger.info("Locale for user %s set to %s", user_id, current.key)
+    await update.message.reply_text(
+        f"✅ Prices will be shown in {current.currency or 'the default currency'}, "
+        f"language {current.language}, shipping to {current.country}."
+    )
+async def _get_product_data(product_id: str, locale: Locale = DEFAULT_LOCALE, mode: str = MODE_NORMAL) -> tuple[dict | None, str]:
+    if mode != MODE_NORMAL:
+        # Under load: no API call and no scraping, only what is already cached.
+        product_details = await get_cached_product_details(product_id, locale)
+        if product_details:
+            return product_details, "API"
+        return {'title': f"Product {product_id}", 'image_url': None, 'price': None, 'currency': None}, "None"
+
+    # The lookup may be shared with other updates: stop waiting when our budget is spent.
+    product_details = await deadline.within(fetch_product_details_v2(product_id, locale))
     details_source = "None"
+    left = deadline.remaining()
 
     if product_details:
         details_source = "API"
-        logger.info(f"Successfully fetched details via API for product ID: {product_id}")
+        hot_logger.info("Successfully fetched details via API for product ID: %s", product_id)
         return product_details, details_source
+    elif left is not None and left < SCRAPE_MIN_BUDGET:
+        logger.warning("API failed for product ID: %s and no time is left to scrape.", product_id)
+        return {'title': f"Product {product_id}", 'image_url': None, 'price': None, 'currency': None}, details_source
     else:
-        logger.warning(f"API failed for product ID: {product_id}. Attempting scraping fallback.")
+        logger.warning("API failed for product ID: %s. Attempting scraping fallback.", product_id)
         try:
-            loop = asyncio.get_event_loop()
-            scraped_name, scraped_image = await loop.run_in_executor(
-                executor, get_product_details_by_id, product_id
-            )
-            if scraped_name:
+            from aliexpress_utils import product_page_url
+            scraped = await _scrape_product_page(product_page_url(product_id))
+            if scraped and scraped.get('title'):
                 details_source = "Scraped"
-                logger.info(f"Successfully scraped details for product ID: {product_id}")
-                return {'title': scraped_name, 'image_url': scraped_image, 'price': None, 'currency': None}, details_source
+                logger.info("Successfully scraped details for product ID: %s (price: %s)", product_id, scraped.get('price'))
+                return {
+                    'title': scraped['title'],
+                    'image_url': scraped.get('image_url'),
+                    'price': scraped.get('price'),
+                    'currency': scraped.get('currency'),
+                    'coin_discount': scraped.get('coin_discount'),
+                }, details_source
             else:
-                logger.warning(f"Scraping also failed for product ID: {product_id}")
+                logger.warning("Scraping also failed for product ID: %s", product_id)
                 return {'title': f"Product {product_id}", 'image_url': None, 'price': None, 'currency': None}, details_source
         except Exception as scrape_err:
-            logger.error(f"Error during scraping fallback for product ID {product_id}: {scrape_err}")
+            logger.error("Error during scraping fallback for product ID %s: %s", product_id, scrape_err)
             return {'title': f"Product {product_id}", 'image_url': None, 'price': None, 'currency': None}, details_source
 
+async def _scrape_product_page(url: str) -> dict | None:
+    from aliexpress_utils import (CachedPage, PAGE_PARSER_VERSION, fetch_product_page_conditional, page_cache,
+                                  parse_and_pack_page, reparse_cached_page)
+
+    cached = page_cache.get(url)
+    if cached is not None and cached.parser_version != PAGE_PARSER_VERSION and not cached.html_z:
+        # Outdated record and no HTML left to re-parse: a plain download is needed.
+        cached = None
+
+    # Download (or revalidate) on an I/O thread, parse the raw bytes in a worker process.
+    fetched = await io_pool.run(fetch_product_page_conditional, url, cached, deadline.timeout_for(SCRAPE_TIMEOUT))
+    if fetched.status == 304 and cached is not None:
+        page_cache.revalidated += 1
+        record = cached.record
+        if cached.parser_version != PAGE_PARSER_VERSION:
+            record = await deadline.within(parse_pool.run(reparse_cached_page, cached)) or record
+        page_cache.put(url, cached._replace(
+            record=record,
+            etag=fetched.etag or cached.etag,
+            last_modified=fetched.last_modified or cached.last_modified,
+            parser_version=PAGE_PARSER_VERSION,
+            fetched_at=time.time(),
+        ))
+        return record
+
+    if fetched.content is None:
+        # The page could not be downloaded: an older copy beats no details at all.
+        return cached.record if cached is not None else None
+
+    page_cache.downloaded += 1
+    record, html_z = await deadline.within(parse_pool.run(parse_and_pack_page, fetched.content, fetched.encoding), default=(None, b""))
+    if record and record.get('title'):
+        page_cache.put(url, CachedPage(record, fetched.etag, fetched.last_modified, html_z, fetched.encoding,
+                                       PAGE_PARSER_VERSION, time.time()))
+    return record
+
 async def _generate_offer_links(base_url: str) -> dict[str, str | None]:
     target_urls_map = {}
     urls_to_fetch = []
@@ -567,41 +960,60 @@ async def _generate_offer_links(base_url: str) -> dict[str, str | None]:
             target_urls_map[offer_key] = target_url
             urls_to_fetch.append(target_url)
         else:
-            logger.warning(f"Could not build target URL for offer {offer_key} with base {base_url}")
+            logger.warning("Could not build target URL for offer %s with base %s", offer_key, base_url)
 
     if not urls_to_fetch:
         return {}
 
-    all_links_dict = await generate_affiliate_links_batch(urls_to_fetch)
+    all_links_dict = await deadline.within(generate_affiliate_links_batch(urls_to_fetch), default={})
 
     generated_links = {}
     for offer_key, target_url in target_urls_map.items():
         promo_link = all_links_dict.get(target_url)
         generated_links[offer_key] = promo_link
         if not promo_link:
-            logger.warning(f"Failed to get affiliate link for offer {offer_key} (target: {target_url})")
+            logger.warning("Failed to get affiliate link for offer %s (target: %s)", offer_key, target_url)
 
     return generated_links
 
+async def _cached_offer_links(base_url: str) -> dict[str, str] | None:
+    # Cache-only variant of _generate_offer_links: None unless every offer link is cached.
+    generated_links = {}
+    for offer_key in OFFER_ORDER:
+        target_url = build_url_with_offer_params(base_url, OFFER_PARAMS[offer_key]["params"])
+        promo_link = await link_cache.get(target_url) if target_url else None
+        if not promo_link:
+            return None
+        generated_links[offer_key] = promo_link
+    return generated_links
+
 
 def _build_response_message(product_data: dict, generated_links: dict, details_source: str) -> str:
     message_lines = []
 
-    product_title = product_data.get('title', 'Unknown Product').split('\n')[0][:100]
-    decorated_title = f"✨⭐️ {product_title} ⭐️✨"
-    product_price = product_data.get('price')
-    product_currency = product_data.get('currency', '')
+    product_title = (product_data.get('title') or 'Unknown Product').split('\n')[0][:100]
+    decorated_title = f"✨⭐️ {html.escape(product_title)} ⭐️✨"
+    # Price, currency and coin text may be scraped from the product page; escape them for parse_mode=HTML.
+    product_price = html.escape(str(product_data.get('price') or ''))
+    product_currency = html.escape(product_data.get('currency') or '')
 
     message_lines.append(f"<b>{decorated_title}</b>")
 
     if details_source == "API" and product_price:
         price_str = f"{product_price} {product_currency}".strip()
         message_lines.append(f"\n💰 <b>Price $السعر بدون تخفيض:</b> {price_str}\n")
+    elif details_source == "Scraped" and product_price:
+        # Scraped prices are already formatted with their currency symbol, e.g. "US $12.34".
+        message_lines.append(f"\n💰 <b>Price $السعر بدون تخفيض:</b> {product_price}\n")
     elif details_source == "Scraped":
         message_lines.append("\n💰 <b>Price:</b> Unavailable (Scraped)\n")
     else:
         message_lines.append("\n❌ <b>Product details unavailable</b>\n")
 
+    coin_discount = product_data.get('coin_discount')
+    if coin_discount:
+        message_lines.append(f"🪙 {html.escape(coin_discount)}\n")
+
     coin_link = generated_links.get("coin")
     if coin_link:
         message_lines.append(f"▫️ 🪙 🎯 Coins – الرابط بالتخفيض ⬇️ : <b>{coin_link}</b>")
@@ -612,6 +1024,9 @@ def _build_response_message(product_data: dict, generated_links: dict, details_s
         message_lines.append(f"\n▫️ 📦 Bundle Deals – عروض مجمعة ⬇️ : <b>{bundle_link}</b>")
         message_lines.append("🔥 عروض مميزة عند شراء أكثر من قطعة!\n")
 
+    if not coin_link and not bundle_link:
+        message_lines.append("⚠️ The discount links could not be generated right now. Please send the link again in a moment.\n")
+
     product_id = product_data.get("product_id")
     if product_id:
         deep_link = f"aliexpress://product/{product_id}"
@@ -628,6 +1043,13 @@ def _build_response_message(product_data: dict, generated_links: dict, details_s
 
     return "\n".join(message_lines)
 
+def _send_timeouts() -> dict:
+    # Bot API timeouts from what is left of the update budget (library defaults outside one).
+    timeout = deadline.timeout_for(None, floor=1.0)
+    if timeout is None:
+        return {}
+    return {'read_timeout': timeout, 'write_timeout': timeout, 'connect_timeout': timeout, 'pool_timeout': timeout}
+
 def _build_reply_markup() -> InlineKeyboardMarkup:
     keyboard = [
         [
@@ -654,7 +1076,8 @@ async def _send_telegram_response(context: ContextTypes.DEFAULT_TYPE, chat_id: i
                 photo=product_image,
                 caption=message_text,
                 parse_mode=ParseMode.HTML,
-                reply_markup=reply_markup
+                reply_markup=reply_markup,
+                **_send_timeouts(),
             )
         else:
             await context.bot.send_message(
@@ -662,191 +1085,1162 @@ async def _send_telegram_response(context: ContextTypes.DEFAULT_TYPE, chat_id: i
                 text=message_text,
                 parse_mode=ParseMode.HTML,
                 disable_web_page_preview=True,
-                reply_markup=reply_markup
+                reply_markup=reply_markup,
+                **_send_timeouts(),
             )
     except Exception as send_error:
-        logger.error(f"Failed to send message for product {product_id} to chat {chat_id}: {send_error}")
+        logger.error("Failed to send message for product %s to chat %s: %s", product_id, chat_id, send_error)
         # Fallback message if sending fails
         try:
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=f"⚠️ Error displaying product {product_id}. Please try again or check the logs.",
-                reply_markup=reply_markup # Still provide buttons if possible
+                reply_markup=reply_markup, # Still provide buttons if possible
+                **_send_timeouts(),
             )
         except Exception as fallback_error:
-             logger.error(f"Failed to send fallback error message for product {product_id} to chat {chat_id}: {fallback_error}")
-
-
-async def process_product_telegram(product_id: str, base_url: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    logger.info(f"Processing Product ID: {product_id} for chat {chat_id}")
-
-    try:
-        product_data, details_source = await _get_product_data(product_id)
-        if not product_data:
-             # Should not happen with current _get_product_data logic, but handle defensively
-             logger.error(f"Failed to get any product data (API or Scraped) for {product_id}")
-             await context.bot.send_message(chat_id=chat_id, text=f"Could not retrieve data for product ID {product_id}.")
-             return
+             logger.error("Failed to send fallback error message for product %s to chat %s: %s", product_id, chat_id, fallback_error)
 
-        product_data['id'] = product_id # Add ID for logging in send function
 
-        generated_links = await _generate_offer_links(base_url)
-
-        response_text = _build_response_message(product_data, generated_links, details_source)
-        reply_markup = _build_reply_markup()
+async def _prepare_product_reply(product_id: str, base_url: str, locale: Locale = DEFAULT_LOCALE, mode: str = MODE_NORMAL) -> tuple[dict, str] | None:
+    """Product data and reply text for one product; None if it was shed (nothing cached to answer with)."""
+    if mode == MODE_SHED:
+        generated_links = await _cached_offer_links(base_url)
+        if not generated_links:
+            return None
 
-        await _send_telegram_response(context, chat_id, product_data, response_text, reply_markup)
+    if mode == MODE_SHED:
+        product_data, details_source = await _get_product_data(product_id, locale, mode)
+    else:
+        # Independent stages: run side by side so both get the whole remaining budget.
+        (product_data, details_source), generated_links = await asyncio.gather(
+            _get_product_data(product_id, locale, mode),
+            _generate_offer_links(base_url),
+        )
+    if not product_data:
+         # Should not happen with current _get_product_data logic, but handle defensively
+         logger.error("Failed to get any product data (API or Scraped) for %s", product_id)
+         return {'id': product_id, 'image_url': None}, f"Could not retrieve data for product ID {product_id}."
+
+    product_data['id'] = product_id # Add ID for logging in send function
+    if mode != MODE_NORMAL:
+        # Text replies are cheaper to send than photos.
+        product_data['image_url'] = None
+
+    return product_data, _build_response_message(product_data, generated_links, details_source)
+
+
+def _pack_texts(texts: list[str], limit: int = MessageLimit.MAX_TEXT_LENGTH) -> list[str]:
+    # Joins replies into as few messages as fit under Telegram's text limit.
+    messages = []
+    current = ""
+    for text in texts:
+        candidate = f"{current}\n\n{text}" if current else text
+        if current and len(candidate) > limit:
+            messages.append(current)
+            candidate = text
+        current = candidate
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def _send_album_replies(context: ContextTypes.DEFAULT_TYPE, chat_id: int, replies: list[tuple[dict, str]]) -> None:
+    photos = [(product_data, text) for product_data, text in replies if product_data.get('image_url')]
+    texts = [text for product_data, text in replies if not product_data.get('image_url')]
+    reply_markup = _build_reply_markup()
+
+    for i in range(0, len(photos), MediaGroupLimit.MAX_MEDIA_LENGTH):
+        group = photos[i:i + MediaGroupLimit.MAX_MEDIA_LENGTH]
+        if len(group) == 1:
+            # Albums need at least two items; a lone photo keeps its buttons.
+            product_data, text = group[0]
+            await _send_telegram_response(context, chat_id, product_data, text, reply_markup)
+            continue
+        try:
+            await context.bot.send_media_group(
+                chat_id=chat_id,
+                media=[InputMediaPhoto(media=product_data['image_url'], caption=text, parse_mode=ParseMode.HTML)
+                       for product_data, text in group],
+                **_send_timeouts(),
+            )
+        except Exception as e:
+            # One bad image fails the whole album; fall back to text for its items.
+            logger.warning("Failed to send album of %s products to chat %s: %s", len(group), chat_id, e)
+            texts.extend(text for _, text in group)
 
-    except Exception as e:
-        logger.exception(f"Unhandled error processing product {product_id} in chat {chat_id}: {e}")
+    # Products without images go out as combined text messages, with the buttons on the last one.
+    messages = _pack_texts(texts)
+    for index, text in enumerate(messages):
         try:
             await context.bot.send_message(
                 chat_id=chat_id,
-                text=f"An unexpected error occurred while processing product ID {product_id}. Sorry!"
+                text=text,
+                parse_mode=ParseMode.HTML,
+                disable_web_page_preview=True,
+                reply_markup=reply_markup if index == len(messages) - 1 else None,
+                **_send_timeouts(),
             )
-        except Exception:
-            logger.error(f"Failed to send error message for product {product_id} to chat {chat_id}")
+        except Exception as e:
+            logger.error("Failed to send combined product message to chat %s: %s", chat_id, e)
+
+
+async def _prepare_replies(products: list[tuple[str, str]], locale: Locale = DEFAULT_LOCALE, mode: str = MODE_NORMAL) -> tuple[list[tuple[dict, str]], bool]:
+    """Replies for (product_id, base_url) pairs; the flag is False if any product was shed."""
+    results = await asyncio.gather(
+        *(_prepare_product_reply(product_id, base_url, locale, mode) for product_id, base_url in products),
+        return_exceptions=True,
+    )
+
+    replies = []
+    all_answered = True
+    for (product_id, _), result in zip(products, results):
+        if isinstance(result, Exception):
+            logger.error("Unhandled error processing product %s: %s", product_id, result, exc_info=result)
+            replies.append(({'id': product_id, 'image_url': None}, f"An unexpected error occurred while processing product ID {product_id}. Sorry!"))
+        elif result is None:
+            all_answered = False
+        else:
+            replies.append(result)
+    return replies, all_answered
+
+
+async def _send_replies(context: ContextTypes.DEFAULT_TYPE, chat_id: int, replies: list[tuple[dict, str]]) -> None:
+    if len(replies) == 1:
+        product_data, text = replies[0]
+        await _send_telegram_response(context, chat_id, product_data, text, _build_reply_markup())
+    else:
+        # Several products: albums and one combined text message instead of a message each.
+        await _send_album_replies(context, chat_id, replies)
 
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, links: list[LinkRecord] | None = None) -> None:
     if not update.message or not update.message.text:
         return
 
     message_text = update.message.text
     user = update.effective_user
     chat_id = update.effective_chat.id
-    logger.info(f"Received message from {user.username or user.id} in chat {chat_id}")
+    hot_logger.info("Received message from %s in chat %s", user.username or user.id, chat_id)
 
-    potential_urls = extract_potential_aliexpress_urls(message_text)
-    if not potential_urls:
+    if links is None:
+        links = classify_message_links(message_text)
+    if not links:
         await context.bot.send_message(
             chat_id=chat_id,
             text="❌ No AliExpress links found. Please send a valid AliExpress product link."
         )
         return
 
-    logger.info(f"Found {len(potential_urls)} potential URLs in message from {user.username or user.id}")
+    hot_logger.info("Found %s AliExpress links in message from %s", len(links), user.username or user.id)
+
+    with admission.track(update_processor.arrived_at(update)) as mode, deadline.budget(UPDATE_BUDGET):
+        await _process_links(update, context, links, mode)
+
 
-    await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
-    loading_sticker_msg = None
+@contextlib.asynccontextmanager
+async def loading_indicator(bot, chat_id: int, with_sticker: bool = False):
+    """Show typing (and the loading sticker) only if the block runs longer than LOADING_INDICATOR_DELAY."""
+    sticker_task = None
+    stopped = False
+
+    async def _show() -> None:
+        nonlocal sticker_task
+        await asyncio.sleep(LOADING_INDICATOR_DELAY)
+        if with_sticker:
+            # Own task, so leaving the block never cancels a half-sent sticker we could not delete.
+            sticker_task = asyncio.ensure_future(bot.send_sticker(chat_id, LOADING_STICKER_ID))
+        while not stopped:
+            try:
+                await bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+            except Exception as action_err:
+                if stopped:
+                    # The HTTP stack can turn our cancel into a timeout error: do not loop on.
+                    return
+                logger.warning("Could not send typing action: %s", action_err)
+            await asyncio.sleep(TYPING_REFRESH_SECONDS)
+
+    show_task = asyncio.create_task(_show())
     try:
-        loading_sticker_msg = await context.bot.send_sticker(chat_id, "CAACAgIAAxkBAAIU1GYOk5jWvCvtykd7TZkeiFFZRdUYAAIjAAMoD2oUJ1El54wgpAY0BA")
-    except Exception as sticker_err:
-        logger.warning(f"Could not send loading sticker: {sticker_err}")
+        yield
+    finally:
+        stopped = True
+        show_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await show_task
+        if sticker_task is not None:
+            try:
+                loading_sticker_msg = await sticker_task
+                await bot.delete_message(chat_id, loading_sticker_msg.message_id)
+            except Exception as sticker_err:
+                logger.warning("Could not show or delete loading sticker: %s", sticker_err)
+
+
+class LinkReplies(NamedTuple):
+    replies: list[tuple[dict, str]]
+    all_answered: bool
+    # Built after its time budget ran out: details or links may be missing.
+    partial: bool = False
 
 
+def _link_set_key(links: list[LinkRecord], locale: Locale) -> str | None:
+    # Same product/short links in any order, with any tracking parameters, give the same key.
+    parts = sorted({f"p:{link.product_id}" if link.product_id else f"s:{_normalize_url(link.url)}"
+                    for link in links if link.kind != LINK_KIND_PAGE})
+    if not parts:
+        return None
+    return hashlib.sha1("\n".join([locale.key, *parts]).encode()).hexdigest()
+
+
+async def _prune_dedup_caches() -> None:
+    global _dedup_pruned_at
+    if time.monotonic() - _dedup_pruned_at >= DEDUP_GLOBAL_WINDOW:
+        _dedup_pruned_at = time.monotonic()
+        await recent_chat_requests.clear_expired()
+        await recent_link_replies.clear_expired()
+
+
+async def _process_links(update: Update, context: ContextTypes.DEFAULT_TYPE, links: list[LinkRecord], mode: str) -> None:
+    chat_id = update.effective_chat.id
+    locale = await get_user_locale(update.effective_user)
+    request_key = _link_set_key(links, locale)
+    chat_key = f"{chat_id}|{request_key}"
+    if request_key:
+        await _prune_dedup_caches()
+        if await recent_chat_requests.get(chat_key):
+            # Same links sent again into this chat: resend the replies built moments ago if they are
+            # still cached, otherwise point at the earlier answer.
+            hot_logger.info("Repeated links in chat %s", chat_id)
+            recent = await recent_link_replies.get(request_key)
+            if recent is not None:
+                await _deliver_link_replies(context, chat_id, recent)
+            else:
+                await context.bot.send_message(chat_id=chat_id, text=REPEATED_LINKS_TEXT, **_send_timeouts())
+            return
+        await recent_chat_requests.set(chat_key, True)
+
+    result = None
+    partial = False
+    # Shed replies come from cache or are a one-line "busy" answer: no indicator at all.
+    indicator = (contextlib.nullcontext() if mode == MODE_SHED
+                 else loading_indicator(context.bot, chat_id, with_sticker=mode == MODE_NORMAL and len(links) == 1))
+    try:
+        async with indicator:
+            with deadline.budget(_processing_budget()):
+                result = await _get_link_replies(links, locale, mode, request_key)
+                partial = result.partial or deadline.expired()
+            if partial:
+                hot_logger.info("Update budget spent in chat %s: sending what is ready", chat_id)
+            await _deliver_link_replies(context, chat_id, result)
+    finally:
+        if request_key and (result is None or partial or not result.replies or not result.all_answered):
+            # Nothing useful (or only a partial reply) was sent: let the user retry straight away.
+            await recent_chat_requests.delete(chat_key)
+
+
+def _processing_budget() -> float | None:
+    left = deadline.remaining()
+    return None if left is None else left - UPDATE_SEND_RESERVE
+
+
+async def _get_link_replies(links: list[LinkRecord], locale: Locale, mode: str, request_key: str | None) -> LinkReplies:
+    if request_key is None:
+        return await _build_link_replies(links, locale, mode)
+
+    recent = await recent_link_replies.get(request_key)
+    if recent is not None:
+        hot_logger.info("Reusing replies for a link set answered moments ago")
+        return recent
+
+    # An identical request from another chat is being processed in this mode or a more complete
+    # one: share its result. A degraded or shed build is never handed to a normal request.
+    joinable = SHARED_BUILD_MODES[:SHARED_BUILD_MODES.index(mode) + 1]
+    pending = next((link_replies_in_flight[request_key, shared_mode] for shared_mode in joinable
+                    if (request_key, shared_mode) in link_replies_in_flight), None)
+    if pending is None:
+        # Shared work: not bound by the budget of whichever chat started it.
+        pending = deadline.detached(_build_shared_link_replies(links, locale, mode, request_key))
+        flight_key = (request_key, mode)
+        link_replies_in_flight[flight_key] = pending
+        pending.add_done_callback(lambda _: link_replies_in_flight.pop(flight_key, None))
+    else:
+        hot_logger.info("Waiting for an identical request already in flight")
+    # Each chat waits only as long as its own budget allows; if that runs out it gets the "busy" answer.
+    return await deadline.within(asyncio.shield(pending), default=LinkReplies([], False, partial=True))
+
+
+async def _build_shared_link_replies(links: list[LinkRecord], locale: Locale, mode: str, request_key: str) -> LinkReplies:
+    with deadline.budget(UPDATE_BUDGET - UPDATE_SEND_RESERVE):
+        result = await _build_link_replies(links, locale, mode)
+        if deadline.expired():
+            result = result._replace(partial=True)
+    if mode == MODE_NORMAL and result.replies and result.all_answered and not result.partial:
+        # Partial replies (budget spent) are not worth sharing.
+        await recent_link_replies.set(request_key, result)
+    return result
+
+
+async def _build_link_replies(links: list[LinkRecord], locale: Locale, mode: str) -> LinkReplies:
     processed_product_ids = set()
-    tasks = []
-    async with aiohttp.ClientSession() as session:
-        for url in potential_urls:
-            original_url = url
-            product_id = None
-            base_url = None
-
-            if not url.startswith(('http://', 'https://')):
-                 if COMBINED_DOMAIN_REGEX.search(url): # Use combined regex here
-                    logger.debug(f"Prepending https:// to potential URL: {url}")
-                    url = f"https://{url}"
-                 else:
-                    logger.debug(f"Skipping potential URL without scheme or known AE domain: {original_url}")
-                    continue
-
-            if STANDARD_ALIEXPRESS_DOMAIN_REGEX.match(url):
-                product_id = extract_product_id(url)
+    products = []
+    session = await get_http_session()
+    for link in links:
+        product_id = None
+        base_url = None
+
+        if link.kind == LINK_KIND_PRODUCT:
+            product_id = link.product_id
+            base_url = clean_aliexpress_url(link.url, product_id)
+            logger.debug("Standard URL: %s -> ID: %s, Base: %s", link.url, product_id, base_url)
+
+        elif link.kind == LINK_KIND_SHORT:
+            logger.debug("Potential short link: %s", link.url)
+            if mode == MODE_SHED:
+                final_url = await get_cached_short_link(link.url, locale.country)
+            else:
+                final_url = await resolve_short_link(link.url, session, locale.country)
+            if final_url:
+                product_id = extract_product_id(final_url)
                 if product_id:
-                    base_url = clean_aliexpress_url(url, product_id)
-                    logger.debug(f"Standard URL: {url} -> ID: {product_id}, Base: {base_url}")
-
-            elif SHORT_LINK_DOMAIN_REGEX.match(url):
-                logger.debug(f"Potential short link: {url}")
-                final_url = await resolve_short_link(url, session)
-                if final_url:
-                    product_id = extract_product_id(final_url)
-                    if product_id:
-                        base_url = clean_aliexpress_url(final_url, product_id)
-                        logger.debug(f"Resolved short link: {url} -> {final_url} -> ID: {product_id}, Base: {base_url}")
-                else:
-                     logger.warning(f"Could not resolve or extract ID from short link: {original_url}")
+                    base_url = clean_aliexpress_url(final_url, product_id)
+                    logger.debug("Resolved short link: %s -> %s -> ID: %s, Base: %s", link.url, final_url, product_id, base_url)
+            else:
+                 logger.warning("Could not resolve or extract ID from short link: %s", link.url)
+
+        else:
+            logger.debug("Skipping AliExpress link without product ID: %s", link.url)
+
+        if product_id and base_url and product_id not in processed_product_ids:
+            processed_product_ids.add(product_id)
+            products.append((product_id, base_url))
+        elif product_id and product_id in processed_product_ids:
+             logger.debug("Skipping duplicate product ID: %s", product_id)
+
+    if not products:
+        # Short links that were not cached are not resolved while shedding.
+        shed_short_links = mode == MODE_SHED and any(link.kind == LINK_KIND_SHORT for link in links)
+        return LinkReplies([], not shed_short_links)
+
+    hot_logger.info("Processing %s unique AliExpress products", len(products))
+    replies, all_answered = await _prepare_replies(products, locale, mode)
+    return LinkReplies(replies, all_answered)
 
-            if product_id and base_url and product_id not in processed_product_ids:
-                processed_product_ids.add(product_id)
-                tasks.append(process_product_telegram(product_id, base_url, update, context))
-            elif product_id and product_id in processed_product_ids:
-                 logger.debug(f"Skipping duplicate product ID: {product_id}")
 
-    if not tasks:
-        logger.info(f"No processable AliExpress product links found after filtering/resolution.")
+async def _deliver_link_replies(context: ContextTypes.DEFAULT_TYPE, chat_id: int, result: LinkReplies) -> None:
+    if result.replies:
+        await _send_replies(context, chat_id, result.replies)
+    elif result.all_answered:
+        logger.info("No processable AliExpress product links found after filtering/resolution.")
         await context.bot.send_message(
             chat_id=chat_id,
-            text="❌ We couldn't find any valid AliExpress product links in your message."
+            text="❌ We couldn't find any valid AliExpress product links in your message.",
+            **_send_timeouts(),
         )
-    else:
-        if len(tasks) > 1:
-            await context.bot.send_message(
+    if not result.all_answered:
+        await context.bot.send_message(chat_id=chat_id, text=BUSY_REPLY_TEXT, **_send_timeouts())
+
+
+async def dispatch_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not update.message or not update.message.text:
+        return
+
+    links = classify_message_links(update.message.text)
+    if not links:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Please send an AliExpress product link to generate affiliate links."
+        )
+        return
+
+    await handle_message(update, context, links)
+
+
+
+async def _convert_bulk_batch(batch: list[tuple[int, LinkRecord]], locale: Locale = DEFAULT_LOCALE) -> list[list]:
+    session = await get_http_session()
+
+    async def _resolve(link: LinkRecord) -> tuple[str | None, str | None]:
+        if link.kind == LINK_KIND_PRODUCT:
+            return link.product_id, clean_aliexpress_url(link.url, link.product_id)
+        if link.kind == LINK_KIND_SHORT:
+            final_url = await resolve_short_link(link.url, session, locale.country)
+            product_id = extract_product_id(final_url) if final_url else None
+            if product_id:
+                return product_id, clean_aliexpress_url(final_url, product_id)
+        return None, None
+
+    resolved = await asyncio.gather(*(_resolve(link) for _, link in batch))
+
+    product_ids = [product_id for product_id, _ in resolved if product_id]
+    details = await fetch_product_details_batch(product_ids, locale) if product_ids else {}
+
+    # One link.generate call for every offer of every product in the batch.
+    offer_targets = {}
+    for product_id, base_url in resolved:
+        if product_id and base_url:
+            for offer_key in OFFER_ORDER:
+                offer_targets[(product_id, offer_key)] = build_url_with_offer_params(base_url, OFFER_PARAMS[offer_key]["params"])
+    target_urls = list(dict.fromkeys(url for url in offer_targets.values() if url))
+    affiliate_links = await generate_affiliate_links_batch(target_urls) if target_urls else {}
+
+    rows = []
+    for (line_number, link), (product_id, _) in zip(batch, resolved):
+        if not product_id:
+            rows.append([line_number, link.url, "", "", "", "", "", "", "no_product_id"])
+            continue
+        product = details.get(product_id) or {}
+        coin_link = affiliate_links.get(offer_targets.get((product_id, "coin"))) or ""
+        bundle_link = affiliate_links.get(offer_targets.get((product_id, "bundle"))) or ""
+        status = "ok" if coin_link or bundle_link else "link_failed"
+        rows.append([
+            line_number, link.url, product_id, product.get('title') or "", product.get('price') or "",
+            product.get('currency') or "", coin_link, bundle_link, status,
+        ])
+    return rows
+
+
+async def _run_bulk_job(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str | None = None, file_id: str | None = None,
+                        locale: Locale = DEFAULT_LOCALE) -> None:
+    if chat_id in bulk_jobs_in_progress:
+        await context.bot.send_message(chat_id=chat_id, text="⏳ A bulk conversion is already running for this chat. Please wait for it to finish.")
+        return
+    bulk_jobs_in_progress.add(chat_id)
+
+    status_message = None
+    try:
+        status_message = await context.bot.send_message(chat_id=chat_id, text="⏳ Bulk conversion started...")
+
+        async def _report_progress(stats: BulkStats) -> None:
+            await context.bot.edit_message_text(
                 chat_id=chat_id,
-                text=f"⏳ Processing {len(tasks)} AliExpress products. Please wait..."
+                message_id=status_message.message_id,
+                text=f"⏳ Bulk conversion: {stats.rows_written}/{stats.links_found} links processed "
+                     f"({stats.converted} converted, {stats.failed} failed)..."
             )
-        logger.info(f"Processing {len(tasks)} unique AliExpress products for chat {chat_id}")
-        await asyncio.gather(*tasks)
 
-    if loading_sticker_msg:
+        with tempfile.TemporaryDirectory(prefix="bulk-") as work_dir:
+            if file_id:
+                telegram_file = await context.bot.get_file(file_id)
+                input_path = await telegram_file.download_to_drive(os.path.join(work_dir, "input.txt"))
+                lines = iter_file_lines(str(input_path))
+            else:
+                lines = iter_text_lines(text or "")
+
+            output_path = os.path.join(work_dir, "affiliate_links.csv")
+            stats = await run_bulk_job(
+                lines,
+                classify_message_links,
+                lambda batch: _convert_bulk_batch(batch, locale),
+                output_path,
+                batch_size=PRODUCT_DETAIL_BATCH_SIZE,
+                concurrency=BULK_CONCURRENCY,
+                max_links=BULK_MAX_LINKS,
+                on_progress=_report_progress,
+                progress_interval=BULK_PROGRESS_INTERVAL,
+            )
+            logger.info("Bulk job for chat %s: %s links, %s converted, %s failed in %.1fs", chat_id, stats.links_found, stats.converted, stats.failed, stats.elapsed)
+
+            if not stats.links_found:
+                await context.bot.send_message(chat_id=chat_id, text="❌ No AliExpress links found in your list.")
+                return
+
+            summary = f"✅ {stats.converted}/{stats.links_found} links converted in {stats.elapsed:.0f}s."
+            if stats.truncated:
+                summary += f"\n⚠️ Only the first {BULK_MAX_LINKS} links were processed."
+            with open(output_path, "rb") as output_file:
+                await context.bot.send_document(chat_id=chat_id, document=output_file, filename="affiliate_links.csv", caption=summary)
+    except Exception as e:
+        logger.exception("Bulk conversion failed for chat %s: %s", chat_id, e)
+        await context.bot.send_message(chat_id=chat_id, text="❌ The bulk conversion failed. Please try again later.")
+    finally:
+        bulk_jobs_in_progress.discard(chat_id)
+        if status_message:
+            try:
+                await context.bot.delete_message(chat_id, status_message.message_id)
+            except Exception:
+                pass
+
+
+async def bulk_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message
+    if not message:
+        return
+    chat_id = update.effective_chat.id
+    parts = (message.text or "").split(maxsplit=1)
+    links_text = parts[1] if len(parts) > 1 else ""
+    replied_document = message.reply_to_message.document if message.reply_to_message else None
+
+    if replied_document:
+        file_id = replied_document.file_id
+    elif links_text.strip():
+        file_id = None
+    else:
+        await message.reply_text(
+            "📄 Bulk mode: send /bulk followed by your links (one per line), "
+            "or upload a .txt / .csv file with one link per line. "
+            "You will get a CSV file with all the affiliate links."
+        )
+        return
+
+    # Runs in the background so a long list does not hold up other updates.
+    locale = await get_user_locale(update.effective_user)
+    context.application.create_task(_run_bulk_job(context, chat_id, text=links_text, file_id=file_id, locale=locale), update=update)
+
+
+async def handle_bulk_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    document = update.message.document if update.message else None
+    if not document:
+        return
+    if document.file_size and document.file_size > BULK_MAX_FILE_BYTES:
+        await update.message.reply_text(f"❌ File too large. The limit is {BULK_MAX_FILE_BYTES // (1024 * 1024)} MB.")
+        return
+    locale = await get_user_locale(update.effective_user)
+    context.application.create_task(_run_bulk_job(context, update.effective_chat.id, file_id=document.file_id, locale=locale),
+                                    update=update)
+
+
+def _inline_result_key(link: LinkRecord) -> str:
+    if link.product_id:
+        return link.product_id
+    return "s" + hashlib.sha1(link.url.encode()).hexdigest()[:20]
+
+async def _resolve_inline_link(link: LinkRecord, cache_only: bool, locale: Locale) -> tuple[str | None, str | None]:
+    if link.kind == LINK_KIND_PRODUCT:
+        return link.product_id, clean_aliexpress_url(link.url, link.product_id)
+    if link.kind == LINK_KIND_SHORT:
+        if cache_only:
+            final_url = await get_cached_short_link(link.url, locale.country)
+        else:
+            final_url = await resolve_short_link(link.url, await get_http_session(), locale.country)
+        product_id = extract_product_id(final_url) if final_url else None
+        if product_id:
+            return product_id, clean_aliexpress_url(final_url, product_id)
+    return None, None
+
+async def _fill_inline_result(link: LinkRecord, locale: Locale) -> tuple[dict, dict, str] | None:
+    product_id, base_url = await _resolve_inline_link(link, cache_only=False, locale=locale)
+    if not product_id:
+        return None
+    product_details, generated_links = await asyncio.gather(
+        fetch_product_details_v2(product_id, locale),
+        _generate_offer_links(base_url),
+    )
+    if product_details:
+        return dict(product_details, id=product_id), generated_links, "API"
+    return {'title': f"Product {product_id}", 'image_url': None, 'price': None, 'currency': None, 'id': product_id}, generated_links, "None"
+
+def _start_inline_fill(key: str, link: LinkRecord, locale: Locale) -> asyncio.Task:
+    fill_key = (locale, key)
+    task = inline_fills.get(fill_key)
+    if task is None:
+        # Hard budget: a fill never outlives INLINE_FILL_BUDGET, even if nobody waits for it.
+        task = asyncio.create_task(asyncio.wait_for(_fill_inline_result(link, locale), INLINE_FILL_BUDGET))
+        inline_fills[fill_key] = task
+        task.add_done_callback(lambda t: inline_fills.pop(fill_key, None))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    inline_query = update.inline_query
+    links = [link for link in classify_message_links(inline_query.query) if link.kind != LINK_KIND_PAGE]
+    if not links:
+        await inline_query.answer([], cache_time=5, is_personal=True)
+        return
+
+    link = links[0]
+    key = _inline_result_key(link)
+    locale = await get_user_locale(update.effective_user)
+
+    # Inline answers must be fast: only caches are consulted here.
+    product_id, base_url = await _resolve_inline_link(link, cache_only=True, locale=locale)
+    product_details = await get_cached_product_details(product_id, locale) if product_id else None
+    generated_links = await _cached_offer_links(base_url) if product_details else None
+
+    if product_details and generated_links:
+        product_data = dict(product_details, id=product_id)
+        message_text = _build_response_message(product_data, generated_links, "API")
+        title = product_data.get('title', f"Product {product_id}").split('\n')[0][:100]
+        description = f"{product_data.get('price') or ''} {product_data.get('currency') or ''}".strip() or "AliExpress deal"
+        image_url = product_data.get('image_url')
+        if image_url:
+            result = InlineQueryResultPhoto(
+                id=f"r:{product_id}", photo_url=image_url, thumbnail_url=image_url, title=title,
+                description=description, caption=message_text, parse_mode=ParseMode.HTML,
+                reply_markup=_build_reply_markup(),
+            )
+        else:
+            result = InlineQueryResultArticle(
+                id=f"r:{product_id}", title=title, description=description,
+                input_message_content=InputTextMessageContent(message_text, parse_mode=ParseMode.HTML),
+                reply_markup=_build_reply_markup(),
+            )
+        hot_logger.info("Inline query served from cache for product %s", product_id)
+        await inline_query.answer([result], cache_time=60, is_personal=True)
+        return
+
+    # Cache miss: answer with a placeholder right away and fill the data in the background.
+    # The reply markup makes Telegram report an inline_message_id we can edit once it is ready.
+    _start_inline_fill(key, link, locale)
+    placeholder = InlineQueryResultArticle(
+        id=f"p:{key}",
+        title="🔗 Get the discounted AliExpress links",
+        description="Tap to send – links appear in a moment",
+        input_message_content=InputTextMessageContent("⏳ Generating AliExpress affiliate links..."),
+        reply_markup=_build_reply_markup(),
+    )
+    hot_logger.info("Inline query cache miss for %s, answered with placeholder", link.url)
+    await inline_query.answer([placeholder], cache_time=0, is_personal=True)
+
+async def handle_chosen_inline_result(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chosen = update.chosen_inline_result
+    if not chosen.inline_message_id or not chosen.result_id.startswith("p:"):
+        return
+
+    links = [link for link in classify_message_links(chosen.query) if link.kind != LINK_KIND_PAGE]
+    if not links:
+        return
+    link = links[0]
+    key = chosen.result_id[2:]
+
+    try:
+        filled = await asyncio.shield(_start_inline_fill(key, link, await get_user_locale(update.effective_user)))
+    except asyncio.TimeoutError:
+        filled = None
+    except Exception as e:
+        logger.error("Inline fill failed for %s: %s", link.url, e)
+        filled = None
+
+    try:
+        if filled:
+            product_data, generated_links, details_source = filled
+            await context.bot.edit_message_text(
+                inline_message_id=chosen.inline_message_id,
+                text=_build_response_message(product_data, generated_links, details_source),
+                parse_mode=ParseMode.HTML,
+                reply_markup=_build_reply_markup(),
+            )
+        else:
+            await context.bot.edit_message_text(
+                inline_message_id=chosen.inline_message_id,
+                text="❌ Could not generate the links in time. Send the link to @Rayanaliexpress_bot directly.",
+            )
+    except Exception as e:
+        logger.error("Failed to update inline message for %s: %s", link.url, e)
+
+
+def _format_price(price: float | None, currency: str) -> str:
+    return f"{price:.2f} {currency}".strip() if price is not None else "?"
+
+
+def _parse_watch_target(arg: str, price: float) -> float | None:
+    # "20" is a target price, "15%" a drop from the current price.
+    try:
+        if arg.endswith('%'):
+            return price * (1 - float(arg[:-1]) / 100)
+        return float(arg.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = update.effective_chat.id
+    args = context.args or []
+    locale = await get_user_locale(update.effective_user)
+
+    if not args:
+        watches = await io_pool.run(price_history.list_watches, chat_id)
+        if not watches:
+            await update.message.reply_text(
+                "👀 Send /watch <AliExpress link> [target price or drop %] and I'll tell you when it gets cheaper, "
+                "e.g. /watch https://www.aliexpress.com/item/1005001234567890.html 15%"
+            )
+            return
+        lines = ["👀 <b>Your watchlist:</b>"]
+        for watch in watches:
+            currency = watch['locale_key'].split('|')[0]
+            lines.append(
+                f"• <code>{watch['product_id']}</code> {html.escape((watch['title'] or '')[:60])}\n"
+                f"  now {_format_price(watch['price'], currency)}, lowest {_format_price(watch['lowest'], currency)}, "
+                f"alert at {_format_price(watch['threshold'], currency)}"
+            )
+        lines.append("\nRemove one with /unwatch <product ID or link>.")
+        await update.message.reply_html("\n".join(lines))
+        return
+
+    links = [link for link in classify_message_links(args[0]) if link.kind != LINK_KIND_PAGE]
+    product_id = links[0].product_id if links else None
+    if links and not product_id:
+        final_url = await resolve_short_link(links[0].url, await get_http_session(), locale.country)
+        product_id = extract_product_id(final_url) if final_url else None
+    if not product_id:
+        await update.message.reply_text("❌ Please send /watch followed by an AliExpress product link.")
+        return
+    if await io_pool.run(price_history.count_watches, chat_id) >= WATCH_MAX_PER_CHAT:
+        await update.message.reply_text(f"❌ You can watch up to {WATCH_MAX_PER_CHAT} products. Remove one with /unwatch first.")
+        return
+
+    details = await fetch_product_details_v2(product_id, locale)
+    price = parse_price(details.get('price')) if details else None
+    if price is None:
+        await update.message.reply_text("❌ Could not get the current price of this product. Please try again later.")
+        return
+    threshold = _parse_watch_target(args[1], price) if len(args) > 1 else price * (1 - WATCH_DEFAULT_DROP)
+    if threshold is None:
+        await update.message.reply_text("❌ The target must be a price (e.g. 19.99) or a drop in percent (e.g. 15%).")
+        return
+
+    await io_pool.run(price_history.add_watch, chat_id, product_id, locale.key, details.get('title'), threshold)
+    await io_pool.run(price_history.record_prices, locale.key, {product_id: price})
+    currency = details.get('currency') or locale.currency
+    await update.message.reply_text(
+        f"👀 Watching {details.get('title') or product_id} at {_format_price(price, currency)}.\n"
+        f"You'll get a message when it drops to {_format_price(threshold, currency)} or less."
+    )
+
+
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    args = context.args or []
+    product_id = (args[0] if args[0].isdigit() else extract_product_id(args[0])) if args else None
+    if not product_id:
+        await update.message.reply_text("❌ Usage: /unwatch <product ID or link>")
+        return
+    if await io_pool.run(price_history.remove_watch, update.effective_chat.id, product_id):
+        await update.message.reply_text(f"🗑️ Stopped watching {product_id}.")
+    else:
+        await update.message.reply_text(f"❌ {product_id} is not on your watchlist.")
+
+
+async def _refresh_locale_prices(locale: Locale, product_ids: list[str], semaphore: asyncio.Semaphore) -> dict[str, float | None]:
+    async def refresh_chunk(chunk: list[str]) -> dict[str, dict]:
+        async with semaphore:
+            # Straight to the API (not the micro-batcher): the cached price is what we want to replace.
+            return await _fetch_details_for_locale(locale, chunk)
+
+    chunks = [product_ids[i:i + PRODUCT_DETAIL_BATCH_SIZE] for i in range(0, len(product_ids), PRODUCT_DETAIL_BATCH_SIZE)]
+    prices = {}
+    for details in await asyncio.gather(*(refresh_chunk(chunk) for chunk in chunks)):
+        prices.update((product_id, parse_price(info.get('price'))) for product_id, info in details.items())
+    return prices
+
+
+async def refresh_watched_prices(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue task: one productdetail.get per PRODUCT_DETAIL_BATCH_SIZE distinct products and locale."""
+    try:
+        watched = await io_pool.run(price_history.watched_products)
+        semaphore = asyncio.Semaphore(WATCH_REFRESH_CONCURRENCY)
+        refreshed = notified = 0
+        for locale_key, product_ids in watched.items():
+            locale = Locale(*locale_key.split('|'))
+            prices = await _refresh_locale_prices(locale, product_ids, semaphore)
+            refreshed += len(prices)
+            await io_pool.run(price_history.record_prices, locale_key, prices)
+            alerts = await io_pool.run(price_history.due_alerts, locale_key, prices)
+
+            sent = []
+            for chat_id, product_id, title, price in alerts:
+                await bulk_send_bucket.acquire()
+                try:
+                    await context.bot.send_message(
+                        chat_id=chat_id,
+                        text=f"📉 Price drop! {title or product_id} is now {_format_price(price, locale.currency)}.\n"
+                             f"Send the link again to get the discounted links: https://www.aliexpress.com/item/{product_id}.html",
+                        disable_web_page_preview=True,
+                    )
+                    sent.append((chat_id, product_id, title, price))
+                except Forbidden:
+                    await io_pool.run(price_history.remove_chat, chat_id)
+                except Exception as e:
+                    logger.error("Failed to send price alert for %s to %s: %s", product_id, chat_id, e)
+            await io_pool.run(price_history.mark_notified, sent)
+            notified += len(sent)
+        logger.info("Watchlist refresh: %s products in %s locales, %s alerts sent.", refreshed, len(watched), notified)
+    except Exception as e:
+        logger.error("Error in watchlist refresh job: %s", e)
+
+
+class SearchPage(NamedTuple):
+    # (product_id, title, price, currency, link) per product, as few objects as possible in the cache.
+    products: list[tuple[str, str, str, str, str]]
+    total: int
+
+
+def _normalize_query(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+async def _fetch_search_page(query: str, api_page: int, locale: Locale) -> SearchPage | None:
+    timeout = deadline.timeout_for(API_TIMEOUT)
+    if timeout <= 0:
+        hot_logger.info("No time left in the update budget for product.query")
+        return None
+
+    def _execute_api_call():
         try:
-            await context.bot.delete_message(chat_id, loading_sticker_msg.message_id)
-        except Exception as delete_err:
-            logger.warning(f"Could not delete loading sticker: {delete_err}")
+            request = iop.IopRequest('aliexpress.affiliate.product.query')
+            request.add_api_param('keywords', query)
+            request.add_api_param('fields', SEARCH_FIELDS)
+            request.add_api_param('page_no', str(api_page))
+            request.add_api_param('page_size', str(SEARCH_API_PAGE_SIZE))
+            request.add_api_param('target_currency', locale.currency)
+            request.add_api_param('target_language', locale.language)
+            request.add_api_param('ship_to_country', locale.country)
+            request.add_api_param('tracking_id', ALIEXPRESS_TRACKING_ID)
+            return aliexpress_client.execute(request, timeout=timeout)
+        except Exception as e:
+            logger.error("Error in API call thread for search %r page %s: %s", query, api_page, e)
+            return None
+
+    response = await io_pool.run(_execute_api_call)
+    if not response or not response.body:
+        logger.error("Product query API call failed or returned empty body for %r", query)
+        return None
 
+    try:
+        response_data = response.body
+        if isinstance(response_data, str):
+            response_data = json.loads(response_data)
+        if 'error_response' in response_data:
+            error_details = response_data.get('error_response', {})
+            logger.error("API Error for search %r: Code=%s, Msg=%s", query, error_details.get('code', 'N/A'), error_details.get('msg', 'Unknown API error'))
+            return None
 
+        resp_result = response_data.get('aliexpress_affiliate_product_query_response', {}).get('resp_result') or {}
+        if resp_result.get('resp_code') != 200:
+            logger.error("API response code not 200 for search %r. Code: %s, Msg: %s", query, resp_result.get('resp_code'), resp_result.get('resp_msg', 'Unknown'))
+            return None
 
-def main() -> None:
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        result = resp_result.get('result') or {}
+        products = [
+            (
+                str(product.get('product_id', '')),
+                product.get('product_title') or "",
+                product.get('target_sale_price') or "",
+                product.get('target_sale_price_currency') or locale.currency,
+                product.get('promotion_link') or f"https://www.aliexpress.com/item/{product.get('product_id')}.html",
+            )
+            for product in (result.get('products') or {}).get('product', [])
+        ]
+        return SearchPage(products, int(result.get('total_record_count') or len(products)))
+    except Exception as e:
+        logger.exception("Error parsing product query response for %r: %s", query, e)
+        return None
 
-    application.add_handler(CommandHandler("start", start))
 
-    application.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND & filters.Regex(COIN_LINK_REGEX.pattern),
-        handle_message
-    ))
+async def get_search_page(query: str, api_page: int, locale: Locale) -> SearchPage | None:
+    key = f"{locale.key}|{query}|{api_page}"
+    cached = await search_cache.get(key)
+    if cached is not None:
+        return cached
 
-    application.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND & filters.Regex(COMBINED_DOMAIN_REGEX.pattern),
-        handle_message
-    ))
+    # A prefetch (or another user) may already be fetching this page: wait for it instead.
+    pending = search_pages_in_flight.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_fetch_search_page(query, api_page, locale))
+        search_pages_in_flight[key] = pending
+        pending.add_done_callback(lambda _: search_pages_in_flight.pop(key, None))
+        page = await asyncio.shield(pending)
+        if page is not None:
+            await search_cache.set(key, page)
+        return page
+    return await asyncio.shield(pending)
 
-    application.add_handler(MessageHandler(
-        filters.FORWARDED & filters.TEXT & filters.Regex(COMBINED_DOMAIN_REGEX),
-        handle_message
-    ))
 
-    application.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND & ~filters.Regex(COMBINED_DOMAIN_REGEX),
-        lambda update, context: context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="Please send an AliExpress product link to generate affiliate links."
+def _search_api_pages(page: int) -> range:
+    # API pages holding the products of a results page; more than one unless SEARCH_PAGE_SIZE divides the API page.
+    first = page * SEARCH_PAGE_SIZE
+    return range(first // SEARCH_API_PAGE_SIZE + 1, (first + SEARCH_PAGE_SIZE - 1) // SEARCH_API_PAGE_SIZE + 2)
+
+
+async def _render_search_page(query: str, query_id: str, page: int, locale: Locale) -> tuple[str, InlineKeyboardMarkup | None] | None:
+    api_pages = _search_api_pages(page)
+    pages = await asyncio.gather(*(get_search_page(query, api_page, locale) for api_page in api_pages))
+    if pages[0] is None:
+        return None
+    results = pages[0]
+    available = []
+    for api_page in pages:
+        if api_page is None:
+            # A later API page failed: show what the earlier ones have.
+            break
+        available.extend(api_page.products)
+
+    start = page * SEARCH_PAGE_SIZE - (api_pages[0] - 1) * SEARCH_API_PAGE_SIZE
+    products = available[start:start + SEARCH_PAGE_SIZE]
+    if not products:
+        return f"🔎 No products found for <b>{html.escape(query)}</b>.", None
+    page_count = min(SEARCH_MAX_PAGES, -(-results.total // SEARCH_PAGE_SIZE))
+
+    lines = [f"🔎 <b>{html.escape(query)}</b> (page {page + 1}/{page_count})\n"]
+    for index, (product_id, title, price, currency, link) in enumerate(products, page * SEARCH_PAGE_SIZE + 1):
+        lines.append(f"{index}. <b>{html.escape(title[:90])}</b>\n💰 {price} {currency}\n🔗 {link}\n")
+    lines.append("Send a product link to get its coin and bundle offers.")
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search|{query_id}|{page - 1}"))
+    if page + 1 < page_count:
+        buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"search|{query_id}|{page + 1}"))
+        for api_page in _search_api_pages(page + 1):
+            next_key = f"{locale.key}|{query}|{api_page}"
+            if next_key not in search_pages_in_flight and await search_cache.get(next_key) is None:
+                # Fetch the next page while the user reads this one, so "Next" answers from cache.
+                start_background_task(get_search_page(query, api_page, locale))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = _normalize_query(" ".join(context.args or []))
+    if not query:
+        await update.message.reply_text("🔎 Send /search followed by what you are looking for, e.g. /search wireless earbuds")
+        return
+
+    # callback_data is limited to 64 bytes, so buttons carry a short ID of the query.
+    query_id = hashlib.sha1(query.encode()).hexdigest()[:12]
+    await search_queries.set(query_id, query)
+    view = await _render_search_page(query, query_id, 0, await get_user_locale(update.effective_user))
+    if view is None:
+        await update.message.reply_text("❌ Search is not available right now. Please try again later.")
+        return
+    text, reply_markup = view
+    await update.message.reply_html(text, disable_web_page_preview=True, reply_markup=reply_markup)
+
+
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    callback = update.callback_query
+    _, query_id, page = callback.data.split("|")
+    query = await search_queries.get(query_id)
+    if query is None:
+        await callback.answer("This search has expired. Please send /search again.", show_alert=True)
+        return
+
+    view = await _render_search_page(query, query_id, int(page), await get_user_locale(update.effective_user))
+    if view is None:
+        await callback.answer("❌ Could not load this page. Please try again.")
+        return
+    await callback.answer()
+    text, reply_markup = view
+    await callback.edit_message_text(text, parse_mode=ParseMode.HTML, disable_web_page_preview=True, reply_markup=reply_markup)
+
+
+async def _send_broadcast_message(bot, chat_id: int | str, payload: dict):
+    if payload.get('photo'):
+        return await bot.send_photo(
+            chat_id=chat_id,
+            photo=payload['photo'],
+            caption=payload['text'],
+            parse_mode=ParseMode.HTML,
+            reply_markup=_build_reply_markup(),
         )
-    ))
+    return await bot.send_message(
+        chat_id=chat_id,
+        text=payload['text'],
+        parse_mode=ParseMode.HTML,
+        disable_web_page_preview=True,
+        reply_markup=_build_reply_markup(),
+    )
 
 
+async def _build_broadcast_payload(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> dict | None:
+    replied = update.message.reply_to_message
+    if replied:
+        # Forward-style: broadcast the replied-to message as it is, if it has text to send.
+        replied_text = replied.text_html or replied.caption_html
+        if not replied_text:
+            return None
+        return {
+            'text': replied_text,
+            'photo': replied.photo[-1].file_id if replied.photo else None,
+        }
+
+    links = [link for link in classify_message_links(text) if link.kind != LINK_KIND_PAGE]
+    if links:
+        # A deal: the same rendered reply users get for the link, from the caches when possible.
+        locale = await get_user_locale(update.effective_user)
+        product_id, product_url = links[0].product_id, links[0].url
+        if not product_id:
+            product_url = await resolve_short_link(links[0].url, await get_http_session(), locale.country)
+            product_id = extract_product_id(product_url) if product_url else None
+        if not product_id:
+            # Sending the link as plain text would broadcast it without our affiliate offers.
+            return None
+        reply = await _prepare_product_reply(product_id, clean_aliexpress_url(product_url, product_id), locale)
+        product_data, message_text = reply
+        return {'text': message_text, 'photo': product_data.get('image_url')}
+
+    if text:
+        return {'text': html.escape(text), 'photo': None}
+    return None
+
+
+async def _run_broadcast_job(application: Application, broadcast_id: int) -> None:
+    global broadcast_job
+    record = await io_pool.run(broadcast_store.get_broadcast, broadcast_id)
+    try:
+        stats = await run_broadcast(
+            broadcast_store,
+            broadcast_id,
+            lambda chat_id, payload: _send_broadcast_message(application.bot, chat_id, payload),
+            rate=BROADCAST_RATE,
+            concurrency=BROADCAST_CONCURRENCY,
+            bucket=bulk_send_bucket,
+        )
+        summary = (f"✅ Broadcast #{broadcast_id} finished: {stats.sent} sent, {stats.failed} failed, "
+                   f"{stats.pruned} blocked chats removed ({stats.rate:.1f} msg/s).")
+    except Exception as e:
+        # Left in the running state: it resumes from its checkpoint on the next start.
+        logger.exception("Broadcast %s failed: %s", broadcast_id, e)
+        summary = f"❌ Broadcast #{broadcast_id} stopped with an error; it will resume on the next restart."
+    finally:
+        if broadcast_job and broadcast_job[0] == broadcast_id:
+            broadcast_job = None
+
+    try:
+        await application.bot.send_message(chat_id=record['admin_chat_id'], text=summary)
+    except Exception as e:
+        logger.error("Failed to report broadcast %s: %s", broadcast_id, e)
+
+
+def _start_broadcast_job(application: Application, broadcast_id: int) -> None:
+    global broadcast_job
+    # Not application.create_task: shutdown must not wait for a long broadcast, it resumes
+    # from its checkpoint after the restart.
+    broadcast_job = (broadcast_id, start_background_task(_run_broadcast_job(application, broadcast_id)))
+
+
+async def resume_broadcasts(context: ContextTypes.DEFAULT_TYPE) -> None:
+    running = await io_pool.run(broadcast_store.running_broadcasts)
+    if running and broadcast_job is None:
+        logger.info("Resuming broadcast %s from its checkpoint", running[0])
+        _start_broadcast_job(context.application, running[0])
+
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    chat_id = update.effective_chat.id
+    parts = (update.message.text or "").split(maxsplit=1)
+    text = parts[1].strip() if len(parts) > 1 else ""
+
+    if text.lower() in ("status", "cancel"):
+        if broadcast_job is None:
+            await update.message.reply_text("No broadcast is running.")
+            return
+        broadcast_id, task = broadcast_job
+        if text.lower() == "cancel":
+            task.cancel()
+            await io_pool.run(broadcast_store.set_status, broadcast_id, STATUS_CANCELLED)
+            await update.message.reply_text(f"🛑 Broadcast #{broadcast_id} cancelled.")
+            return
+        record = await io_pool.run(broadcast_store.get_broadcast, broadcast_id)
+        done = record['sent'] + record['failed'] + record['pruned']
+        await update.message.reply_text(
+            f"📣 Broadcast #{broadcast_id}: {done}/{record['total']} done "
+            f"({record['sent']} sent, {record['failed']} failed, {record['pruned']} removed)."
+        )
+        return
+
+    if broadcast_job is not None:
+        await update.message.reply_text("⏳ A broadcast is already running. Use /broadcast status or /broadcast cancel.")
+        return
+
+    payload = await _build_broadcast_payload(update, context, text)
+    if payload is None:
+        await update.message.reply_text(
+            "📣 Send /broadcast followed by a product link or a text, or reply to a message with /broadcast.\n"
+            "/broadcast status and /broadcast cancel manage the running broadcast."
+        )
+        return
+
+    # Preview for the admin; its photo file_id is then reused for every recipient,
+    # so Telegram does not download the image again for each of them.
+    preview = await _send_broadcast_message(context.bot, chat_id, payload)
+    if payload['photo'] and preview.photo:
+        payload['photo'] = preview.photo[-1].file_id
+    if BROADCAST_CHANNEL:
+        try:
+            await _send_broadcast_message(context.bot, BROADCAST_CHANNEL, payload)
+        except Exception as e:
+            logger.error("Failed to post broadcast to %s: %s", BROADCAST_CHANNEL, e)
+
+    broadcast_id = await io_pool.run(broadcast_store.create_broadcast, chat_id, payload)
+    total = (await io_pool.run(broadcast_store.get_broadcast, broadcast_id))['total']
+    _start_broadcast_job(context.application, broadcast_id)
+    minutes = total / BROADCAST_RATE / 60 if BROADCAST_RATE else 0
+    await update.message.reply_text(f"📣 Broadcast #{broadcast_id} started: {total} subscribers, about {minutes:.0f} min.")
+
+
+def build_application(primary: bool = True, polling: bool = True) -> Application:
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .post_init(warm_up)
+        .post_shutdown(close_http_session)
+        .concurrent_updates(update_processor)
+    )
+    if not polling:
+        # Workers get their updates from the supervisor instead of polling Telegram.
+        builder = builder.updater(None)
+    application = builder.build()
+
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("bulk", bulk_command))
+    application.add_handler(CommandHandler("locale", locale_command))
+    application.add_handler(CommandHandler("stop", stop_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(CommandHandler("watch", watch_command))
+    application.add_handler(CommandHandler("unwatch", unwatch_command))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CallbackQueryHandler(search_page_callback, pattern=r"^search\|"))
+    application.add_handler(InlineQueryHandler(handle_inline_query))
+    application.add_handler(ChosenInlineResultHandler(handle_chosen_inline_result))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("txt") | filters.Document.FileExtension("csv"),
+        handle_bulk_document
+    ))
+
+    # One handler for all text (including forwarded) messages: the dispatcher
+    # classifies the update once and routes it, instead of several regex filters.
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, dispatch_update))
 
-    application.run_polling()
     job_queue = application.job_queue
     job_queue.run_once(periodic_cache_cleanup, 60)
     job_queue.run_repeating(periodic_cache_cleanup, interval=timedelta(days=1), first=timedelta(days=1))
+    if primary:
+        # Bot-wide jobs: with several workers, only the primary one runs them.
+        job_queue.run_once(resume_broadcasts, 5)
+        job_queue.run_repeating(refresh_watched_prices, interval=WATCH_REFRESH_INTERVAL, first=WATCH_REFRESH_INTERVAL)
+    return application
+
+
+def run_worker(index: int, updates) -> None:
+    """Entry point of a worker process in multi-process mode (see supervisor.py)."""
+    iop.init_logging()
+    application = build_application(primary=index == PRIMARY_WORKER, polling=False)
+    logger.info("Worker %s ready", index)
+    asyncio.run(serve_worker(application, updates))
+    shutdown_pools(wait=True)
+
 
+def main() -> None:
+    iop.init_logging()
     logger.info("Starting Telegram bot polling...")
-    logger.info(f"Using AliExpress Key: {ALIEXPRESS_APP_KEY[:4]}...")
-    logger.info(f"Using Tracking ID: {ALIEXPRESS_TRACKING_ID}")
-    logger.info(f"Settings: Currency={TARGET_CURRENCY}, Lang={TARGET_LANGUAGE}, Country={QUERY_COUNTRY}")
-    logger.info(f"Cache expiry: {CACHE_EXPIRY_DAYS} days")
+    logger.info("Using AliExpress Key: %s...", ALIEXPRESS_APP_KEY[:4])
+    logger.info("Using Tracking ID: %s", ALIEXPRESS_TRACKING_ID)
+    logger.info("Settings: Currency=%s, Lang=%s, Country=%s", TARGET_CURRENCY, TARGET_LANGUAGE, QUERY_COUNTRY)
+    logger.info("Cache expiry: %s days", CACHE_EXPIRY_DAYS)
     offer_names = [v['name'] for k, v in OFFER_PARAMS.items()]
-    logger.info(f"Offers: {', '.join(offer_names)}")
+    logger.info("Offers: %s", ', '.join(offer_names))
     logger.info("Bot is ready and listening...")
 
+    if BOT_WORKERS > 1:
+        logger.info("Running %s worker processes, shared cache in %s", BOT_WORKERS, SHARED_CACHE_PATH)
+        Supervisor(TELEGRAM_BOT_TOKEN, BOT_WORKERS, run_worker).run()
+        logger.info("Bot stopped.")
+        return
+
+    application = build_application()
     application.run_polling()
 
-    logger.info("Shutting down thread pool...")
-    executor.shutdown(wait=True)
+    logger.info("Shutting down worker pools...")
+    shutdown_pools(wait=True)
     logger.info("Bot stopped.")
-
-if __name__ == "__main__":
-    main()
@@ -0,0 +1,77 @@
+"""Micro-batching of single-key lookups.
+
+Callers ask for one key at a time; requests that arrive within a short window
+and share a group (e.g. the same locale) are merged into one backend call of up
+to ``max_batch_size`` keys. Concurrent requests for the same pending key share
+a single future.
+"""
+import asyncio
+import logging
+
+from deadline import detached
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects keys per group and runs them as one batched call.
+    Args:
+        fetch_batch: ``async (group, keys) -> {key: result}``; missing keys resolve to None.
+        max_batch_size (int): Flush a group as soon as it holds this many keys.
+        max_delay (float): Seconds to wait for more keys before flushing a group.
+    """
+
+    def __init__(self, fetch_batch, max_batch_size=20, max_delay=0.01):
+        self.fetch_batch = fetch_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending = {}
+        self._timers = {}
+        self.batches = 0
+        self.keys = 0
+
+    def submit(self, group, key) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(group, {})
+        future = pending.get(key)
+        if future is None:
+            future = loop.create_future()
+            pending[key] = future
+        if len(pending) >= self.max_batch_size:
+            self._flush(group)
+        elif group not in self._timers:
+            self._timers[group] = loop.call_later(self.max_delay, self._flush, group)
+        return future
+
+    async def load(self, group, key):
+        # Shielded: one cancelled caller must not cancel a future other callers share.
+        return await asyncio.shield(self.submit(group, key))
+
+    async def load_many(self, group, keys) -> dict:
+        keys = list(dict.fromkeys(keys))
+        futures = [self.submit(group, key) for key in keys]
+        results = await asyncio.shield(asyncio.gather(*futures))
+        return dict(zip(keys, results))
+
+    def _flush(self, group):
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(group, None)
+        if pending:
+            # Shared by every caller in the batch: not bound by the budget of whichever update flushed it.
+            detached(self._run(group, pending))
+
+    async def _run(self, group, pending):
+        self.batches += 1
+        self.keys += len(pending)
+        results = {}
+        try:
+            results = await self.fetch_batch(group, list(pending)) or {}
+        except Exception as e:
+            logger.error("Batched fetch failed for %s (%s keys): %s", group, len(pending), e)
+        finally:
+            for key, future in pending.items():
+                if not future.done():
+                    future.set_result(results.get(key))
@@ -0,0 +1,145 @@
+"""Broadcast throughput, pacing and resume.
+
+Runs the broadcast engine against the fake Telegram Bot API with a subscriber
+table of ``--subscribers`` rows (``--blocked`` of them have blocked the bot):
+
+* unpaced   - every subscriber, no rate limit: the engine's own ceiling
+              (SQLite paging, checkpoints, pruning) in messages per second
+* paced     - ``--paced-seconds`` at ``--rate`` against a fake Telegram that
+              answers 429 above ``--flood-limit`` sends per second
+* resume    - the unpaced run cut off halfway and resumed from its checkpoint;
+              reports how many chats got the message twice
+
+The completion time for the whole list follows from the paced rate.
+
+Usage:
+    python benchmarks/bench_broadcast.py --subscribers 100000 --rate 25
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram.ext import Application
+
+from broadcast import BroadcastStore, run_broadcast
+from loadtest.fake_servers import FakeTelegramAPI
+from loadtest.harness import BOT_TOKEN
+from storage import Database
+
+PAYLOAD = {'text': "🔥 <b>Deal of the day</b>", 'photo': "AgACAgQAAxkBAAIBroadcastFileId"}
+
+
+async def build_bot(telegram: FakeTelegramAPI):
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(telegram.base_url)
+        .updater(None)
+        .build()
+    )
+    await application.initialize()
+    return application
+
+
+def fill_subscribers(store: BroadcastStore, count: int) -> None:
+    store._ready().executemany(
+        "INSERT INTO subscribers (chat_id, subscribed_at) VALUES (?, ?)",
+        ((100000 + i, time.time()) for i in range(count)))
+
+
+async def run_case(store, bot, deliveries: Counter, rate: float, concurrency: int, stop_after: float | None = None,
+                   broadcast_id: int | None = None):
+    async def send(chat_id, payload):
+        await bot.send_photo(chat_id=chat_id, photo=payload['photo'], caption=payload['text'])
+        deliveries[chat_id] += 1
+
+    if broadcast_id is None:
+        broadcast_id = store.create_broadcast(1, PAYLOAD)
+    task = asyncio.ensure_future(run_broadcast(store, broadcast_id, send, rate=rate, concurrency=concurrency))
+    started = time.perf_counter()
+    try:
+        stats = await asyncio.wait_for(asyncio.shield(task), stop_after) if stop_after else await task
+    except asyncio.TimeoutError:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        stats = None
+    return broadcast_id, stats, time.perf_counter() - started
+
+
+async def bench(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    blocked = {100000 + i for i in rng.sample(range(args.subscribers), int(args.subscribers * args.blocked))}
+    telegram = FakeTelegramAPI(BOT_TOKEN, blocked_chats=blocked, latency=args.telegram_latency, flood_limit=args.flood_limit)
+    await telegram.start()
+    application = await build_bot(telegram)
+    bot = application.bot
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        rows = []
+
+        # Unpaced, and the same cut off halfway then resumed.
+        for label in ("unpaced", "resume"):
+            store = BroadcastStore(Database(os.path.join(work_dir, f"{label}.db")))
+            fill_subscribers(store, args.subscribers)
+            deliveries = Counter()
+            telegram.flood_limit = 0
+            if label == "unpaced":
+                _, stats, elapsed = await run_case(store, bot, deliveries, 0, args.concurrency)
+            else:
+                cut = rows[0][2] / 2
+                broadcast_id, _, first = await run_case(store, bot, deliveries, 0, args.concurrency, stop_after=cut)
+                _, stats, second = await run_case(store, bot, deliveries, 0, args.concurrency, broadcast_id=broadcast_id)
+                elapsed = first + second
+            duplicates = sum(count - 1 for count in deliveries.values() if count > 1)
+            rows.append((label, stats, elapsed, duplicates, store.count_subscribers()))
+            store.db.close()
+
+        # Paced against a flood-limited Telegram, for a fixed time.
+        store = BroadcastStore(Database(os.path.join(work_dir, "paced.db")))
+        fill_subscribers(store, args.subscribers)
+        telegram.flood_limit = args.flood_limit
+        telegram.rejected = 0
+        deliveries = Counter()
+        _, _, paced_elapsed = await run_case(store, bot, deliveries, args.rate, args.concurrency, stop_after=args.paced_seconds)
+        paced_rate = sum(deliveries.values()) / paced_elapsed
+        store.db.close()
+
+    await application.shutdown()
+    await telegram.stop()
+
+    print(f"{args.subscribers} subscribers, {len(blocked)} blocked, Telegram latency {args.telegram_latency * 1000:.0f} ms")
+    for label, stats, elapsed, duplicates, remaining in rows:
+        print(f"{label:<10} {stats.sent} sent, {stats.pruned} pruned, {remaining} left in {elapsed:.1f}s "
+              f"= {stats.sent / elapsed:.0f} msg/s, {duplicates} sent twice")
+    print(f"{'paced':<10} {sum(deliveries.values())} sent in {paced_elapsed:.1f}s = {paced_rate:.1f} msg/s "
+          f"(target {args.rate}, {telegram.rejected} flood rejections)")
+    print(f"completion for {args.subscribers} subscribers at {paced_rate:.1f} msg/s: {args.subscribers / paced_rate / 60:.0f} min")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=100000)
+    parser.add_argument("--blocked", type=float, default=0.02, help="fraction of subscribers that blocked the bot")
+    parser.add_argument("--rate", type=float, default=25.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--flood-limit", type=int, default=30)
+    parser.add_argument("--paced-seconds", type=float, default=20.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Memory cost per cache entry.
+
+Fills each of the bot's caches with realistic synthetic entries and reports the
+bytes held per entry (tracemalloc), next to the original representation: a dict
+of string keys mapping to ``(value, timestamp)`` tuples with product dicts as values.
+
+Usage:
+    python benchmarks/bench_cache_memory.py --entries 200000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loadtest.harness import configure_environment
+
+TITLE_WORDS = ["Wireless", "Earbuds", "Bluetooth", "5.3", "Smart", "Watch", "Men", "Women", "Waterproof",
+               "LED", "Portable", "Charger", "Case", "For", "iPhone", "Xiaomi", "Kitchen", "Tool", "Set"]
+
+
+def fresh(text: str) -> str:
+    # A new string object, as json.loads would create for every response.
+    return "".join(list(text))
+
+
+def product_fields(rng: random.Random, product_id: int) -> dict:
+    return {
+        'image_url': f"https://ae0{rng.randint(1, 4)}.alicdn.com/kf/S{rng.getrandbits(128):032x}.jpg",
+        'price': f"{rng.uniform(0.5, 200):.2f}",
+        'currency': fresh("USD"),
+        'title': " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(6, 12))),
+    }
+
+
+def promotion_link(rng: random.Random) -> str:
+    return "https://s.click.aliexpress.com/e/_" + "".join(rng.choice("abcdefghijkmnopqrstuvwxyzABCDEFGH0123456789") for _ in range(7))
+
+
+def measure(build) -> tuple[int, object]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    holder = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, holder
+
+
+def legacy_products(count: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    cache = {}
+    for i in range(count):
+        product_id = 1005000000000 + i
+        cache[str(product_id)] = (product_fields(rng, product_id), time.time())
+    return cache
+
+
+def legacy_links(count: int, seed: int, app) -> dict:
+    rng = random.Random(seed)
+    cache = {}
+    for i in range(count):
+        base_url = f"https://www.aliexpress.com/item/{1005000000000 + i // 2}.html"
+        offer = app.OFFER_ORDER[i % 2]
+        cache[app.build_url_with_offer_params(base_url, app.OFFER_PARAMS[offer]["params"])] = (promotion_link(rng), time.time())
+    return cache
+
+
+async def compact_products(count: int, seed: int, app) -> tuple:
+    from cache import CacheWithExpiry
+
+    rng = random.Random(seed)
+    # Fresh caches with the bot's codecs, so repeated runs do not share state.
+    products = CacheWithExpiry(app.CACHE_EXPIRY_SECONDS, value_codec=app.product_cache._value_codec)
+    images = CacheWithExpiry(app.CACHE_EXPIRY_SECONDS, value_codec=app.product_image_cache._value_codec)
+    for i in range(count):
+        product_id = str(1005000000000 + i)
+        fields = product_fields(rng, int(product_id))
+        image_url = fields.pop('image_url')
+        await products.set(app.product_cache_key(product_id, app.DEFAULT_LOCALE), fields)
+        await images.set(app.product_cache_key(product_id), image_url)
+    return products, images
+
+
+async def compact_links(count: int, seed: int, app):
+    from cache import CacheWithExpiry
+
+    rng = random.Random(seed)
+    links = CacheWithExpiry(app.CACHE_EXPIRY_SECONDS, key_codec=app.link_cache._key_codec, value_codec=app.link_cache._value_codec)
+    for i in range(count):
+        base_url = f"https://www.aliexpress.com/item/{1005000000000 + i // 2}.html"
+        offer = app.OFFER_ORDER[i % 2]
+        await links.set(app.build_url_with_offer_params(base_url, app.OFFER_PARAMS[offer]["params"]), promotion_link(rng))
+    return links
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    configure_environment("http://127.0.0.1:9/sync")
+    import app
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    n = args.entries
+    rows = [
+        ("product (details + image)",
+         measure(lambda: legacy_products(n, args.seed))[0],
+         measure(lambda: asyncio.run(compact_products(n, args.seed, app)))[0]),
+        ("affiliate link",
+         measure(lambda: legacy_links(n, args.seed, app))[0],
+         measure(lambda: asyncio.run(compact_links(n, args.seed, app)))[0]),
+    ]
+
+    print(f"{n} entries per cache")
+    print(f"{'':<28}{'original B/entry':>18}{'compact B/entry':>18}{'saving':>10}")
+    for label, legacy_bytes, compact_bytes in rows:
+        print(f"{label:<28}{legacy_bytes / n:>18.1f}{compact_bytes / n:>18.1f}{1 - compact_bytes / legacy_bytes:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
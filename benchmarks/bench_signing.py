@@ -0,0 +1,90 @@
+"""Per-request CPU cost of preparing and signing an AliExpress API call.
+
+Compares the original ``IopClient.execute`` preparation (fresh parameter dict,
+``sign()`` with a new HMAC per call, eager ``full_url`` string) against the
+precomputed ``IopSigner`` path used now.
+
+Usage:
+    python benchmarks/bench_signing.py --calls 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import iop
+from iop.base import (P_APPKEY, P_FORMAT, P_METHOD, P_PARTNER_ID, P_SDK_VERSION, P_SIGN, P_SIGN_METHOD,
+                      P_SIMPLIFY, P_TIMESTAMP)
+
+APP_KEY = "500000"
+APP_SECRET = "0123456789abcdef0123456789abcdef"
+
+
+def build_request(index: int) -> iop.IopRequest:
+    request = iop.IopRequest('aliexpress.affiliate.productdetail.get')
+    request.add_api_param('fields', 'product_main_image_url,target_sale_price,product_title,target_sale_price_currency')
+    request.add_api_param('product_ids', str(1005001000000000 + index))
+    request.add_api_param('target_currency', 'USD')
+    request.add_api_param('target_language', 'EN')
+    request.add_api_param('tracking_id', 'default')
+    request.add_api_param('country', 'US')
+    return request
+
+
+def legacy_prepare(client: iop.IopClient, request: iop.IopRequest) -> dict:
+    # The preparation steps of the original IopClient.execute, verbatim.
+    sys_parameters = {
+        P_APPKEY: client._app_key,
+        P_SIGN_METHOD: "sha256",
+        P_TIMESTAMP: str(int(round(time.time()))) + '000',
+        P_PARTNER_ID: P_SDK_VERSION,
+        P_METHOD: request._api_pame,
+        P_SIMPLIFY: request._simplify,
+        P_FORMAT: request._format
+    }
+    sign_parameter = sys_parameters.copy()
+    sign_parameter.update(request._api_params)
+    sign_parameter[P_SIGN] = iop.sign(client._app_secret, request._api_pame, sign_parameter)
+    full_url = client._server_url + "?"
+    for key in sign_parameter:
+        full_url += key + "=" + str(sign_parameter[key]) + "&"
+    full_url = full_url[0:-1]
+    return sign_parameter
+
+
+def fast_prepare(client: iop.IopClient, request: iop.IopRequest) -> dict:
+    return client._prepare_parameters(request)
+
+
+def run(label: str, prepare, client: iop.IopClient, requests_: list) -> float:
+    started = time.perf_counter()
+    for request in requests_:
+        prepare(client, request)
+    elapsed = time.perf_counter() - started
+    per_call_us = elapsed / len(requests_) * 1e6
+    print(f"{label:<10} {per_call_us:8.2f} us/call  {len(requests_) / elapsed:12,.0f} calls/s")
+    return elapsed
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    client = iop.IopClient("https://api-sg.aliexpress.com/sync", APP_KEY, APP_SECRET)
+    requests_ = [build_request(i) for i in range(args.calls)]
+
+    # Both paths must produce the same signature for the same parameters.
+    sample = fast_prepare(client, requests_[0])
+    expected = iop.sign(APP_SECRET, requests_[0]._api_pame, {k: v for k, v in sample.items() if k != P_SIGN})
+    assert sample[P_SIGN] == expected, "IopSigner output differs from iop.sign()"
+
+    legacy = run("legacy", legacy_prepare, client, requests_)
+    fast = run("fast", fast_prepare, client, requests_)
+    print(f"speedup    {legacy / fast:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Cold-start benchmark: import time of app.py and time to the first reply.
+
+* import time        - wall time of ``python -c "import app"`` minus a bare interpreter start
+* time-to-first-reply - from spawning a fresh interpreter to the first ``send*`` call
+  reaching a local fake Telegram Bot API, for a single product-link update
+
+Results can be appended to a JSON-lines history file so cold-start cost can be
+tracked from commit to commit.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5 --history benchmarks/startup_history.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loadtest.fake_servers import FakeAliExpressAPI, FakeTelegramAPI
+from loadtest.harness import APP_KEY, APP_SECRET, BOT_TOKEN, build_update_payload
+
+FIRST_REPLY_TEXT = "https://www.aliexpress.com/item/1005001234567890.html"
+
+
+def child_env(api_url: str = "http://127.0.0.1:9/sync") -> dict:
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+        "ALIEXPRESS_APP_KEY": APP_KEY,
+        "ALIEXPRESS_APP_SECRET": APP_SECRET,
+        "ALIEXPRESS_TRACKING_ID": "bench",
+        "ALIEXPRESS_API_URL": api_url,
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+
+def time_command(args: list[str], env: dict) -> float:
+    started = time.perf_counter()
+    subprocess.run(args, env=env, cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def measure_import(runs: int) -> dict:
+    env = child_env()
+    bare = [time_command([sys.executable, "-c", "pass"], env) for _ in range(runs)]
+    full = [time_command([sys.executable, "-c", "import app"], env) for _ in range(runs)]
+    return {
+        "interpreter_ms": round(statistics.median(bare) * 1000, 1),
+        "import_app_ms": round((statistics.median(full) - statistics.median(bare)) * 1000, 1),
+    }
+
+
+async def measure_first_reply_once() -> float:
+    telegram = FakeTelegramAPI(BOT_TOKEN)
+    api = FakeAliExpressAPI(APP_KEY, APP_SECRET)
+    await telegram.start()
+    await api.start()
+    try:
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--child", telegram.base_url,
+            env=child_env(api.url), cwd=ROOT,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+        )
+        while not any(method.startswith("send") for method in telegram.calls):
+            if process.returncode is not None:
+                raise RuntimeError(f"child exited with {process.returncode} before replying")
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        await process.wait()
+        return elapsed
+    finally:
+        await api.stop()
+        await telegram.stop()
+
+
+def measure_first_reply(runs: int) -> dict:
+    samples = [asyncio.run(measure_first_reply_once()) for _ in range(runs)]
+    return {
+        "first_reply_ms": round(statistics.median(samples) * 1000, 1),
+        "first_reply_min_ms": round(min(samples) * 1000, 1),
+    }
+
+
+async def run_child(telegram_base_url: str) -> None:
+    # Everything from here on is what a cold-started bot does before its first reply.
+    import app
+    from telegram import Update
+    from telegram.ext import Application, CallbackContext
+
+    application = Application.builder().token(app.TELEGRAM_BOT_TOKEN).base_url(telegram_base_url).updater(None).build()
+    await application.initialize()
+    update = Update.de_json(build_update_payload(1, 4242, FIRST_REPLY_TEXT), application.bot)
+    await app.dispatch_update(update, CallbackContext.from_update(update, application))
+    await application.shutdown()
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--history", help="append the result as one JSON line to this file")
+    parser.add_argument("--child", metavar="TELEGRAM_BASE_URL", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        asyncio.run(run_child(args.child))
+        return
+
+    result = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+    }
+    result.update(measure_import(args.runs))
+    result.update(measure_first_reply(args.runs))
+
+    for key, value in result.items():
+        print(f"{key:<20}{value}")
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
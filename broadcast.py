@@ -0,0 +1,261 @@
+"""Rate-limited broadcast of one message to every subscriber.
+
+Subscribers are kept in the ``subscribers`` table of the bot database. A
+broadcast is a row in ``broadcasts`` holding its payload, counters and a
+cursor (the last chat ID done). Subscribers are walked in chat ID order one
+page at a time and the cursor is saved after every page, so a broadcast cut
+off by a crash or restart resumes where it stopped; at most one page can be
+sent twice.
+
+Sends are paced by a token bucket below Telegram's bulk limit (about 30
+messages per second), a ``RetryAfter`` pauses the whole bucket, and chats
+that blocked the bot are removed from the list as they are found.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from pools import io_pool
+
+logger = logging.getLogger(__name__)
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_CANCELLED = "cancelled"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    chat_id INTEGER PRIMARY KEY,
+    subscribed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_chat_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    pruned INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+"""
+
+BROADCAST_COLUMNS = ("id", "admin_chat_id", "payload", "status", "total", "cursor", "sent", "failed", "pruned",
+                     "started_at", "finished_at")
+
+# Errors meaning the chat can never receive messages from the bot again.
+_GONE_CHAT_ERRORS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+
+class TokenBucket:
+    """
+    Paces calls to ``rate`` per second with bursts of up to ``capacity``.
+    Args:
+        rate (float): Tokens added per second; 0 disables pacing.
+        capacity (float): Bucket size; the default of 1 spaces calls evenly, as Telegram
+            counts its limit over a sliding second and rejects bursts.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or 1
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds) -> None:
+        """Hold every caller for ``seconds`` (a flood-wait from Telegram applies to the whole bot)."""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        self._tokens = 0
+
+    async def acquire(self) -> None:
+        if not self.rate:
+            return
+        # The lock queues callers, so tokens are handed out in arrival order.
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastStore:
+    """
+    Subscriber list and broadcast checkpoints. Methods are blocking; run them on ``io_pool``.
+    Args:
+        database (storage.Database): Database holding the tables.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def _ready(self):
+        self.db.ensure_schema("broadcast", SCHEMA)
+        return self.db
+
+    def add_subscriber(self, chat_id) -> None:
+        self._ready().execute("INSERT OR IGNORE INTO subscribers (chat_id, subscribed_at) VALUES (?, ?)", (chat_id, time.time()))
+
+    def remove_subscribers(self, chat_ids) -> int:
+        return self._ready().executemany("DELETE FROM subscribers WHERE chat_id = ?", [(chat_id,) for chat_id in chat_ids])
+
+    def count_subscribers(self) -> int:
+        return self._ready().execute("SELECT COUNT(*) FROM subscribers")[0][0]
+
+    def subscriber_page(self, after_chat_id, limit) -> list[int]:
+        # Keyset pagination: constant cost per page however far into the list we are.
+        rows = self._ready().execute(
+            "SELECT chat_id FROM subscribers WHERE chat_id > ? ORDER BY chat_id LIMIT ?", (after_chat_id, limit))
+        return [row[0] for row in rows]
+
+    def create_broadcast(self, admin_chat_id, payload) -> int:
+        db = self._ready()
+        total = self.count_subscribers()
+        # Chat IDs can be negative (groups), so start the cursor below any of them.
+        db.execute(
+            "INSERT INTO broadcasts (admin_chat_id, payload, status, total, cursor, started_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (admin_chat_id, json.dumps(payload), STATUS_RUNNING, total, -(1 << 62), time.time()))
+        return db.execute("SELECT last_insert_rowid()")[0][0]
+
+    def get_broadcast(self, broadcast_id) -> dict | None:
+        rows = self._ready().execute(f"SELECT {', '.join(BROADCAST_COLUMNS)} FROM broadcasts WHERE id = ?", (broadcast_id,))
+        if not rows:
+            return None
+        record = dict(zip(BROADCAST_COLUMNS, rows[0]))
+        record['payload'] = json.loads(record['payload'])
+        return record
+
+    def running_broadcasts(self) -> list[int]:
+        return [row[0] for row in self._ready().execute("SELECT id FROM broadcasts WHERE status = ? ORDER BY id", (STATUS_RUNNING,))]
+
+    def set_status(self, broadcast_id, status) -> None:
+        self._ready().execute("UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ?", (status, time.time(), broadcast_id))
+
+    def save_progress(self, broadcast_id, stats, status=STATUS_RUNNING) -> None:
+        self._ready().execute(
+            # A broadcast cancelled meanwhile keeps its status.
+            "UPDATE broadcasts SET cursor = ?, sent = ?, failed = ?, pruned = ?, status = ?, finished_at = ? "
+            "WHERE id = ? AND status = ?",
+            (stats.cursor, stats.sent, stats.failed, stats.pruned, status,
+             None if status == STATUS_RUNNING else time.time(), broadcast_id, STATUS_RUNNING))
+
+
+class BroadcastStats:
+    def __init__(self, record=None):
+        record = record or {}
+        self.total = record.get('total', 0)
+        self.cursor = record.get('cursor', 0)
+        self.sent = record.get('sent', 0)
+        self.failed = record.get('failed', 0)
+        self.pruned = record.get('pruned', 0)
+        self.started_at = time.monotonic()
+        self.sent_this_run = 0
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.pruned
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def rate(self) -> float:
+        return self.sent_this_run / self.elapsed if self.elapsed else 0.0
+
+
+def _retry_seconds(error) -> float:
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+async def run_broadcast(store, broadcast_id, send, rate=25.0, concurrency=8, page_size=500,
+                        max_retries=3, on_progress=None, progress_interval=30.0, bucket=None) -> BroadcastStats:
+    """
+    Send a broadcast to every subscriber after its saved cursor.
+    Args:
+        store (BroadcastStore): Subscriber list and checkpoints.
+        broadcast_id (int): Row created by ``BroadcastStore.create_broadcast``.
+        send: ``async (chat_id, payload) -> None``; raises Telegram errors.
+        rate (float): Messages per second (0 for no pacing).
+        concurrency (int): Sends in flight at the same time.
+        page_size (int): Subscribers per page; progress is saved after each page.
+        on_progress: ``async (BroadcastStats) -> None``, called at most every ``progress_interval`` seconds.
+        bucket (TokenBucket): Pacing shared with the bot's other bulk sends; a new one at ``rate`` if omitted.
+    Returns:
+        BroadcastStats: counters for the whole broadcast, including earlier runs.
+    """
+    record = await io_pool.run(store.get_broadcast, broadcast_id)
+    payload = record['payload']
+    stats = BroadcastStats(record)
+    bucket = bucket or TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    last_progress = time.monotonic()
+
+    async def deliver(chat_id) -> int | None:
+        """Returns the chat ID if the chat is gone and should be pruned."""
+        async with semaphore:
+            for _ in range(max_retries):
+                await bucket.acquire()
+                try:
+                    await send(chat_id, payload)
+                    stats.sent += 1
+                    stats.sent_this_run += 1
+                    return None
+                except RetryAfter as e:
+                    wait = _retry_seconds(e)
+                    logger.warning("Broadcast %s: flood wait of %ss", broadcast_id, wait)
+                    bucket.pause(wait)
+                except Forbidden:
+                    return chat_id
+                except BadRequest as e:
+                    if any(reason in str(e).lower() for reason in _GONE_CHAT_ERRORS):
+                        return chat_id
+                    logger.warning("Broadcast %s to %s failed: %s", broadcast_id, chat_id, e)
+                    break
+                except Exception as e:
+                    logger.warning("Broadcast %s to %s failed: %s", broadcast_id, chat_id, e)
+                    break
+            stats.failed += 1
+            return None
+
+    while True:
+        page = await io_pool.run(store.subscriber_page, stats.cursor, page_size)
+        if not page:
+            break
+        results = await asyncio.gather(*(deliver(chat_id) for chat_id in page))
+        gone = [chat_id for chat_id in results if chat_id is not None]
+        if gone:
+            await io_pool.run(store.remove_subscribers, gone)
+            stats.pruned += len(gone)
+        stats.cursor = page[-1]
+        await io_pool.run(store.save_progress, broadcast_id, stats)
+
+        now = time.monotonic()
+        if on_progress and now - last_progress >= progress_interval:
+            last_progress = now
+            try:
+                await on_progress(stats)
+            except Exception as e:
+                logger.warning("Broadcast progress update failed: %s", e)
+
+    await io_pool.run(store.save_progress, broadcast_id, stats, STATUS_DONE)
+    logger.info("Broadcast %s done: %s sent, %s failed, %s pruned, %.1f msg/s",
+                broadcast_id, stats.sent, stats.failed, stats.pruned, stats.rate)
+    return stats
@@ -0,0 +1,136 @@
+"""Streaming bulk link conversion.
+
+Input lines are read lazily, grouped into fixed-size batches and pushed
+through a bounded queue to a fixed number of workers; every converted row is
+written straight to a CSV file. Nothing grows with the size of the input, so
+peak memory stays flat however many links are uploaded.
+"""
+import asyncio
+import csv
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BULK_CSV_COLUMNS = [
+    "line", "input_url", "product_id", "title", "price", "currency",
+    "coin_link", "bundle_link", "status",
+]
+
+
+class BulkStats:
+    def __init__(self):
+        self.lines_read = 0
+        self.links_found = 0
+        self.rows_written = 0
+        self.converted = 0
+        self.failed = 0
+        self.truncated = False
+        self.started_at = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+def iter_file_lines(path: str, encoding: str = "utf-8"):
+    """Yield ``(line_number, text)`` from a text/CSV file without loading it into memory."""
+    with open(path, encoding=encoding, errors="replace", newline="") as f:
+        for line_number, line in enumerate(f, 1):
+            yield line_number, line
+
+
+def iter_text_lines(text: str):
+    """Yield ``(line_number, text)`` for the lines of an in-message link list."""
+    for line_number, line in enumerate(text.splitlines(), 1):
+        yield line_number, line
+
+
+async def run_bulk_job(lines, extract_links, process_batch, output_path: str, batch_size: int = 20,
+                       concurrency: int = 4, max_links: int | None = None, on_progress=None,
+                       progress_interval: float = 5.0) -> BulkStats:
+    """
+    Convert every link found in ``lines`` and write one CSV row per link.
+    Args:
+        lines: Iterable of (line_number, text).
+        extract_links: ``text -> list of link records`` (the bot's classifier).
+        process_batch: ``async [(line_number, record), ...] -> [row, ...]`` with rows in BULK_CSV_COLUMNS order.
+        output_path (str): CSV file to write.
+        batch_size (int): Links per batch (matches the API batch size).
+        concurrency (int): Batches processed at the same time.
+        max_links (int): Stop after this many links (None for no limit).
+        on_progress: ``async (BulkStats) -> None``, called at most every ``progress_interval`` seconds.
+    Returns:
+        BulkStats: counters for the finished job.
+    """
+    stats = BulkStats()
+    queue = asyncio.Queue(maxsize=concurrency)
+    last_progress = time.monotonic()
+
+    with open(output_path, "w", encoding="utf-8-sig", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(BULK_CSV_COLUMNS)
+
+        async def report_progress(force: bool = False) -> None:
+            nonlocal last_progress
+            now = time.monotonic()
+            if on_progress and (force or now - last_progress >= progress_interval):
+                last_progress = now
+                try:
+                    await on_progress(stats)
+                except Exception as e:
+                    logger.warning("Bulk progress update failed: %s", e)
+
+        async def worker() -> None:
+            while True:
+                batch = await queue.get()
+                try:
+                    if batch is None:
+                        return
+                    try:
+                        rows = await process_batch(batch)
+                    except Exception as e:
+                        logger.exception("Bulk batch failed: %s", e)
+                        rows = [[line, record.url, "", "", "", "", "", "", "error"] for line, record in batch]
+                    writer.writerows(rows)
+                    stats.rows_written += len(rows)
+                    for row in rows:
+                        if row[-1] == "ok":
+                            stats.converted += 1
+                        else:
+                            stats.failed += 1
+                    await report_progress()
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            batch = []
+            for line_number, text in lines:
+                stats.lines_read += 1
+                for record in extract_links(text):
+                    if max_links is not None and stats.links_found >= max_links:
+                        stats.truncated = True
+                        break
+                    stats.links_found += 1
+                    batch.append((line_number, record))
+                    if len(batch) >= batch_size:
+                        await queue.put(batch)
+                        batch = []
+                if stats.truncated:
+                    break
+                if stats.lines_read % 500 == 0:
+                    # Reading is synchronous; let replies to other users through on huge files.
+                    await asyncio.sleep(0)
+            if batch:
+                await queue.put(batch)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            raise
+
+    await report_progress(force=True)
+    return stats
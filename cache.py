@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+from array import array
+
+from pools import io_pool
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixCodec:
+    """
+    Stores strings as UTF-8 bytes: one prefix-table marker byte plus the suffix, so long
+    shared prefixes (share URLs, short-link hosts, CDN paths) are kept only once.
+    Args:
+        prefixes (list[str]): Known prefixes (at most 255); the longest match wins.
+    """
+
+    def __init__(self, prefixes):
+        self.prefixes = list(prefixes)
+        # Marker 0 means "no known prefix"; prefix i is stored as byte i + 1.
+        self._by_length = sorted(enumerate(self.prefixes, 1), key=lambda item: -len(item[1]))
+
+    def encode(self, value):
+        if not isinstance(value, str):
+            return value
+        for marker, prefix in self._by_length:
+            if value.startswith(prefix):
+                return bytes((marker,)) + value[len(prefix):].encode()
+        return b"\0" + value.encode()
+
+    def decode(self, stored):
+        if not isinstance(stored, bytes):
+            return stored
+        suffix = stored[1:].decode()
+        marker = stored[0]
+        return self.prefixes[marker - 1] + suffix if marker else suffix
+
+
+class RecordCodec:
+    """
+    Stores dicts with a fixed set of string fields as one UTF-8 bytes object
+    (fields joined by a unit separator) instead of a dict of separate strings.
+    Missing (None) fields are stored as a NUL marker, so they stay distinct from
+    empty strings.
+    Args:
+        fields (tuple[str]): Field order in the stored record.
+    """
+    SEPARATOR = "\x1f"
+    MISSING = "\0"
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+
+    def _encode_field(self, value):
+        if value is None:
+            return self.MISSING
+        return str(value).replace(self.SEPARATOR, " ").replace(self.MISSING, "")
+
+    def encode(self, value):
+        return self.SEPARATOR.join(self._encode_field(value.get(field)) for field in self.fields).encode()
+
+    def decode(self, stored):
+        return {field: None if part == self.MISSING else part
+                for field, part in zip(self.fields, stored.decode().split(self.SEPARATOR))}
+
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_cache (
+    namespace TEXT NOT NULL,
+    key NOT NULL,
+    value NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+"""
+
+
+class SharedCacheStore:
+    """
+    Second cache tier in a SQLite file shared by the bot's worker processes, so an
+    entry fetched by one worker is a hit for the others. Values are stored encoded,
+    exactly as the in-process caches hold them. Methods are blocking; the caches run
+    them on ``io_pool``.
+    Args:
+        database (storage.Database): Database holding the table.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def _ready(self):
+        self.db.ensure_schema("shared_cache", SHARED_SCHEMA)
+        return self.db
+
+    def get(self, namespace, key, max_age) -> tuple | None:
+        """``(value, stored_at)`` of a live entry, or None."""
+        rows = self._ready().execute(
+            "SELECT value, stored_at FROM shared_cache WHERE namespace = ? AND key = ? AND stored_at > ?",
+            (namespace, key, time.time() - max_age))
+        return rows[0] if rows else None
+
+    def set(self, namespace, key, value, stored_at) -> None:
+        self._ready().execute(
+            "INSERT OR REPLACE INTO shared_cache (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, stored_at))
+
+    def delete(self, namespace, key) -> None:
+        self._ready().execute("DELETE FROM shared_cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear_expired(self, namespace, max_age) -> int:
+        return self._ready().executemany(
+            "DELETE FROM shared_cache WHERE namespace = ? AND stored_at <= ?", [(namespace, time.time() - max_age)])
+
+
+class CacheWithExpiry:
+    """
+    Async cache with a fixed expiry, stored column-wise to keep per-entry overhead low:
+    ``_index`` maps the (encoded) key to a slot, ``_values`` holds the (encoded) values
+    and ``_timestamps`` is a packed array of insert times. Freed slots are reused.
+    Args:
+        expiry_seconds (int): Entry lifetime.
+        key_codec: Optional object with ``encode(key)``; keys are stored encoded.
+        value_codec: Optional object with ``encode(value)`` and ``decode(stored)``.
+        shared (SharedCacheStore): Optional tier shared with other processes: looked up
+            on a local miss and written through on ``set``.
+        namespace (str): This cache's name in the shared tier.
+        shared_key: Optional ``key -> key`` for the shared tier, for keys whose local
+            encoding only means something inside this process.
+    """
+
+    def __init__(self, expiry_seconds, key_codec=None, value_codec=None, shared=None, namespace=None, shared_key=None):
+        self.expiry_seconds = expiry_seconds
+        self._key_codec = key_codec
+        self._value_codec = value_codec
+        self._shared = shared
+        self._namespace = namespace
+        self._shared_key = shared_key
+        self._index = {}
+        self._values = []
+        self._timestamps = array('d')
+        self._free_slots = []
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def _encode_key(self, key):
+        return self._key_codec.encode(key) if self._key_codec else key
+
+    def _release(self, stored_key, slot):
+        del self._index[stored_key]
+        self._values[slot] = None
+        self._free_slots.append(slot)
+
+    def _put(self, stored_key, stored, stored_at):
+        slot = self._index.get(stored_key)
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = len(self._values)
+                self._values.append(None)
+                self._timestamps.append(0.0)
+            self._index[stored_key] = slot
+        self._values[slot] = stored
+        self._timestamps[slot] = stored_at
+
+    async def _run_shared(self, method, *args):
+        # The shared tier is only an optimisation: a failure is a miss, never an error.
+        try:
+            return await io_pool.run(method, self._namespace, *args)
+        except Exception as e:
+            logger.warning("Shared cache %s unavailable: %s", self._namespace, e)
+            return None
+
+    async def get(self, key):
+        stored_key = self._encode_key(key)
+        async with self._lock:
+            slot = self._index.get(stored_key)
+            if slot is not None:
+                if time.time() - self._timestamps[slot] < self.expiry_seconds:
+                    logger.debug("Cache hit for key: %s", key)
+                    self.hits += 1
+                    stored = self._values[slot]
+                    return self._value_codec.decode(stored) if self._value_codec else stored
+                else:
+                    logger.debug("Cache expired for key: %s", key)
+                    self._release(stored_key, slot)
+
+        if self._shared is not None:
+            found = await self._run_shared(self._shared.get, self._shared_key_for(key, stored_key), self.expiry_seconds)
+            if found is not None:
+                stored, stored_at = found
+                async with self._lock:
+                    # Keep the original insert time, so the entry expires everywhere at once.
+                    self._put(stored_key, stored, stored_at)
+                logger.debug("Shared cache hit for key: %s", key)
+                self.hits += 1
+                self.shared_hits += 1
+                return self._value_codec.decode(stored) if self._value_codec else stored
+
+        logger.debug("Cache miss for key: %s", key)
+        self.misses += 1
+        return None
+
+    async def set(self, key, value):
+        stored_key = self._encode_key(key)
+        stored = self._value_codec.encode(value) if self._value_codec else value
+        stored_at = time.time()
+        async with self._lock:
+            self._put(stored_key, stored, stored_at)
+            logger.debug("Cached value for key: %s", key)
+        if self._shared is not None:
+            await self._run_shared(self._shared.set, self._shared_key_for(key, stored_key), stored, stored_at)
+
+    async def delete(self, key):
+        stored_key = self._encode_key(key)
+        async with self._lock:
+            slot = self._index.get(stored_key)
+            if slot is not None:
+                self._release(stored_key, slot)
+        if self._shared is not None:
+            await self._run_shared(self._shared.delete, self._shared_key_for(key, stored_key))
+
+    def _shared_key_for(self, key, stored_key):
+        return self._shared_key(key) if self._shared_key else stored_key
+
+    async def clear_expired(self):
+        async with self._lock:
+            cutoff = time.time() - self.expiry_seconds
+            timestamps = self._timestamps
+            expired = [(k, slot) for k, slot in self._index.items() if timestamps[slot] <= cutoff]
+            for stored_key, slot in expired:
+                self._release(stored_key, slot)
+            if not self._index:
+                # Everything expired: drop the columns instead of keeping empty slots around.
+                self._values = []
+                self._timestamps = array('d')
+                self._free_slots = []
+        if self._shared is not None:
+            await self._run_shared(self._shared.clear_expired, self.expiry_seconds)
+        return len(expired)
@@ -1,33 +1,277 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+"""Warm headless-browser pool for reading a product's price and coin discount.
+
+A library API: the bot itself does not use it (prices come from the AliExpress
+API or the page state embedded in the product HTML, see aliexpress_utils), so
+the bot needs no browser. Code that wants a rendered price awaits
+``get_browser_pool().get_coins_price(url)`` and calls ``close()`` on the pool
+at shutdown; ``python -m loadtest.browser_check`` exercises it against local
+fixtures.
+"""
+import asyncio
+import logging
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import CacheWithExpiry
+
+logger = logging.getLogger(__name__)
+
+PRICE_SELECTOR = "span.product-price-value"
+COINS_XPATH = "//span[contains(text(),'Coins to save')]"
+
+COIN_BROWSER_POOL_SIZE = int(os.getenv('COIN_BROWSER_POOL_SIZE', '2'))
+COIN_BROWSER_JOB_TIMEOUT = float(os.getenv('COIN_BROWSER_JOB_TIMEOUT', '20'))
+COIN_BROWSER_RECYCLE_AFTER = int(os.getenv('COIN_BROWSER_RECYCLE_AFTER', '100'))
+COIN_PRICE_CACHE_SECONDS = int(os.getenv('COIN_PRICE_CACHE_SECONDS', str(30 * 60)))
+
+
+def create_chrome_driver():
+    # Selenium is only imported when a browser is actually started.
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
 
-def get_coins_price(url):
     options = Options()
     options.add_argument('--headless')
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--blink-settings=imagesEnabled=false')
+    return webdriver.Chrome(options=options)
+
 
-    driver = webdriver.Chrome(options=options)
+def read_coins_price(driver, url, timeout):
+    """
+    Load a product page in the driver's current tab and read the price.
+    Args:
+        driver: Selenium WebDriver to use.
+        url (str): Product (or short link) URL.
+        timeout (float): Seconds for the page load and the price element together.
+    Returns:
+        dict: {'price', 'coins_discount', 'url'} or None if no price appeared in time.
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
 
+    ends_at = time.monotonic() + timeout
+    driver.set_page_load_timeout(timeout)
+    driver.get(url)
     try:
-        driver.get(url)
-        time.sleep(5)
+        # Explicit wait on the price element instead of a fixed sleep, for what the load left.
+        price_element = WebDriverWait(driver, max(ends_at - time.monotonic(), 0), poll_frequency=0.1).until(
+            EC.visibility_of_element_located((By.CSS_SELECTOR, PRICE_SELECTOR))
+        )
+    except TimeoutException:
+        return None
+
+    coins_elements = driver.find_elements(By.XPATH, COINS_XPATH)
+    return {
+        'price': price_element.text.strip(),
+        'coins_discount': coins_elements[0].text.strip() if coins_elements else None,
+        'url': driver.current_url,
+    }
+
+
+class _BrowserWorker:
+    """One warm browser with its own thread (WebDriver is not thread-safe) and a reused tab."""
+
+    def __init__(self, index, driver_factory):
+        self.index = index
+        self._driver_factory = driver_factory
+        self._thread = self._new_thread()
+        self.driver = None
+        self.pages_served = 0
+
+    def _new_thread(self):
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"coin-browser-{self.index}")
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._thread, fn, *args)
+
+    def _launch(self):
+        self.driver = self._driver_factory()
+        self.pages_served = 0
+
+    def _quit(self):
+        driver, self.driver = self.driver, None
+        self._quit_driver(driver)
+
+    def _quit_driver(self, driver):
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception as e:
+                logger.warning("Error closing browser %s: %s", self.index, e)
+
+    def _recycle(self):
+        self._quit()
+        self._launch()
+
+    async def start(self):
+        await self.run(self._launch)
+
+    async def recycle(self):
+        logger.info("Recycling browser %s after %s pages", self.index, self.pages_served)
+        await self.run(self._recycle)
 
-        # Récupère le prix (ajuste les sélecteurs selon le produit)
-        price = driver.find_element("css selector", "span.product-price-value").text
-        print("Prix normal :", price)
+    async def reset(self):
+        """
+        Replace a browser whose thread is stuck on a page: the driver is quit from another
+        thread (which also fails the stuck call) and the new one gets a fresh thread, so it
+        does not wait behind the stuck job.
+        """
+        logger.info("Restarting stuck browser %s", self.index)
+        driver, self.driver = self.driver, None
+        stuck, self._thread = self._thread, self._new_thread()
+        stuck.shutdown(wait=False)
+        await asyncio.get_running_loop().run_in_executor(None, self._quit_driver, driver)
+        await self.run(self._launch)
 
+    async def close(self):
+        await self.run(self._quit)
+        self._thread.shutdown(wait=False)
+
+    def _check(self, url, timeout):
+        if self.driver is None:
+            self._launch()
+        try:
+            return read_coins_price(self.driver, url, timeout)
+        finally:
+            self.pages_served += 1
+            try:
+                # Free the page's memory but keep the tab for the next job.
+                self.driver.get("about:blank")
+            except Exception:
+                pass
+
+
+class BrowserPool:
+    """
+    Fixed pool of warm headless browsers for coin-price checks.
+    Args:
+        size (int): Number of browser instances.
+        job_timeout (float): Per-job budget in seconds (page load + explicit wait).
+        recycle_after (int): Restart a browser after this many pages.
+        cache_seconds (int): How long a result is served from cache.
+        driver_factory (callable): Returns a new WebDriver; defaults to headless Chrome.
+    """
+
+    def __init__(self, size=COIN_BROWSER_POOL_SIZE, job_timeout=COIN_BROWSER_JOB_TIMEOUT,
+                 recycle_after=COIN_BROWSER_RECYCLE_AFTER, cache_seconds=COIN_PRICE_CACHE_SECONDS,
+                 driver_factory=create_chrome_driver):
+        self.size = size
+        self.job_timeout = job_timeout
+        self.recycle_after = recycle_after
+        self.cache = CacheWithExpiry(cache_seconds)
+        self._driver_factory = driver_factory
+        self._workers = []
+        self._idle = None
+        self._in_flight = {}
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            self._workers = [_BrowserWorker(i, self._driver_factory) for i in range(self.size)]
+            results = await asyncio.gather(*(w.start() for w in self._workers), return_exceptions=True)
+            self._idle = asyncio.Queue()
+            for worker, result in zip(self._workers, results):
+                if isinstance(result, Exception):
+                    # Launched lazily on its first job instead.
+                    logger.error("Could not start browser %s: %s", worker.index, result)
+                self._idle.put_nowait(worker)
+            logger.info("Browser pool started with %s browsers", self.size)
+
+    async def close(self):
+        if self._idle is None:
+            return
+        await asyncio.gather(*(w.close() for w in self._workers), return_exceptions=True)
+        self._workers = []
+        self._idle = None
+
+    async def get_coins_price(self, url):
+        """
+        Price and coin discount for a product URL, from cache or a pooled browser.
+        Returns:
+            dict: {'price', 'coins_discount', 'url'} or None on failure/timeout.
+        """
+        cached = await self.cache.get(url)
+        if cached:
+            return cached
+
+        # Concurrent requests for the same URL share one browser job.
+        pending = self._in_flight.get(url)
+        if pending is None:
+            pending = asyncio.ensure_future(self._check(url))
+            self._in_flight[url] = pending
+            pending.add_done_callback(lambda _: self._in_flight.pop(url, None))
+        return await asyncio.shield(pending)
+
+    async def _check(self, url):
+        await self.start()
+        worker = await self._idle.get()
+        recycle = stuck = False
+        try:
+            result = await asyncio.wait_for(worker.run(worker._check, url, self.job_timeout), self.job_timeout + 5)
+            if result:
+                await self.cache.set(url, result)
+            else:
+                logger.warning("No price found for %s within %ss", url, self.job_timeout)
+            recycle = worker.pages_served >= self.recycle_after
+            return result
+        except asyncio.TimeoutError:
+            # The browser thread may still be stuck on the page; start a fresh one.
+            logger.error("Coin price job timed out for %s", url)
+            recycle = stuck = True
+            return None
+        except Exception as e:
+            logger.error("Coin price job failed for %s: %s", url, e)
+            recycle = True
+            return None
+        finally:
+            if recycle:
+                # Restarting can take seconds; do it off the caller's path.
+                asyncio.ensure_future(self._recycle_and_release(worker, stuck))
+            else:
+                self._idle.put_nowait(worker)
+
+    async def _recycle_and_release(self, worker, stuck=False):
+        try:
+            await (worker.reset() if stuck else worker.recycle())
+        except Exception as e:
+            logger.error("Could not restart browser %s: %s", worker.index, e)
+        if self._idle is not None:
+            self._idle.put_nowait(worker)
+
+
+_pool = None
+
+
+def get_browser_pool():
+    """Process-wide BrowserPool configured from the environment (started on first use)."""
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool()
+    return _pool
+
+
+def get_coins_price(url):
+    """Blocking one-off check for scripts; async code should await get_browser_pool().get_coins_price()."""
+    async def _check_once():
+        pool = BrowserPool(size=1)
         try:
-            coins_discount = driver.find_element("xpath", "//span[contains(text(),'Coins to save')]").text
-            print("Réduction coins :", coins_discount)
-        except:
-            print("Pas de réduction coins affichée.")
+            return await pool.get_coins_price(url)
+        finally:
+            await pool.close()
 
-    except Exception as e:
-        print("Erreur :", e)
-    finally:
-        driver.quit()
+    started = time.perf_counter()
+    result = asyncio.run(_check_once())
+    logger.info("Coin price check for %s took %.1fs: %s", url, time.perf_counter() - started, result)
+    return result
 
 # Exemple d'utilisation
-get_coins_price("https://s.click.aliexpress.com/e/_oms0bBH")
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+    get_coins_price("https://s.click.aliexpress.com/e/_oms0bBH")
@@ -0,0 +1,78 @@
+"""Per-update latency budgets.
+
+``with budget(20):`` sets a deadline for everything the update awaits; nested
+budgets can only shorten it. The deadline lives in a ContextVar, so it follows
+the update into the tasks it creates. Each stage asks for the time that is
+left instead of using its own fixed timeout:
+
+    timeout = timeout_for(API_TIMEOUT)          # min(cap, remaining)
+    result = await within(fetch(...), default=None)
+
+Work shared between updates (micro-batches, de-duplicated requests) must not
+inherit the deadline of whichever update started it; start it with
+``detached()``, and each waiter bounds its own wait with ``within()``.
+"""
+import asyncio
+import contextlib
+import contextvars
+import time
+
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current budget, or None outside of any budget."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout_for(cap: float | None, floor: float = 0.0) -> float | None:
+    """The stage timeout: ``cap`` limited to the time left (but not below ``floor``)."""
+    left = remaining()
+    if left is None:
+        return cap
+    left = max(floor, left)
+    return left if cap is None else min(cap, left)
+
+
+@contextlib.contextmanager
+def budget(seconds: float | None):
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + max(0.0, seconds)
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+async def within(awaitable, cap: float | None = None, default=None):
+    """Await ``awaitable`` for at most ``timeout_for(cap)``; on timeout it is cancelled and ``default`` returned."""
+    timeout = timeout_for(cap)
+    if timeout is not None and timeout <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        elif isinstance(awaitable, asyncio.Future):
+            awaitable.cancel()
+        return default
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        return default
+
+
+def detached(coro) -> asyncio.Task:
+    """Start ``coro`` as a task outside of the caller's budget."""
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return asyncio.get_running_loop().create_task(coro, context=context)
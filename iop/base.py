@@ -5,7 +5,6 @@ Created on 2018-03-21
 @author: xuteng.xt
 '''
 
-import requests
 import time
 import hmac
 import hashlib
@@ -14,24 +13,42 @@ import mimetypes
 import itertools
 import random
 import logging
+import logging.handlers
 import os
+import queue
+import atexit
+import functools
 from os.path import expanduser
 import socket
 import platform
 
-# dir = os.getenv('HOME')
-dir = expanduser("~")
-isExists = os.path.exists(dir + "/logs")
-if not isExists:
-    os.makedirs(dir + "/logs") 
 logger = logging.getLogger(__name__)
 logger.setLevel(level = logging.ERROR)
-handler = logging.FileHandler(dir + "/logs/iopsdk.log." + time.strftime("%Y-%m-%d", time.localtime()))
-handler.setLevel(logging.ERROR)
-# formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-formatter = logging.Formatter('%(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+_log_listener = None
+
+def init_logging(log_dir = None):
+    #===========================================================================
+    # Explicit, idempotent setup of the dated SDK error log (~/logs by default).
+    # Until it is called, SDK errors only propagate to the application's loggers.
+    # API threads only enqueue records; the file is written by a listener thread.
+    #===========================================================================
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+    if log_dir is None:
+        log_dir = os.path.join(expanduser("~"), "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    handler = logging.FileHandler(os.path.join(log_dir, "iopsdk.log." + time.strftime("%Y-%m-%d", time.localtime())))
+    handler.setLevel(logging.ERROR)
+    # formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    formatter = logging.Formatter('%(message)s')
+    handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    return _log_listener
 
 P_SDK_VERSION = "iop-sdk-python-20220609"
 
@@ -75,6 +92,26 @@ def sign(secret,api,parameters):
     return h.hexdigest().upper()
 
 
+class IopSigner(object):
+    #===========================================================================
+    # Precomputed signer: the HMAC keyed with the app secret is built once and
+    # copied for every request, so only the parameter string is hashed per call.
+    #===========================================================================
+    def __init__(self, secret):
+        self._template = hmac.new(secret.encode(encoding="utf-8"), digestmod=hashlib.sha256)
+
+    def sign(self, api, parameters, sorted_keys=None):
+        if sorted_keys is None:
+            sorted_keys = sorted(parameters)
+        parameters_str = "".join([f"{key}{parameters[key]}" for key in sorted_keys])
+        if("/" in api):
+            parameters_str = api + parameters_str
+
+        h = self._template.copy()
+        h.update(parameters_str.encode("utf-8"))
+        return h.hexdigest().upper()
+
+
 def mixStr(pstr):
     if(isinstance(pstr, str)):
         return pstr
@@ -83,13 +120,21 @@ def mixStr(pstr):
     else:
         return str(pstr)
 
+@functools.lru_cache(maxsize=1)
+def hostInfo():
+    # Resolved once per process: gethostbyname is a blocking DNS lookup.
+    try:
+        localIp = socket.gethostbyname(socket.gethostname())
+    except OSError:
+        localIp = "127.0.0.1"
+    return localIp, platform.platform()
+
 def logApiError(appkey, sdkVersion, requestUrl, code, message):
-    localIp = socket.gethostbyname(socket.gethostname())
-    platformType = platform.platform()
-    logger.error("%s^_^%s^_^%s^_^%s^_^%s^_^%s^_^%s^_^%s" % (
+    localIp, platformType = hostInfo()
+    logger.error("%s^_^%s^_^%s^_^%s^_^%s^_^%s^_^%s^_^%s",
         appkey, sdkVersion,
         time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
-        localIp, platformType, requestUrl, code, message))
+        localIp, platformType, requestUrl, code, message)
 
 class IopRequest(object):
     def __init__(self,api_pame,http_method = 'POST'):
@@ -132,46 +177,74 @@ class IopClient(object):
         self._app_key = app_key
         self._app_secret = app_secret
         self._timeout = timeout
-    
-    def execute(self, request,access_token = None):
-
-        sys_parameters = {
-            P_APPKEY: self._app_key,
+        self._signer = IopSigner(app_secret)
+        # System parameters that never change for this client, and the sorted
+        # signing order of system + API keys, memoised per API parameter layout.
+        self._static_parameters = {
+            P_APPKEY: app_key,
             P_SIGN_METHOD: "sha256",
-            P_TIMESTAMP: str(int(round(time.time()))) + '000',
             P_PARTNER_ID: P_SDK_VERSION,
-            P_METHOD: request._api_pame,
-            P_SIMPLIFY: request._simplify,
-            P_FORMAT:request._format
         }
-
-        if(self.log_level == P_LOG_LEVEL_DEBUG):
-            sys_parameters[P_DEBUG] = 'true'
+        self._key_orders = {}
+        self._timestamp_second = None
+        self._timestamp_str = None
+
+    def _timestamp(self):
+        # The gateway wants milliseconds but the SDK always sent whole seconds,
+        # so the string only has to be rebuilt once per second.
+        now = int(time.time())
+        if now != self._timestamp_second:
+            self._timestamp_str = str(now) + '000'
+            self._timestamp_second = now
+        return self._timestamp_str
+
+    def _prepare_parameters(self, request, access_token = None):
+        sign_parameter = self._static_parameters.copy()
+        sign_parameter[P_TIMESTAMP] = self._timestamp()
+        sign_parameter[P_METHOD] = request._api_pame
+        sign_parameter[P_SIMPLIFY] = request._simplify
+        sign_parameter[P_FORMAT] = request._format
+
+        debug = self.log_level == P_LOG_LEVEL_DEBUG
+        if(debug):
+            sign_parameter[P_DEBUG] = 'true'
 
         if(access_token):
-            sys_parameters[P_ACCESS_TOKEN] = access_token
+            sign_parameter[P_ACCESS_TOKEN] = access_token
 
-        application_parameter = request._api_params;
-
-        sign_parameter = sys_parameters.copy()
+        application_parameter = request._api_params
         sign_parameter.update(application_parameter)
 
-        sign_parameter[P_SIGN] = sign(self._app_secret,request._api_pame,sign_parameter)
+        layout = (tuple(application_parameter), debug, bool(access_token))
+        sorted_keys = self._key_orders.get(layout)
+        if sorted_keys is None:
+            sorted_keys = sorted(sign_parameter)
+            self._key_orders[layout] = sorted_keys
 
-        api_url = self._server_url
+        sign_parameter[P_SIGN] = self._signer.sign(request._api_pame, sign_parameter, sorted_keys)
+        return sign_parameter
 
-        full_url = api_url + "?";
-        for key in sign_parameter:
-            full_url += key + "=" + str(sign_parameter[key]) + "&";
-        full_url = full_url[0:-1]
+    def _full_url(self, sign_parameter):
+        # Only needed for error logging, so it is built lazily.
+        return self._server_url + "?" + "&".join([key + "=" + str(sign_parameter[key]) for key in sign_parameter])
+
+    def execute(self, request,access_token = None, timeout = None):
+        # Imported on first call so that importing the SDK stays cheap at startup.
+        import requests
+
+        sign_parameter = self._prepare_parameters(request, access_token)
+
+        api_url = self._server_url
+        # Per-call timeout (the caller's remaining budget), else the client default.
+        timeout = self._timeout if timeout is None else timeout
 
         try:
             if(request._http_method == 'POST' or len(request._file_params) != 0) :
-                r = requests.post(api_url,sign_parameter,files=request._file_params, timeout=self._timeout)
+                r = requests.post(api_url,sign_parameter,files=request._file_params, timeout=timeout)
             else:
-                r = requests.get(api_url,sign_parameter, timeout=self._timeout)
+                r = requests.get(api_url,sign_parameter, timeout=timeout)
         except Exception as err:
-            logApiError(self._app_key, P_SDK_VERSION, full_url, "HTTP_ERROR", str(err))
+            logApiError(self._app_key, P_SDK_VERSION, self._full_url(sign_parameter), "HTTP_ERROR", str(err))
             raise err
 
         response = IopResponse()
@@ -188,10 +261,10 @@ class IopClient(object):
             response.request_id = jsonobj[P_REQUEST_ID]
 
         if response.code is not None and response.code != "0":
-            logApiError(self._app_key, P_SDK_VERSION, full_url, response.code, response.message)
+            logApiError(self._app_key, P_SDK_VERSION, self._full_url(sign_parameter), response.code, response.message)
         else:
             if(self.log_level == P_LOG_LEVEL_DEBUG or self.log_level == P_LOG_LEVEL_INFO):
-                logApiError(self._app_key, P_SDK_VERSION, full_url, "", "")
+                logApiError(self._app_key, P_SDK_VERSION, self._full_url(sign_parameter), "", "")
 
         response.body = jsonobj
 
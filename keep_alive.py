@@ -2,21 +2,34 @@
 
 
 
-from flask import Flask
-
 from threading import Thread
 
-import requests
-
 import time
 
 
 
-app = Flask(__name__)
+# Flask and requests are imported inside the functions that use them, so
+# importing this module costs nothing until the web server actually starts.
+
+_app = None
+
+
+
+def get_app():
+
+    global _app
 
+    if _app is None:
+
+        from flask import Flask
+
+        _app = Flask(__name__)
+
+        _app.add_url_rule('/', 'home', home)
+
+    return _app
 
 
-@app.route('/')
 
 def home():
 
@@ -26,7 +39,7 @@ def home():
 
 def run():
 
-    app.run(host='0.0.0.0', port=8080)
+    get_app().run(host='0.0.0.0', port=8080)
 
 
 
@@ -40,6 +53,8 @@ def keep_alive():
 
 def self_ping():
 
+    import requests
+
     while True:
 
         try:
@@ -57,6 +72,8 @@ def self_ping():
 
 
 
-keep_alive()
+if __name__ == "__main__":
+
+    keep_alive()
 
-Thread(target=self_ping).start()		
+    Thread(target=self_ping).start()		
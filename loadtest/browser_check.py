@@ -0,0 +1,90 @@
+"""Exercise coins_price_checker.BrowserPool against local HTML fixtures.
+
+Serves ``loadtest/fixtures`` over a local HTTP server and runs concurrent
+coin-price jobs through a warm pool, checking the extracted values and
+reporting per-job latency. Needs Chrome and chromedriver on the machine.
+
+Usage:
+    python -m loadtest.browser_check --jobs 20 --pool-size 2
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import os
+import statistics
+import threading
+import time
+
+from coins_price_checker import BrowserPool
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fixtures() -> tuple[http.server.ThreadingHTTPServer, str]:
+    handler = functools.partial(_QuietHandler, directory=FIXTURES_DIR)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def run_checks(args: argparse.Namespace, base_url: str) -> int:
+    pool = BrowserPool(size=args.pool_size, job_timeout=args.timeout, recycle_after=args.recycle_after)
+    failures = 0
+    started = time.perf_counter()
+    await pool.start()
+    print(f"pool warm-up: {time.perf_counter() - started:.2f}s")
+
+    async def timed(url: str) -> tuple[float, dict | None]:
+        job_started = time.perf_counter()
+        result = await pool.get_coins_price(url)
+        return time.perf_counter() - job_started, result
+
+    try:
+        # Distinct query strings so every job really hits a browser, not the cache.
+        urls = [f"{base_url}/coin_product.html?job={i}" for i in range(args.jobs)]
+        timings = await asyncio.gather(*(timed(url) for url in urls))
+        for elapsed, result in timings:
+            if not result or result["price"] != "US $12.34" or result["coins_discount"] != "Coins to save US $1.85":
+                failures += 1
+                print(f"unexpected result: {result}")
+        latencies = [elapsed for elapsed, _ in timings]
+        print(f"{args.jobs} jobs: median {statistics.median(latencies):.2f}s, max {max(latencies):.2f}s")
+
+        cached_elapsed, _ = await timed(urls[0])
+        print(f"cached repeat: {cached_elapsed * 1000:.1f} ms")
+
+        missing_elapsed, missing = await timed(f"{base_url}/no_price.html")
+        if missing is not None:
+            failures += 1
+            print(f"expected no price for no_price.html, got {missing}")
+        print(f"page without price gave up after {missing_elapsed:.2f}s")
+    finally:
+        await pool.close()
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--recycle-after", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    server, base_url = serve_fixtures()
+    try:
+        failures = asyncio.run(run_checks(args, base_url))
+    finally:
+        server.shutdown()
+    print("OK" if not failures else f"{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,339 @@
+"""Local stand-ins for the services the bot talks to.
+
+* FakeAliExpressAPI  - the signed ``/sync`` gateway of api-sg.aliexpress.com
+  (``aliexpress.affiliate.productdetail.get``, ``aliexpress.affiliate.link.generate``
+  and ``aliexpress.affiliate.product.query``)
+* FakeRedirector     - s.click / a.aliexpress short links and the product pages they land on
+* FakeTelegramAPI    - the subset of the Bot API used by app.py
+
+Every server counts the calls it receives so the harness can report API calls
+per update. Latency and error rates are configurable per server.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+
+import iop
+
+
+async def _start_app(app: web.Application, host: str = "127.0.0.1") -> tuple[web.AppRunner, int]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, port
+
+
+class _FakeServer:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self.port = None
+        self._runner = None
+        self._random = random.Random(seed)
+
+    def build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def start(self) -> int:
+        self._runner, self.port = await _start_app(self.build_app())
+        return self.port
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _delay(self) -> None:
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _should_fail(self) -> bool:
+        return self.error_rate > 0 and self._random.random() < self.error_rate
+
+
+class FakeAliExpressAPI(_FakeServer):
+    def __init__(self, app_key: str, app_secret: str, **kwargs):
+        super().__init__(**kwargs)
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.bad_signatures = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/sync"
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/sync", self._handle_sync)
+        return app
+
+    async def _handle_sync(self, request: web.Request) -> web.Response:
+        params = dict(request.query)
+        if request.method == "POST":
+            params.update(await request.post())
+        method = params.get(iop.P_METHOD, "")
+        self.calls[method] += 1
+        await self._delay()
+
+        received_sign = params.pop(iop.P_SIGN, None)
+        if params.get(iop.P_APPKEY) != self.app_key or received_sign != iop.sign(self.app_secret, method, params):
+            self.bad_signatures += 1
+            return web.json_response(self._error("IncompleteSignature", "The request signature does not conform to platform standards"))
+
+        if self._should_fail():
+            return web.json_response(self._error("ApiCallLimit", "This ban will last for 1 more seconds"))
+
+        if method == "aliexpress.affiliate.productdetail.get":
+            return web.json_response(self._product_detail(params))
+        if method == "aliexpress.affiliate.link.generate":
+            return web.json_response(self._link_generate(params))
+        if method == "aliexpress.affiliate.product.query":
+            return web.json_response(self._product_query(params))
+        return web.json_response(self._error("InvalidApiPath", f"Unknown method {method}"))
+
+    def _error(self, code: str, msg: str) -> dict:
+        return {"error_response": {"code": code, "msg": msg, "request_id": self._request_id()}}
+
+    def _request_id(self) -> str:
+        return f"fake{self._random.getrandbits(40):x}"
+
+    @staticmethod
+    def product_record(product_id: str, currency: str = "USD") -> dict:
+        price = 1 + int(hashlib.md5(product_id.encode()).hexdigest()[:6], 16) % 10000 / 100
+        return {
+            "product_id": int(product_id),
+            "product_title": f"Load test product {product_id}",
+            "product_main_image_url": f"https://ae01.alicdn.com/kf/{product_id}.jpg",
+            "target_sale_price": f"{price:.2f}",
+            "target_sale_price_currency": currency,
+        }
+
+    def _product_detail(self, params: dict) -> dict:
+        currency = params.get("target_currency") or "USD"
+        products = [self.product_record(pid.strip(), currency)
+                    for pid in params.get("product_ids", "").split(",") if pid.strip().isdigit()]
+        return {
+            "aliexpress_affiliate_productdetail_get_response": {
+                "resp_result": {
+                    "resp_code": 200,
+                    "resp_msg": "Call succeeds",
+                    "result": {"current_record_count": len(products), "products": {"product": products}},
+                },
+                "request_id": self._request_id(),
+            }
+        }
+
+    def _product_query(self, params: dict, total: int = 95) -> dict:
+        # Deterministic results per keyword set: the same query always returns the same products.
+        seed = int(hashlib.md5(params.get("keywords", "").lower().encode()).hexdigest()[:8], 16) % 10**8
+        page_no, page_size = int(params.get("page_no", 1)), int(params.get("page_size", 20))
+        first = (page_no - 1) * page_size
+        products = []
+        for index in range(first, min(first + page_size, total)):
+            product_id = str(1005000000000000 + seed * 1000 + index)
+            record = self.product_record(product_id, params.get("target_currency") or "USD")
+            record["promotion_link"] = f"https://s.click.aliexpress.com/e/_fakeq{product_id[-8:]}"
+            products.append(record)
+        return {
+            "aliexpress_affiliate_product_query_response": {
+                "resp_result": {
+                    "resp_code": 200,
+                    "resp_msg": "Call succeeds",
+                    "result": {"current_page_no": page_no, "current_record_count": len(products),
+                               "total_record_count": total, "products": {"product": products}},
+                },
+                "request_id": self._request_id(),
+            }
+        }
+
+    def _link_generate(self, params: dict) -> dict:
+        links = []
+        for source_value in params.get("source_values", "").split(","):
+            if not source_value:
+                continue
+            digest = hashlib.sha1(source_value.encode()).hexdigest()[:10]
+            links.append({"source_value": source_value, "promotion_link": f"https://s.click.aliexpress.com/e/_fake{digest}"})
+        return {
+            "aliexpress_affiliate_link_generate_response": {
+                "resp_result": {
+                    "resp_code": 200,
+                    "resp_msg": "Call succeeds",
+                    "result": {"total_result_count": len(links), "promotion_links": {"promotion_link": links}},
+                },
+                "request_id": self._request_id(),
+            }
+        }
+
+
+# Bulk markup so fake product pages cost a realistic download and parse.
+PAGE_FILLER = '<div class="sku"><span>option</span></div>' * 2000
+
+
+class FakeRedirector(_FakeServer):
+    """Serves ``/e/_p<id>`` and ``/_p<id>`` short links, redirecting to ``/item/<id>.html``."""
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/e/{code}", self._handle_short)
+        app.router.add_get("/{code:_[\\w-]+}", self._handle_short)
+        app.router.add_get("/item/{product_id:\\d+}.html", self._handle_item)
+        return app
+
+    async def _handle_short(self, request: web.Request) -> web.Response:
+        self.calls["short_link"] += 1
+        await self._delay()
+        code = request.match_info["code"]
+        if self._should_fail() or not code.startswith("_p"):
+            return web.Response(status=404, text="not found")
+        product_id = code[2:].rstrip("/")
+        raise web.HTTPFound(f"http://www.aliexpress.com/item/{product_id}.html?_randl_shipto=US")
+
+    async def _handle_item(self, request: web.Request) -> web.Response:
+        self.calls["item_page"] += 1
+        product_id = request.match_info["product_id"]
+        # Pages carry validators like a CDN would; a matching If-None-Match gets a bodiless 304.
+        etag = f'"{hashlib.md5(product_id.encode()).hexdigest()[:16]}"'
+        headers = {"ETag": etag, "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+        if request.headers.get("If-None-Match") == etag:
+            self.calls["item_page_not_modified"] += 1
+            return web.Response(status=304, headers=headers)
+        await self._delay()
+        record = FakeAliExpressAPI.product_record(product_id)
+        state = json.dumps({"data": {"priceModule": {"formatedActivityPrice": f"US ${record['target_sale_price']}",
+                                                     "currencyCode": "USD"}}})
+        page = (f"<html><head><title>Product {product_id}</title>"
+                f"<meta property=\"og:title\" content=\"{record['product_title']} - AliExpress\">"
+                f"<meta property=\"og:image\" content=\"{record['product_main_image_url']}\"></head>"
+                f"<body><div id=\"root\">{PAGE_FILLER}</div>"
+                f"<script>window.runParams = {state};</script></body></html>")
+        return web.Response(text=page, content_type="text/html", headers=headers)
+
+
+class FakeTelegramAPI(_FakeServer):
+    """
+    Args:
+        blocked_chats: Chat IDs that blocked the bot (sends fail with 403).
+        flood_limit (int): Sends per second above which Telegram answers 429 (0 for no limit).
+    """
+
+    def __init__(self, token: str, blocked_chats=(), flood_limit: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.token = token
+        self.blocked_chats = set(blocked_chats)
+        self.flood_limit = flood_limit
+        self._message_id = 0
+        self._send_times = deque()
+        self.rejected = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/file/bot"
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle_method)
+        return app
+
+    def _message(self, chat_id, **fields) -> dict:
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+        }
+        message.update(fields)
+        return message
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        if request.match_info["token"] != self.token:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"}, status=401)
+
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = {}
+        if request.content_type == "application/json":
+            params = await request.json()
+        elif request.can_read_body:
+            params = dict(await request.post())
+        await self._delay()
+
+        chat_id = params.get("chat_id")
+        if self._should_fail() or (method.startswith("send") and self._flooded()):
+            self.rejected += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        if method.startswith("send") and chat_id is not None and int(chat_id) in self.blocked_chats:
+            return web.json_response({"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                                     status=403)
+
+        photo = [{"file_id": f"photo{self._message_id}", "file_unique_id": f"u{self._message_id}", "width": 1, "height": 1}]
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadTestBot", "username": "load_test_bot",
+                      "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": True}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(chat_id, text=str(params.get("text", "")))
+        elif method == "sendPhoto":
+            result = self._message(chat_id, photo=photo, caption=str(params.get("caption", "")))
+        elif method == "sendSticker":
+            result = self._message(chat_id, sticker={"file_id": "sticker", "file_unique_id": "sticker", "width": 1,
+                                                     "height": 1, "is_animated": False, "is_video": False, "type": "regular"})
+        elif method == "sendDocument":
+            result = self._message(chat_id, document={"file_id": f"doc{self._message_id}", "file_unique_id": "doc"})
+        elif method == "sendMediaGroup":
+            media = params.get("media") or "[]"
+            count = media.count('"type"') if isinstance(media, str) else len(media)
+            result = [self._message(chat_id, photo=photo, media_group_id="group") for _ in range(max(count, 1))]
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+    def _flooded(self) -> bool:
+        if not self.flood_limit:
+            return False
+        now = time.monotonic()
+        while self._send_times and now - self._send_times[0] >= 1.0:
+            self._send_times.popleft()
+        self._send_times.append(now)
+        return len(self._send_times) > self.flood_limit
+
+
+class FakeDNSResolver(AbstractResolver):
+    """Sends every *.aliexpress.* host to the local redirector, whatever port the URL asks for."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self._fallback = DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET):
+        if ".aliexpress." in f".{host}":
+            return [{
+                "hostname": host,
+                "host": "127.0.0.1",
+                "port": self.port,
+                "family": socket.AF_INET,
+                "proto": 0,
+                "flags": socket.AI_NUMERICHOST,
+            }]
+        return await self._fallback.resolve(host, port, family)
+
+    async def close(self) -> None:
+        await self._fallback.close()
@@ -0,0 +1,414 @@
+"""End-to-end load test for the bot against local fake services.
+
+Starts the fake AliExpress gateway, short-link redirector and Telegram Bot API
+from ``loadtest.fake_servers``, points app.py at them and replays a synthetic
+stream of text updates at a fixed arrival rate. Updates go through the
+application's update queue and app.py's update processor, as polled updates
+do, and their latency is measured from arrival to the end of their handler.
+
+With ``--workers N`` the stream is split by chat the way the supervisor
+routes it and replayed by N processes at once, each with its own fake
+services, sharing one cache file (multi-process mode, see supervisor.py).
+
+Usage:
+    python -m loadtest.harness --updates 2000 --rate 100 --api-latency 0.15
+    python -m loadtest.harness --json-out run.json --baseline baseline.json
+    python -m loadtest.harness --updates 4000 --rate 400 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import aiohttp
+
+from loadtest.fake_servers import FakeAliExpressAPI, FakeDNSResolver, FakeRedirector, FakeTelegramAPI
+
+BOT_TOKEN = "123456:LOADTEST"
+APP_KEY = "loadtest-key"
+APP_SECRET = "loadtest-secret"
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_message_text(rng: random.Random, product_pool: int, links_per_message: int, short_ratio: float) -> str:
+    links = []
+    for _ in range(links_per_message):
+        product_id = 1005000000000 + rng.randrange(product_pool)
+        if rng.random() < short_ratio:
+            links.append(f"http://s.click.aliexpress.com/e/_p{product_id}")
+        else:
+            links.append(f"https://www.aliexpress.com/item/{product_id}.html?spm=a2g0o.loadtest")
+    return "Check this deal " + " ".join(links)
+
+
+def build_update_payload(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load", "username": f"load{chat_id}"},
+            "text": text,
+        },
+    }
+
+
+def configure_environment(api_url: str) -> None:
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+        "ALIEXPRESS_APP_KEY": APP_KEY,
+        "ALIEXPRESS_APP_SECRET": APP_SECRET,
+        "ALIEXPRESS_TRACKING_ID": "loadtest",
+        "ALIEXPRESS_API_URL": api_url,
+    })
+
+
+class FakeServices:
+    def __init__(self, args: argparse.Namespace):
+        self.api = FakeAliExpressAPI(APP_KEY, APP_SECRET, latency=args.api_latency, jitter=args.api_jitter,
+                                     error_rate=args.api_error_rate, seed=args.seed)
+        self.redirector = FakeRedirector(latency=args.redirect_latency, error_rate=args.redirect_error_rate, seed=args.seed)
+        self.telegram = FakeTelegramAPI(BOT_TOKEN, latency=args.telegram_latency, seed=args.seed)
+
+    async def start(self) -> None:
+        await self.api.start()
+        await self.redirector.start()
+        await self.telegram.start()
+
+    async def stop(self) -> None:
+        await self.api.stop()
+        await self.redirector.stop()
+        await self.telegram.stop()
+
+
+async def build_application(app_module, services: FakeServices):
+    from telegram.ext import Application
+
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(services.telegram.base_url)
+        .base_file_url(services.telegram.base_file_url)
+        .concurrent_updates(app_module.update_processor)
+        .updater(None)
+        .build()
+    )
+    await application.initialize()
+    app_module.http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(resolver=FakeDNSResolver(services.redirector.port))
+    )
+    return application
+
+
+def build_schedule(args: argparse.Namespace) -> list[tuple[float, dict]]:
+    """``(seconds after start, update payload)`` for every update of the run."""
+    rng = random.Random(args.seed)
+    schedule = []
+    for index in range(args.updates):
+        text = build_message_text(rng, args.products, args.links_per_message, args.short_ratio)
+        chat_id = 1000 + rng.randrange(args.chats)
+        schedule.append((index / args.rate, build_update_payload(index + 1, chat_id, text)))
+    return schedule
+
+
+async def replay(app_module, application, schedule: list[tuple[float, dict]]) -> dict:
+    from telegram import Update
+    from telegram.ext import MessageHandler, filters
+
+    arrived = {}
+    latencies = []
+    errors = 0
+    finished = asyncio.Event()
+
+    async def handle(update, context) -> None:
+        try:
+            await app_module.dispatch_update(update, context)
+        finally:
+            latencies.append(time.perf_counter() - arrived.pop(update.update_id))
+            if not arrived and len(latencies) == len(schedule):
+                finished.set()
+
+    async def count_error(update, context) -> None:
+        nonlocal errors
+        errors += 1
+
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle))
+    application.add_error_handler(count_error)
+    await application.start()
+    try:
+        started = time.perf_counter()
+        for offset, payload in schedule:
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            arrived[payload["update_id"]] = time.perf_counter()
+            await application.update_queue.put(Update.de_json(payload, application.bot))
+        if schedule:
+            await finished.wait()
+        elapsed = time.perf_counter() - started
+    finally:
+        await application.stop()
+
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed,
+            "update_processor": app_module.update_processor.stats()}
+
+
+def cache_lookups(app_module) -> dict:
+    lookups = {}
+    for name in ("product_cache", "product_image_cache", "link_cache", "resolved_url_cache"):
+        cache = getattr(app_module, name, None)
+        if cache is None:
+            continue
+        lookups[name] = {"hits": cache.hits, "misses": cache.misses, "shared_hits": getattr(cache, "shared_hits", 0)}
+    return lookups
+
+
+def collect_run(run: dict, services: FakeServices, app_module) -> dict:
+    """Raw counters of one replay; ``merge_runs`` adds up those of several workers."""
+    return {
+        "latencies": run["latencies"],
+        "errors": run["errors"],
+        "elapsed": run["elapsed"],
+        "api_calls": dict(services.api.calls),
+        "bad_signatures": services.api.bad_signatures,
+        "telegram_calls": dict(services.telegram.calls),
+        "redirects": services.redirector.calls["short_link"],
+        "cache_lookups": cache_lookups(app_module),
+        "admission": dict(getattr(getattr(app_module, "admission", None), "admitted", {})),
+        "update_processor": run["update_processor"],
+        "pools": {name: pool.stats() for name, pool in (("io", getattr(app_module, "io_pool", None)),
+                                                         ("parse", getattr(app_module, "parse_pool", None))) if pool},
+    }
+
+
+def merge_runs(runs: list[dict]) -> dict:
+    def add(key: str) -> dict:
+        total = Counter()
+        for run in runs:
+            total.update(run[key])
+        return dict(total)
+
+    pools = {}
+    for name in {name for run in runs for name in run["pools"]}:
+        stats = [run["pools"][name] for run in runs if name in run["pools"]]
+        completed = sum(s["completed"] for s in stats)
+        pools[name] = {
+            "workers": sum(s["workers"] for s in stats),
+            "completed": completed,
+            "avg_wait_ms": round(sum(s["avg_wait_ms"] * s["completed"] for s in stats) / completed, 2) if completed else 0.0,
+            "max_wait_ms": max(s["max_wait_ms"] for s in stats),
+        }
+    processors = [run["update_processor"] for run in runs]
+    completed = sum(p["completed"] for p in processors)
+    update_processor = {
+        "concurrency": sum(p["concurrency"] for p in processors),
+        "completed": completed,
+        "avg_wait_ms": round(sum(p["avg_wait_ms"] * p["completed"] for p in processors) / completed, 2) if completed else 0.0,
+        "max_wait_ms": max(p["max_wait_ms"] for p in processors),
+    }
+    lookups = {}
+    for run in runs:
+        for name, counts in run["cache_lookups"].items():
+            lookups.setdefault(name, Counter()).update(counts)
+    return {
+        "latencies": [latency for run in runs for latency in run["latencies"]],
+        "errors": sum(run["errors"] for run in runs),
+        # Workers start together, so the run lasts as long as the slowest of them.
+        "elapsed": max(run["elapsed"] for run in runs),
+        "api_calls": add("api_calls"),
+        "bad_signatures": sum(run["bad_signatures"] for run in runs),
+        "telegram_calls": add("telegram_calls"),
+        "redirects": sum(run["redirects"] for run in runs),
+        "cache_lookups": {name: dict(counts) for name, counts in lookups.items()},
+        "admission": add("admission"),
+        "update_processor": update_processor,
+        "pools": pools,
+    }
+
+
+def build_report(args: argparse.Namespace, run: dict) -> dict:
+    latencies = run["latencies"]
+    updates = len(latencies) or 1
+    api_calls = sum(run["api_calls"].values())
+    telegram_calls = sum(run["telegram_calls"].values())
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json_out", "baseline")},
+        "updates": len(latencies),
+        "errors": run["errors"],
+        "elapsed_s": round(run["elapsed"], 3),
+        "throughput_ups": round(len(latencies) / run["elapsed"], 2) if run["elapsed"] else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p90": round(percentile(latencies, 90) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies, default=0.0) * 1000, 2),
+        },
+        "api_calls_per_update": round(api_calls / updates, 3),
+        "api_calls": run["api_calls"],
+        "bad_signatures": run["bad_signatures"],
+        "telegram_calls_per_update": round(telegram_calls / updates, 3),
+        "telegram_calls": run["telegram_calls"],
+        "redirects_per_update": round(run["redirects"] / updates, 3),
+        "cache_hit_ratio": {
+            name: round(counts["hits"] / (counts["hits"] + counts["misses"]), 4) if counts["hits"] + counts["misses"] else None
+            for name, counts in run["cache_lookups"].items()
+        },
+        "shared_cache_hits": sum(counts["shared_hits"] for counts in run["cache_lookups"].values()),
+        "admission": run["admission"],
+        "update_processor": {key: run["update_processor"][key] for key in ("concurrency", "completed", "avg_wait_ms", "max_wait_ms")},
+        "pools": run["pools"],
+    }
+
+
+def print_report(report: dict, baseline: dict | None = None) -> None:
+    def line(label: str, key_path: tuple, unit: str = "", lower_is_better: bool = True) -> None:
+        value = report
+        for key in key_path:
+            value = value[key]
+        text = f"{label:<32}{value}{unit}"
+        if baseline is not None:
+            base = baseline
+            try:
+                for key in key_path:
+                    base = base[key]
+            except (KeyError, TypeError):
+                base = None
+            if isinstance(base, (int, float)) and base:
+                change = (value - base) / base * 100
+                better = change < 0 if lower_is_better else change > 0
+                text += f"   (baseline {base}{unit}, {change:+.1f}%{' better' if better else ''})"
+        print(text)
+
+    print(f"Updates: {report['updates']}  errors: {report['errors']}  elapsed: {report['elapsed_s']}s")
+    line("Throughput", ("throughput_ups",), " upd/s", lower_is_better=False)
+    for pct in ("p50", "p90", "p99", "max"):
+        line(f"Latency {pct}", ("latency_ms", pct), " ms")
+    line("AliExpress calls/update", ("api_calls_per_update",))
+    line("Telegram calls/update", ("telegram_calls_per_update",))
+    line("Short-link hops/update", ("redirects_per_update",))
+    for name, ratio in report["cache_hit_ratio"].items():
+        print(f"{'Hit ratio ' + name:<32}{ratio}")
+    if report.get("shared_cache_hits"):
+        print(f"{'Hits from the shared cache':<32}{report['shared_cache_hits']}")
+    if report.get("admission"):
+        print(f"{'Admitted by mode':<32}" + ", ".join(f"{mode}={count}" for mode, count in report["admission"].items()))
+    if report.get("update_processor"):
+        stats = report["update_processor"]
+        print(f"{'Update queue':<32}avg wait {stats['avg_wait_ms']} ms, max wait {stats['max_wait_ms']} ms, "
+              f"{stats['concurrency']} slots")
+    for name, stats in report.get("pools", {}).items():
+        print(f"{'Pool ' + name:<32}avg wait {stats['avg_wait_ms']} ms, max wait {stats['max_wait_ms']} ms, {stats['completed']} jobs")
+    if report["bad_signatures"]:
+        print(f"WARNING: {report['bad_signatures']} requests failed signature verification")
+
+
+async def replay_with_services(args: argparse.Namespace, schedule: list[tuple[float, dict]], ready=None) -> dict:
+    services = FakeServices(args)
+    await services.start()
+    configure_environment(services.api.url)
+
+    import app as app_module
+    logging.getLogger().setLevel(args.log_level)
+
+    application = await build_application(app_module, services)
+    try:
+        if ready is not None:
+            # Workers only start replaying once every one of them is set up.
+            await asyncio.get_running_loop().run_in_executor(None, ready.wait)
+        run = await replay(app_module, application, schedule)
+    finally:
+        await app_module.http_session.close()
+        await application.shutdown()
+        await services.stop()
+    return collect_run(run, services, app_module)
+
+
+def _replay_shard(args: argparse.Namespace, schedule: list[tuple[float, dict]], ready, results) -> None:
+    # Runs in a worker process: its own event loop, app module and fake services.
+    results.put(asyncio.run(replay_with_services(args, schedule, ready)))
+
+
+def run_sharded(args: argparse.Namespace, schedule: list[tuple[float, dict]]) -> dict:
+    """Replay ``schedule`` split over ``args.workers`` processes, routed like the supervisor does."""
+    from supervisor import route_update
+
+    shards = [[] for _ in range(args.workers)]
+    for offset, payload in schedule:
+        shards[route_update(payload, args.workers)].append((offset, payload))
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(args.workers)
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.environ["SHARED_CACHE_PATH"] = os.path.join(work_dir, "shared.db")
+        processes = [context.Process(target=_replay_shard, args=(args, shard, ready, results)) for shard in shards]
+        for process in processes:
+            process.start()
+        runs = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    return merge_runs(runs)
+
+
+def run_load_test(args: argparse.Namespace) -> dict:
+    schedule = build_schedule(args)
+    if args.workers > 1:
+        return build_report(args, run_sharded(args, schedule))
+    return build_report(args, asyncio.run(replay_with_services(args, schedule)))
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=500, help="number of updates to replay")
+    parser.add_argument("--rate", type=float, default=50.0, help="arrival rate in updates per second")
+    parser.add_argument("--chats", type=int, default=200, help="number of distinct chats sending updates")
+    parser.add_argument("--products", type=int, default=300, help="size of the product ID pool (controls cache hits)")
+    parser.add_argument("--links-per-message", type=int, default=1)
+    parser.add_argument("--short-ratio", type=float, default=0.5, help="fraction of links sent as short links")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="AliExpress API latency in seconds")
+    parser.add_argument("--api-jitter", type=float, default=0.02)
+    parser.add_argument("--api-error-rate", type=float, default=0.0)
+    parser.add_argument("--redirect-latency", type=float, default=0.02)
+    parser.add_argument("--redirect-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, with updates sharded by chat")
+    parser.add_argument("--log-level", default="WARNING", help="log level for the bot while replaying")
+    parser.add_argument("--json-out", help="write the report as JSON to this path")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    report = run_load_test(args)
+    print_report(report, baseline)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Non-blocking logging for the bot.
+
+Log calls only put the record on an in-memory queue; formatting (unless an
+argument is mutable, see ``LazyQueueHandler``) and the actual I/O happen on a
+QueueListener thread, so neither the event loop nor the API
+worker threads ever wait on a stream or file. Hot-path messages go through
+sampled loggers (see ``sampled_logger``).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through ``extra=``.
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+# Argument types that cannot change between the log call and the listener thread formatting them.
+_IMMUTABLE_ARG_TYPES = (str, bytes, int, float, complex, type(None))
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues the record; message formatting is left to the listener thread when the
+    arguments are immutable scalars. Anything else (a dict, a list, an object the
+    caller may go on mutating) is formatted here, so the line shows its value at
+    the time of the call.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if not isinstance(record.msg, str) or (
+                args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in args))):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """Plain-text format with any ``extra=`` fields appended as key=value pairs."""
+
+    def format(self, record):
+        line = super().format(record)
+        extras = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and not k.startswith("_")}
+        if extras:
+            line += " | " + " ".join(f"{k}={v}" for k, v in extras.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including ``extra=`` fields."""
+
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        payload.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and not k.startswith("_")})
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes one in every ``every`` records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.every == 1:
+            return True
+        with self._lock:
+            self._count += 1
+            return self._count % self.every == 1
+
+
+def setup_logging(level=logging.INFO, fmt=DEFAULT_FORMAT, json_output=None):
+    """Route the root logger through a queue and start the listener thread.
+
+    Args:
+        level: Root log level.
+        fmt: Format string for text output.
+        json_output (bool): Emit JSON lines; defaults to ``LOG_FORMAT=json`` in the environment.
+    Returns:
+        logging.handlers.QueueListener: the running listener (stopped at exit).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if json_output is None:
+        json_output = os.getenv('LOG_FORMAT', '').lower() == 'json'
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if json_output else StructuredFormatter(fmt))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def sampled_logger(name, every):
+    """Return the logger ``name`` with a SamplingFilter keeping one in ``every`` info/debug records."""
+    logger = logging.getLogger(name)
+    for existing in logger.filters:
+        if isinstance(existing, SamplingFilter):
+            existing.every = max(1, int(every))
+            return logger
+    logger.addFilter(SamplingFilter(every))
+    return logger
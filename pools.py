@@ -0,0 +1,105 @@
+"""Execution pools for blocking work.
+
+* ``io_pool``    - threads for blocking network calls (AliExpress API, page downloads)
+* ``parse_pool`` - processes for CPU-heavy HTML parsing; jobs receive raw bytes so
+  BeautifulSoup never holds the GIL of the process running the event loop
+
+Both are created on first use and report queue depth and queue wait time.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS = int(os.getenv('IO_WORKERS', '10'))
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+
+def _timed_call(submitted_at, fn, *args):
+    # Runs in the worker (thread or process): the wall-clock gap is the time spent queued.
+    waited = time.time() - submitted_at
+    return waited, fn(*args)
+
+
+class InstrumentedPool:
+    """
+    Lazily started executor that tracks queue depth and wait time.
+    Args:
+        name (str): Name used in logs and stats.
+        factory (callable): ``max_workers -> Executor``.
+        max_workers (int): Worker count.
+    """
+
+    def __init__(self, name, factory, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self._factory = factory
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self._factory(self.max_workers)
+                    logger.info("Started %s pool with %s workers", self.name, self.max_workers)
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        self.submitted += 1
+        try:
+            waited, result = await loop.run_in_executor(self.executor, _timed_call, time.time(), fn, *args)
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+    def shutdown(self, wait=True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+io_pool = InstrumentedPool("io", lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="io"), IO_WORKERS)
+# Spawned, not forked: a forked worker would inherit the bot's threads, locks and sockets half-alive.
+# A spawned worker re-runs the parent's main script first; app.py hands that role to the ``app``
+# module (see its top), so parse workers only import this module and the parsing functions.
+parse_pool = InstrumentedPool(
+    "parse",
+    lambda workers: ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")),
+    PARSE_WORKERS,
+)
+
+
+def shutdown_pools(wait=True) -> None:
+    io_pool.shutdown(wait=wait)
+    parse_pool.shutdown(wait=wait)
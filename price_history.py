@@ -0,0 +1,166 @@
+"""Price history and watchlists for /watch.
+
+Each (product, locale) series is stored as two packed columns in the bot
+database: ``times`` (uint32 seconds) and ``prices`` (float32), 8 bytes per
+point. A point is only appended when the price changes, and series are capped
+at ``MAX_POINTS``, so a product watched for months stays a few hundred bytes.
+
+Watches reference products by ``(product_id, locale_key)``. The refresh job
+asks ``watched_products()`` for the distinct products per locale, so its cost
+depends on how many products are watched and not on how many users watch them.
+"""
+import logging
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MAX_POINTS = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watches (
+    chat_id INTEGER NOT NULL,
+    product_id TEXT NOT NULL,
+    locale_key TEXT NOT NULL,
+    title TEXT,
+    threshold REAL NOT NULL,
+    notified_price REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, product_id)
+);
+CREATE INDEX IF NOT EXISTS watches_by_product ON watches (locale_key, product_id);
+CREATE TABLE IF NOT EXISTS price_series (
+    product_id TEXT NOT NULL,
+    locale_key TEXT NOT NULL,
+    times BLOB NOT NULL,
+    prices BLOB NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (product_id, locale_key)
+);
+"""
+
+
+def parse_price(value) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def _columns(times_blob=b"", prices_blob=b"") -> tuple[array, array]:
+    times, prices = array('I'), array('f')
+    times.frombytes(times_blob)
+    prices.frombytes(prices_blob)
+    return times, prices
+
+
+class PriceHistoryStore:
+    """
+    Watches and price series. Methods are blocking; run them on ``io_pool``.
+    Args:
+        database (storage.Database): Database holding the tables.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def _ready(self):
+        self.db.ensure_schema("price_history", SCHEMA)
+        return self.db
+
+    def add_watch(self, chat_id, product_id, locale_key, title, threshold) -> None:
+        self._ready().execute(
+            "INSERT OR REPLACE INTO watches (chat_id, product_id, locale_key, title, threshold, notified_price, created_at) "
+            "VALUES (?, ?, ?, ?, ?, NULL, ?)",
+            (chat_id, product_id, locale_key, title, threshold, time.time()))
+
+    def remove_watch(self, chat_id, product_id) -> bool:
+        db = self._ready()
+        found = db.execute("SELECT 1 FROM watches WHERE chat_id = ? AND product_id = ?", (chat_id, product_id))
+        db.execute("DELETE FROM watches WHERE chat_id = ? AND product_id = ?", (chat_id, product_id))
+        return bool(found)
+
+    def remove_chat(self, chat_id) -> None:
+        self._ready().execute("DELETE FROM watches WHERE chat_id = ?", (chat_id,))
+
+    def count_watches(self, chat_id) -> int:
+        return self._ready().execute("SELECT COUNT(*) FROM watches WHERE chat_id = ?", (chat_id,))[0][0]
+
+    def list_watches(self, chat_id) -> list[dict]:
+        """The chat's watches with the latest and lowest recorded price of each."""
+        rows = self._ready().execute(
+            "SELECT w.product_id, w.locale_key, w.title, w.threshold, s.prices FROM watches w "
+            "LEFT JOIN price_series s ON s.product_id = w.product_id AND s.locale_key = w.locale_key "
+            "WHERE w.chat_id = ? ORDER BY w.created_at", (chat_id,))
+        watches = []
+        for product_id, locale_key, title, threshold, prices_blob in rows:
+            _, prices = _columns(b"", prices_blob or b"")
+            watches.append({
+                'product_id': product_id, 'locale_key': locale_key, 'title': title, 'threshold': threshold,
+                'price': prices[-1] if prices else None, 'lowest': min(prices) if prices else None,
+            })
+        return watches
+
+    def watched_products(self) -> dict[str, list[str]]:
+        """Distinct watched product IDs per locale key."""
+        watched = {}
+        for locale_key, product_id in self._ready().execute(
+                "SELECT DISTINCT locale_key, product_id FROM watches ORDER BY locale_key"):
+            watched.setdefault(locale_key, []).append(product_id)
+        return watched
+
+    def record_prices(self, locale_key, prices, now=None) -> int:
+        """Append the new prices (``{product_id: price}``) of one locale; returns the points added."""
+        db = self._ready()
+        now = int(now or time.time())
+        product_ids = [product_id for product_id, price in prices.items() if price is not None]
+        if not product_ids:
+            return 0
+        placeholders = ",".join("?" * len(product_ids))
+        stored = {row[0]: row[1:] for row in db.execute(
+            f"SELECT product_id, times, prices FROM price_series WHERE locale_key = ? AND product_id IN ({placeholders})",
+            (locale_key, *product_ids))}
+
+        rows = []
+        added = 0
+        for product_id in product_ids:
+            times, series = _columns(*stored.get(product_id, (b"", b"")))
+            price = prices[product_id]
+            if not series or abs(series[-1] - price) >= 0.005:
+                times.append(now)
+                series.append(price)
+                added += 1
+                if len(series) > MAX_POINTS:
+                    del times[:-MAX_POINTS]
+                    del series[:-MAX_POINTS]
+            rows.append((product_id, locale_key, times.tobytes(), series.tobytes(), now))
+        db.executemany("INSERT OR REPLACE INTO price_series (product_id, locale_key, times, prices, checked_at) "
+                       "VALUES (?, ?, ?, ?, ?)", rows)
+        return added
+
+    def history(self, product_id, locale_key) -> tuple[array, array]:
+        """``(times, prices)`` columns of one series (empty if never recorded)."""
+        rows = self._ready().execute(
+            "SELECT times, prices FROM price_series WHERE product_id = ? AND locale_key = ?", (product_id, locale_key))
+        return _columns(*rows[0]) if rows else _columns()
+
+    def due_alerts(self, locale_key, prices) -> list[tuple]:
+        """``(chat_id, product_id, title, price)`` for watches whose threshold the new price reached."""
+        db = self._ready()
+        alerts = []
+        for product_id, price in prices.items():
+            if price is None:
+                continue
+            # Notify once per new low: not again until the price falls below the last alert.
+            rows = db.execute(
+                "SELECT chat_id, title FROM watches WHERE locale_key = ? AND product_id = ? AND threshold >= ? "
+                "AND (notified_price IS NULL OR notified_price > ?)", (locale_key, product_id, price, price))
+            alerts.extend((chat_id, product_id, title, price) for chat_id, title in rows)
+        return alerts
+
+    def mark_notified(self, alerts) -> None:
+        self._ready().executemany(
+            "UPDATE watches SET notified_price = ? WHERE chat_id = ? AND product_id = ?",
+            [(price, chat_id, product_id) for chat_id, product_id, _, price in alerts])
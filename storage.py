@@ -0,0 +1,71 @@
+"""SQLite storage for the bot's persistent state.
+
+One database file (``BOT_DB_PATH``, ``cache/bot.db`` by default) holds every
+table; each feature creates its own tables through ``Database.ensure_schema``.
+Calls are blocking, so the bot runs them on ``pools.io_pool``:
+
+    rows = await io_pool.run(db.execute, "SELECT ...", params)
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+BOT_DB_PATH = os.getenv('BOT_DB_PATH', os.path.join('cache', 'bot.db'))
+
+
+class Database:
+    """
+    Lazily opened SQLite connection shared by the io pool threads.
+    Args:
+        path (str): Database file; its directory is created if missing.
+    """
+
+    def __init__(self, path=BOT_DB_PATH):
+        self.path = path
+        self._connection = None
+        self._schemas = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit; multi-statement writes go through executemany/executescript.
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            logger.info("Opened database %s", self.path)
+        return self._connection
+
+    def ensure_schema(self, name, script):
+        """Run a feature's ``CREATE ... IF NOT EXISTS`` script once per process."""
+        with self._lock:
+            if name not in self._schemas:
+                self._connect().executescript(script)
+                self._schemas.add(name)
+
+    def execute(self, sql, params=()) -> list:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def executemany(self, sql, rows) -> int:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                # One transaction for the whole batch instead of one per row.
+                connection.execute("BEGIN")
+                return connection.executemany(sql, rows).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+                self._schemas.clear()
+
+
+db = Database()
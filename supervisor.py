@@ -0,0 +1,197 @@
+"""Multi-process mode: one poller, N chat-sharded worker processes.
+
+With ``BOT_WORKERS`` above 1 the bot's main process only long-polls Telegram
+and hands every update to one of N worker processes, each running the full
+application on its own event loop (and CPU core):
+
+    poller --getUpdates--> route_update() --> queue[i] --> worker i
+
+Updates are routed by a hash of their chat ID, so all updates of a chat go to
+the same worker, which processes them in order. Commands that drive bot-wide
+state (``/broadcast``) and updates without a chat go to ``PRIMARY_WORKER``,
+which is also the only worker running the background jobs (broadcast resume,
+price watch refresh). The product, link and short-link caches get a second
+tier in a SQLite file shared by the workers (see ``cache.SharedCacheStore``),
+so a product fetched by one worker is a cache hit for the others. Per-user
+settings (``/locale``) are read from the bot database, not from
+python-telegram-bot's per-process ``user_data``. A user's group chats and
+callbacks can route to another worker than their private chat, and every
+worker sees the same settings (see ``user_settings.py``).
+
+A worker that dies is restarted on the same queue; the updates it was
+processing at the time are lost, the ones still queued are not.
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+import zlib
+from datetime import timedelta
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_WORKER = 0
+POLL_TIMEOUT = 50
+# Commands that must reach the worker owning the bot-wide state they act on.
+PRIMARY_COMMANDS = ("/broadcast",)
+_STOP = None
+
+
+def update_chat_id(payload: dict) -> int | None:
+    """The chat an update belongs to (the sender's ID for inline queries), or None."""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member",
+                  "chat_member", "chat_join_request"):
+        item = payload.get(field)
+        if item:
+            return item["chat"]["id"]
+    callback_query = payload.get("callback_query")
+    if callback_query:
+        message = callback_query.get("message")
+        return message["chat"]["id"] if message else callback_query["from"]["id"]
+    for field in ("inline_query", "chosen_inline_result", "pre_checkout_query", "shipping_query"):
+        item = payload.get(field)
+        if item:
+            return item["from"]["id"]
+    return None
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    # crc32 of the decimal ID: stable across processes and restarts, unlike hash() of a str.
+    return zlib.crc32(str(chat_id).encode()) % workers
+
+
+def route_update(payload: dict, workers: int) -> int:
+    """Index of the worker that processes ``payload``."""
+    message = payload.get("message") or {}
+    text = message.get("text") or ""
+    if text.startswith(PRIMARY_COMMANDS):
+        return PRIMARY_WORKER
+    chat_id = update_chat_id(payload)
+    return PRIMARY_WORKER if chat_id is None else shard_for(chat_id, workers)
+
+
+async def serve_worker(application, updates) -> None:
+    """
+    Run ``application`` (built without an updater) on the updates arriving on ``updates``
+    until the supervisor sends the stop marker.
+    """
+    loop = asyncio.get_running_loop()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        while True:
+            payload = await loop.run_in_executor(None, updates.get)
+            if payload is _STOP:
+                break
+            await application.update_queue.put(Update.de_json(payload, application.bot))
+    finally:
+        # Processes what is still queued before returning.
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def _worker_main(target, index, updates) -> None:
+    # Ctrl+C reaches the whole process group: the supervisor stops workers through their queue.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(index, updates)
+
+
+class Supervisor:
+    """
+    Polls Telegram and routes updates to worker processes.
+    Args:
+        token (str): Bot token.
+        workers (int): Number of worker processes.
+        target: ``(index, updates) -> None`` run in each worker; must be picklable
+            (a module-level function). ``updates`` is the worker's queue of update dicts.
+    """
+
+    def __init__(self, token, workers, target):
+        self.token = token
+        self.workers = workers
+        self.target = target
+        # Spawned, not forked: the parent's logging thread and pools must not be copied half-alive.
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue() for _ in range(workers)]
+        self._processes = [None] * workers
+        self._offset = None
+        self.routed = [0] * workers
+
+    def _start_worker(self, index) -> None:
+        process = self._context.Process(target=_worker_main, args=(self.target, index, self._queues[index]),
+                                        name=f"bot-worker-{index}")
+        process.start()
+        self._processes[index] = process
+        logger.info("Started worker %s (pid %s)", index, process.pid)
+
+    def _check_workers(self) -> None:
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                logger.error("Worker %s exited with code %s: restarting it", index, process.exitcode)
+                self._start_worker(index)
+
+    def run(self) -> None:
+        asyncio.run(self._run())
+
+    async def _run(self) -> None:
+        for index in range(self.workers):
+            self._start_worker(index)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        bot = Bot(self.token)
+        await bot.initialize()
+        poller = asyncio.ensure_future(self._poll(bot))
+        await stop.wait()
+        poller.cancel()
+        try:
+            await poller
+        except asyncio.CancelledError:
+            pass
+        if self._offset is not None:
+            # Confirm the updates handed out, so Telegram does not send them again after a restart.
+            try:
+                await bot.get_updates(offset=self._offset, timeout=0)
+            except NetworkError as e:
+                logger.warning("Could not confirm the last updates: %s", e)
+        await bot.shutdown()
+
+        logger.info("Stopping workers (updates routed: %s)...", self.routed)
+        for updates in self._queues:
+            updates.put(_STOP)
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, 30)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time: terminating it", process.name)
+                process.terminate()
+
+    async def _poll(self, bot) -> None:
+        while True:
+            self._check_workers()
+            try:
+                updates = await bot.get_updates(offset=self._offset, timeout=POLL_TIMEOUT,
+                                                read_timeout=POLL_TIMEOUT + 10, allowed_updates=Update.ALL_TYPES)
+            except RetryAfter as e:
+                delay = e.retry_after
+                await asyncio.sleep(delay.total_seconds() if isinstance(delay, timedelta) else float(delay))
+                continue
+            except NetworkError as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(3)
+                continue
+            for update in updates:
+                payload = update.to_dict()
+                index = route_update(payload, self.workers)
+                self._queues[index].put(payload)
+                self.routed[index] += 1
+                self._offset = update.update_id + 1
@@ -0,0 +1,18 @@
+"""Test setup: the repository root on sys.path and a throwaway environment for importing app.py."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_work_dir = tempfile.mkdtemp(prefix="bot-tests-")
+TEST_ENV = {
+    "TELEGRAM_BOT_TOKEN": "123456:TEST",
+    "ALIEXPRESS_APP_KEY": "test-key",
+    "ALIEXPRESS_APP_SECRET": "test-secret",
+    "ALIEXPRESS_TRACKING_ID": "test",
+    "BOT_DB_PATH": os.path.join(_work_dir, "bot.db"),
+}
+for name, value in TEST_ENV.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,7 @@
+import sys
+
+
+def imported_modules():
+    """Bot modules a parse worker has imported (it should have none)."""
+    return [name for name in ("__mp_main__", "app", "telegram", "storage") if name in sys.modules
+            and (name != "__mp_main__" or getattr(sys.modules[name], "__file__", None))]
@@ -0,0 +1,78 @@
+from admission import AdmissionController, MODE_DEGRADED, MODE_NORMAL, MODE_SHED
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Backlog:
+    def __init__(self):
+        self.pending = 0
+        self.arrival = None
+
+    def oldest_arrival(self):
+        return self.arrival
+
+
+def _controller(**kwargs):
+    clock = _Clock()
+    return AdmissionController(degrade_in_flight=4, shed_in_flight=8, degrade_age=5, shed_age=15,
+                               clock=clock, **kwargs), clock
+
+
+def test_in_flight_thresholds_and_hysteresis():
+    controller, _ = _controller()
+    tickets = [controller.admit()[0] for _ in range(8)]
+    assert controller.mode == MODE_DEGRADED
+    assert controller.admit()[1] == MODE_SHED
+
+    # Below the shed threshold but not below half of it: still shedding.
+    for ticket in tickets[:3]:
+        controller.release(ticket)
+    assert controller.in_flight == 6
+    assert controller.mode == MODE_SHED
+    # Below half of the shed threshold: degraded, until below half of the degrade threshold.
+    for ticket in tickets[3:6]:
+        controller.release(ticket)
+    assert controller.mode == MODE_DEGRADED
+    controller.release(tickets[6])
+    assert controller.in_flight == 2
+    assert controller.mode == MODE_DEGRADED
+    controller.release(tickets[7])
+    assert controller.mode == MODE_NORMAL
+
+
+def test_age_is_measured_from_arrival():
+    controller, clock = _controller()
+    controller.admit(arrived_at=clock.now - 6)
+    assert controller.update_mode() == MODE_DEGRADED
+    clock.now += 10
+    assert controller.update_mode() == MODE_SHED
+
+
+def test_backlog_counts_queued_updates_and_their_age():
+    backlog = _Backlog()
+    controller, clock = _controller(backlog=backlog)
+    backlog.pending = 9
+    assert controller.in_flight == 9
+    assert controller.update_mode() == MODE_SHED
+
+    backlog.pending = 1
+    backlog.arrival = clock.now - 16
+    assert controller.oldest_age() == 16
+    assert controller.update_mode() == MODE_SHED
+    backlog.pending, backlog.arrival = 0, None
+    assert controller.update_mode() == MODE_NORMAL
+
+
+def test_track_releases_on_exit():
+    controller, _ = _controller()
+    with controller.track() as mode:
+        assert mode == MODE_NORMAL
+        assert controller.in_flight == 1
+    assert controller.in_flight == 0
+    assert controller.admitted[MODE_NORMAL] == 1
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+
+import requests
+
+import aliexpress_utils
+import app
+
+
+def test_fetch_failure_is_logged_not_printed(monkeypatch, caplog, capsys):
+    def refuse(*args, **kwargs):
+        raise requests.ConnectionError("refused")
+
+    monkeypatch.setattr(aliexpress_utils.requests, "get", refuse)
+    with caplog.at_level(logging.WARNING, logger="aliexpress_utils"):
+        fetch = aliexpress_utils.fetch_product_page_conditional("https://vi.aliexpress.com/item/1.html")
+    assert fetch.status is None
+    assert "refused" in caplog.text
+    assert capsys.readouterr().out == ""
+
+
+def test_parse_product_page_reads_embedded_state():
+    html = ('<html><head><meta property="og:title" content="Widget - AliExpress 123"></head><body>'
+            '<script>window.runParams = {"data": {"formatedActivityPrice": "US $4.20", '
+            '"currencyCode": "USD", "totalAvailQuantity": 7}};</script></body></html>')
+    record = aliexpress_utils.parse_product_page(html.encode())
+    assert record["title"] == "Widget"
+    assert (record["price"], record["currency"], record["stock"]) == ("US $4.20", "USD", 7)
+
+
+class _InlinePool:
+    async def run(self, func, *args):
+        return func(*args)
+
+
+def test_scraper_revalidates_through_the_single_fetch_path(monkeypatch):
+    url = aliexpress_utils.product_page_url("1005000000000001")
+    page = b'<html><head><meta property="og:title" content="Lamp"></head></html>'
+    sent = []
+
+    def fetch(product_url, cached=None, timeout=15):
+        sent.append(cached)
+        if cached is None:
+            return aliexpress_utils.PageFetch(200, page, "utf-8", '"v1"', None)
+        return aliexpress_utils.PageFetch(304, None, None, None, None)
+
+    monkeypatch.setattr(aliexpress_utils, "fetch_product_page_conditional", fetch)
+    monkeypatch.setattr(aliexpress_utils, "page_cache", aliexpress_utils.ScrapedPageCache())
+    monkeypatch.setattr(app, "io_pool", _InlinePool())
+    monkeypatch.setattr(app, "parse_pool", _InlinePool())
+
+    first = asyncio.run(app._scrape_product_page(url))
+    second = asyncio.run(app._scrape_product_page(url))
+    assert first["title"] == second["title"] == "Lamp"
+    assert sent[0] is None and sent[1].etag == '"v1"'
+    assert aliexpress_utils.page_cache.revalidated == 1
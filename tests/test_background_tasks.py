@@ -0,0 +1,44 @@
+import asyncio
+import logging
+
+import app
+
+
+class _FailingPool:
+    async def run(self, func, *args):
+        raise RuntimeError("pool unavailable")
+
+
+def test_warm_up_task_is_kept_and_its_failure_logged(monkeypatch, caplog):
+    monkeypatch.setattr(app, "io_pool", _FailingPool())
+
+    async def scenario():
+        await app.warm_up(None)
+        tracked = set(app.background_tasks)
+        await asyncio.gather(*tracked, return_exceptions=True)
+        await asyncio.sleep(0)
+        return tracked
+
+    with caplog.at_level(logging.ERROR, logger="app"):
+        tracked = asyncio.run(scenario())
+    assert len(tracked) == 1
+    assert not app.background_tasks
+    assert "pool unavailable" in caplog.text
+
+
+def test_broadcast_job_is_tracked_until_it_ends(monkeypatch, caplog):
+    monkeypatch.setattr(app, "io_pool", _FailingPool())
+    monkeypatch.setattr(app, "broadcast_job", None)
+
+    async def scenario():
+        app._start_broadcast_job(None, 7)
+        broadcast_id, task = app.broadcast_job
+        assert broadcast_id == 7 and task in app.background_tasks
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        return task
+
+    with caplog.at_level(logging.ERROR, logger="app"):
+        task = asyncio.run(scenario())
+    assert task not in app.background_tasks
+    assert "pool unavailable" in caplog.text
@@ -0,0 +1,67 @@
+import asyncio
+
+from batching import MicroBatcher
+
+
+def test_keys_of_one_group_are_merged_into_one_call():
+    calls = []
+
+    async def fetch(group, keys):
+        calls.append((group, sorted(keys)))
+        return {key: f"{group}:{key}" for key in keys}
+
+    async def run():
+        batcher = MicroBatcher(fetch, max_batch_size=10, max_delay=0.01)
+        results = await asyncio.gather(batcher.load("US", "1"), batcher.load("US", "2"), batcher.load("US", "1"),
+                                       batcher.load("FR", "1"))
+        return results, batcher
+
+    results, batcher = asyncio.run(run())
+    assert results == ["US:1", "US:2", "US:1", "FR:1"]
+    assert sorted(calls) == [("FR", ["1"]), ("US", ["1", "2"])]
+    assert (batcher.batches, batcher.keys) == (2, 3)
+
+
+def test_a_full_batch_is_flushed_without_waiting():
+    sizes = []
+
+    async def fetch(group, keys):
+        sizes.append(len(keys))
+        return {key: key for key in keys}
+
+    async def run():
+        batcher = MicroBatcher(fetch, max_batch_size=3, max_delay=10)
+        return await asyncio.wait_for(batcher.load_many("US", ["1", "2", "3", "1"]), 1)
+
+    assert asyncio.run(run()) == {"1": "1", "2": "2", "3": "3"}
+    assert sizes == [3]
+
+
+def test_missing_keys_and_failures_resolve_to_none():
+    async def partial(group, keys):
+        return {"1": "one"}
+
+    async def failing(group, keys):
+        raise RuntimeError("API down")
+
+    async def run(fetch):
+        return await MicroBatcher(fetch).load_many("US", ["1", "2"])
+
+    assert asyncio.run(run(partial)) == {"1": "one", "2": None}
+    assert asyncio.run(run(failing)) == {"1": None, "2": None}
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_key():
+    async def fetch(group, keys):
+        await asyncio.sleep(0.02)
+        return {key: "value" for key in keys}
+
+    async def run():
+        batcher = MicroBatcher(fetch, max_delay=0)
+        impatient = asyncio.ensure_future(batcher.load("US", "1"))
+        patient = asyncio.ensure_future(batcher.load("US", "1"))
+        await asyncio.sleep(0.005)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(run()) == "value"
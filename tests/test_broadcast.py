@@ -0,0 +1,107 @@
+import asyncio
+import time
+import types
+
+import app
+from broadcast import BroadcastStore, TokenBucket, run_broadcast
+from storage import Database
+
+
+def test_token_bucket_spaces_calls_at_the_rate():
+    async def run():
+        bucket = TokenBucket(100)
+        started = time.monotonic()
+        for _ in range(11):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # One token up front, then one every 10 ms.
+    assert 0.09 <= asyncio.run(run()) < 0.5
+
+
+def test_token_bucket_pause_holds_every_caller():
+    async def run():
+        bucket = TokenBucket(1000)
+        await bucket.acquire()
+        bucket.pause(0.05)
+        started = time.monotonic()
+        await asyncio.gather(bucket.acquire(), bucket.acquire())
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.05
+
+
+def test_token_bucket_without_rate_does_not_wait():
+    async def run():
+        bucket = TokenBucket(0)
+        started = time.monotonic()
+        for _ in range(1000):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.1
+
+
+
+def test_run_broadcast_paces_with_the_bucket_it_is_given(tmp_path):
+    store = BroadcastStore(Database(str(tmp_path / "bot.db")))
+    for chat_id in range(5):
+        store.add_subscriber(chat_id)
+    broadcast_id = store.create_broadcast(1, {"text": "deal", "photo": None})
+
+    class CountingBucket(TokenBucket):
+        acquired = 0
+
+        async def acquire(self):
+            CountingBucket.acquired += 1
+            await super().acquire()
+
+    sent = []
+
+    async def send(chat_id, payload):
+        sent.append(chat_id)
+
+    async def run():
+        shared = CountingBucket(0)
+        return await run_broadcast(store, broadcast_id, send, rate=0.001, bucket=shared)
+
+    stats = asyncio.run(run())
+    assert sorted(sent) == list(range(5))
+    assert stats.sent == 5
+    # Paced by the shared (unlimited) bucket, not a private one at 0.001 messages per second.
+    assert CountingBucket.acquired == 5
+
+
+def _broadcast_update(user_id=1):
+    message = types.SimpleNamespace(reply_to_message=None)
+    return types.SimpleNamespace(message=message, effective_user=types.SimpleNamespace(id=user_id))
+
+
+def test_broadcast_payload_resolves_short_links(monkeypatch):
+    resolved = "https://www.aliexpress.com/item/1005001112223334.html?spm=a"
+    prepared = []
+
+    async def resolve_short_link(url, session, country):
+        return resolved if url.endswith("_good") else None
+
+    async def get_http_session():
+        return None
+
+    async def get_user_locale(user):
+        return app.DEFAULT_LOCALE
+
+    async def prepare_product_reply(product_id, base_url, locale=app.DEFAULT_LOCALE, mode=app.MODE_NORMAL):
+        prepared.append((product_id, base_url))
+        return {'image_url': "img"}, "deal"
+
+    monkeypatch.setattr(app, "resolve_short_link", resolve_short_link)
+    monkeypatch.setattr(app, "get_http_session", get_http_session)
+    monkeypatch.setattr(app, "get_user_locale", get_user_locale)
+    monkeypatch.setattr(app, "_prepare_product_reply", prepare_product_reply)
+
+    payload = asyncio.run(app._build_broadcast_payload(_broadcast_update(), None, "Deal! https://s.click.aliexpress.com/e/_good"))
+    assert payload == {'text': "deal", 'photo': "img"}
+    assert prepared == [("1005001112223334", app.clean_aliexpress_url(resolved, "1005001112223334"))]
+
+    # A link that cannot be resolved is not broadcast as plain text.
+    assert asyncio.run(app._build_broadcast_payload(_broadcast_update(), None, "https://s.click.aliexpress.com/e/_bad")) is None
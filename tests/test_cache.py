@@ -0,0 +1,46 @@
+import asyncio
+
+from cache import CacheWithExpiry, PrefixCodec, RecordCodec
+
+SHARE = "https://star.aliexpress.com/share/share.htm?redirectUrl="
+
+
+def test_prefix_codec_round_trip_and_longest_prefix():
+    codec = PrefixCodec(["https://", SHARE])
+    value = SHARE + "https%3A%2F%2Fwww.aliexpress.com%2Fitem%2F1.html"
+    stored = codec.encode(value)
+    assert stored[0] == 2
+    assert len(stored) < len(value)
+    assert codec.decode(stored) == value
+    assert codec.decode(codec.encode("ftp://example.com")) == "ftp://example.com"
+    assert codec.decode(codec.encode("")) == ""
+    assert codec.encode(None) is None
+
+
+def test_record_codec_keeps_empty_fields_distinct_from_missing_ones():
+    codec = RecordCodec(("title", "price", "currency"))
+    for record in ({"title": "", "price": None, "currency": ""},
+                   {"title": None, "price": None, "currency": None},
+                   {"title": "", "price": "", "currency": ""},
+                   {"title": "Phone", "price": "12.50", "currency": "USD"}):
+        assert codec.decode(codec.encode(record)) == record
+
+
+def test_record_codec_strips_separators_and_markers_from_values():
+    codec = RecordCodec(("title", "price"))
+    stored = codec.encode({"title": "a\x1fb\0c", "price": 3})
+    assert codec.decode(stored) == {"title": "a bc", "price": "3"}
+    assert codec.decode(codec.encode({})) == {"title": None, "price": None}
+
+
+def test_cache_with_codecs_and_expiry():
+    async def run():
+        cache = CacheWithExpiry(60, value_codec=RecordCodec(("title", "price")))
+        await cache.set("1", {"title": "", "price": "9"})
+        hit = await cache.get("1")
+        miss = await cache.get("2")
+        cache.expiry_seconds = 0
+        expired = await cache.get("1")
+        return hit, miss, expired
+
+    assert asyncio.run(run()) == ({"title": "", "price": "9"}, None, None)
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+import coins_price_checker
+from coins_price_checker import BrowserPool, _BrowserWorker
+
+
+class _Element:
+    def __init__(self, text):
+        self.text = text
+
+    def is_displayed(self):
+        return True
+
+
+class FakeDriver:
+    """Serves a product page with a price for every URL except ``about:blank``."""
+
+    def __init__(self, block=None):
+        self.pages = []
+        self.current_url = "about:blank"
+        self.quit_called = threading.Event()
+        self._block = block
+
+    def set_page_load_timeout(self, timeout):
+        pass
+
+    def get(self, url):
+        if self._block is not None and url != "about:blank":
+            # Stays on the page until the browser is quit, like a hung page load.
+            self._block.set()
+            self.quit_called.wait(5)
+            raise WebDriverException("browser quit")
+        self.current_url = url
+        if url != "about:blank":
+            self.pages.append(url)
+
+    def find_element(self, by, value):
+        if value != coins_price_checker.PRICE_SELECTOR:
+            raise NoSuchElementException(value)
+        return _Element(" US $12.34 ")
+
+    def find_elements(self, by, value):
+        return [_Element("Coins to save US $1.85")]
+
+    def quit(self):
+        self.quit_called.set()
+
+
+def test_pool_shares_jobs_and_caches_results():
+    drivers = []
+
+    def factory():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    async def scenario():
+        pool = BrowserPool(size=1, job_timeout=1, driver_factory=factory)
+        try:
+            first, second = await asyncio.gather(pool.get_coins_price("http://x/1"), pool.get_coins_price("http://x/1"))
+            again = await pool.get_coins_price("http://x/1")
+        finally:
+            await pool.close()
+        return first, second, again
+
+    first, second, again = asyncio.run(scenario())
+    assert first == second == again == {'price': "US $12.34", 'coins_discount': "Coins to save US $1.85",
+                                        'url': "http://x/1"}
+    assert drivers[0].pages == ["http://x/1"]
+    assert drivers[0].quit_called.is_set()
+
+
+def test_pool_recycles_browser_after_n_pages():
+    drivers = []
+
+    def factory():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    async def scenario():
+        pool = BrowserPool(size=1, job_timeout=1, recycle_after=2, driver_factory=factory)
+        try:
+            for i in range(3):
+                await pool.get_coins_price(f"http://x/{i}")
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
+    assert [driver.pages for driver in drivers] == [["http://x/0", "http://x/1"], ["http://x/2"]]
+    assert drivers[0].quit_called.is_set()
+
+
+def test_reset_unblocks_stuck_browser_and_starts_a_fresh_one():
+    entered = threading.Event()
+    drivers = [FakeDriver(block=entered), FakeDriver()]
+    factory = iter(drivers).__next__
+
+    async def scenario():
+        worker = _BrowserWorker(0, factory)
+        await worker.start()
+        stuck_job = asyncio.ensure_future(worker.run(worker._check, "http://x/slow", 1))
+        await asyncio.get_running_loop().run_in_executor(None, entered.wait, 5)
+        # The new browser runs on a fresh thread, not behind the stuck job.
+        await asyncio.wait_for(worker.reset(), 2)
+        result = await asyncio.wait_for(worker.run(worker._check, "http://x/fast", 1), 2)
+        stuck_error = await asyncio.gather(stuck_job, return_exceptions=True)
+        await worker.close()
+        return result, stuck_error[0]
+
+    result, stuck_error = asyncio.run(scenario())
+    assert drivers[0].quit_called.is_set()
+    assert isinstance(stuck_error, WebDriverException)
+    assert result['url'] == "http://x/fast"
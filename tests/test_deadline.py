@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+import deadline
+
+
+def test_no_budget():
+    assert deadline.remaining() is None
+    assert not deadline.expired()
+    assert deadline.timeout_for(5) == 5
+
+
+def test_nested_budgets_only_shorten():
+    with deadline.budget(10):
+        with deadline.budget(100):
+            assert deadline.remaining() <= 10
+        with deadline.budget(1):
+            assert deadline.remaining() <= 1
+            assert deadline.timeout_for(5) <= 1
+            assert deadline.timeout_for(0.5) == 0.5
+    assert deadline.remaining() is None
+
+
+def test_expired_budget_gives_the_floor():
+    with deadline.budget(0):
+        assert deadline.expired()
+        assert deadline.timeout_for(5) == 0
+        assert deadline.timeout_for(None, floor=1.0) == 1.0
+
+
+def test_within_returns_the_default_on_timeout():
+    async def slow():
+        await asyncio.sleep(1)
+        return "done"
+
+    async def run():
+        with deadline.budget(0.02):
+            return await deadline.within(slow(), default="late")
+
+    assert asyncio.run(run()) == "late"
+
+
+def test_within_closes_the_coroutine_when_nothing_is_left():
+    started = []
+
+    async def work():
+        started.append(True)
+
+    async def run():
+        with deadline.budget(0):
+            return await deadline.within(work(), default="skipped")
+
+    assert asyncio.run(run()) == "skipped"
+    assert started == []
+
+
+def test_within_caps_the_wait():
+    async def run():
+        return await deadline.within(asyncio.sleep(1, "done"), cap=0.01, default="capped")
+
+    assert asyncio.run(run()) == "capped"
+
+
+def test_detached_work_is_outside_the_callers_budget():
+    async def shared():
+        await asyncio.sleep(0.05)
+        return deadline.remaining()
+
+    async def run():
+        with deadline.budget(0.01):
+            task = deadline.detached(shared())
+            waited = await deadline.within(asyncio.shield(task), default="gave up")
+        return waited, await task
+
+    waited, left = asyncio.run(run())
+    assert waited == "gave up"
+    assert left is None
+
+
+def test_detached_needs_a_running_loop():
+    async def nothing():
+        pass
+
+    coro = nothing()
+    with pytest.raises(RuntimeError):
+        deadline.detached(coro)
+    coro.close()
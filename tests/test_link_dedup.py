@@ -0,0 +1,86 @@
+import asyncio
+import types
+
+import app
+
+
+def _links():
+    return app.classify_message_links("https://www.aliexpress.com/item/1005001234567890.html")
+
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+
+
+def _fresh_dedup_state(monkeypatch):
+    monkeypatch.setattr(app, "recent_chat_requests", app.CacheWithExpiry(60))
+    monkeypatch.setattr(app, "recent_link_replies", app.CacheWithExpiry(300))
+    monkeypatch.setattr(app, "link_replies_in_flight", {})
+
+
+def _repeat_in_chat(monkeypatch, cached):
+    _fresh_dedup_state(monkeypatch)
+    delivered = []
+
+    async def send_replies(context, chat_id, replies):
+        delivered.append(replies)
+
+    monkeypatch.setattr(app, "_send_replies", send_replies)
+    links = _links()
+    request_key = app._link_set_key(links, app.DEFAULT_LOCALE)
+    bot = _Bot()
+    update = types.SimpleNamespace(effective_chat=types.SimpleNamespace(id=1), effective_user=None)
+
+    async def run():
+        await app.recent_chat_requests.set(f"1|{request_key}", True)
+        if cached:
+            await app.recent_link_replies.set(request_key, app.LinkReplies([({'id': '1'}, "reply")], True))
+        await app._process_links(update, types.SimpleNamespace(bot=bot), links, app.MODE_NORMAL)
+
+    asyncio.run(run())
+    return delivered, bot.sent
+
+
+def test_repeated_links_get_the_cached_replies_again(monkeypatch):
+    delivered, sent = _repeat_in_chat(monkeypatch, cached=True)
+    assert delivered == [[({'id': '1'}, "reply")]]
+    assert sent == []
+
+
+def test_repeated_links_without_cached_replies_get_a_notice(monkeypatch):
+    delivered, sent = _repeat_in_chat(monkeypatch, cached=False)
+    assert delivered == []
+    assert sent == [app.REPEATED_LINKS_TEXT]
+
+
+def test_in_flight_builds_are_only_shared_with_requests_they_are_complete_enough_for(monkeypatch):
+    _fresh_dedup_state(monkeypatch)
+    builds = []
+
+    async def build(links, locale, mode):
+        builds.append(mode)
+        await asyncio.sleep(0.05)
+        return app.LinkReplies([({'id': '1'}, f"{mode} reply")], True)
+
+    monkeypatch.setattr(app, "_build_link_replies", build)
+
+    async def run():
+        links = _links()
+        key = app._link_set_key(links, app.DEFAULT_LOCALE)
+        degraded = asyncio.ensure_future(app._get_link_replies(links, app.DEFAULT_LOCALE, app.MODE_DEGRADED, key))
+        await asyncio.sleep(0)
+        normal = asyncio.ensure_future(app._get_link_replies(links, app.DEFAULT_LOCALE, app.MODE_NORMAL, key))
+        await asyncio.sleep(0)
+        shed = asyncio.ensure_future(app._get_link_replies(links, app.DEFAULT_LOCALE, app.MODE_SHED, key))
+        return [result.replies[0][1] for result in await asyncio.gather(degraded, normal, shed)]
+
+    results = asyncio.run(run())
+    assert builds == [app.MODE_DEGRADED, app.MODE_NORMAL]
+    assert results[0] == "degraded reply"
+    assert results[1] == "normal reply"
+    # Shed requests join any build, the most complete one first.
+    assert results[2] == "normal reply"
@@ -0,0 +1,24 @@
+import app
+
+
+def test_chunk_source_values_respects_count_and_length(monkeypatch):
+    monkeypatch.setattr(app, "LINK_GENERATE_BATCH_SIZE", 3)
+    monkeypatch.setattr(app, "LINK_GENERATE_MAX_CHARS", 25)
+    urls = ["a" * 10, "b" * 10, "c" * 3, "d" * 3, "e" * 3, "f" * 40]
+    chunks = app._chunk_source_values(urls)
+    assert [url for chunk in chunks for url in chunk] == urls
+    assert chunks == [["a" * 10, "b" * 10], ["c" * 3, "d" * 3, "e" * 3], ["f" * 40]]
+    for chunk in chunks:
+        assert len(chunk) <= 3
+        # A single URL longer than the limit still goes out, alone.
+        assert len(",".join(chunk)) <= 25 or len(chunk) == 1
+    assert app._chunk_source_values([]) == []
+
+
+def test_response_message_escapes_scraped_fields():
+    product = {'title': 'Cable <USB> & more', 'price': 'US $1<b>', 'currency': None,
+               'coin_discount': 'Coins to save <i>5%</i>', 'product_id': '1'}
+    text = app._build_response_message(product, {'coin': 'https://s.click.aliexpress.com/e/_x'}, "Scraped")
+    assert "Cable &lt;USB&gt; &amp; more" in text
+    assert "US $1&lt;b&gt;" in text
+    assert "Coins to save &lt;i&gt;5%&lt;/i&gt;" in text
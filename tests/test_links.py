@@ -0,0 +1,24 @@
+import app
+
+
+def test_classify_message_links():
+    text = ("Look: https://www.aliexpress.com/item/1005001234567890.html?spm=x and "
+            "s.click.aliexpress.com/e/_DlAbCdE plus https://a.aliexpress.com/_mKxYz "
+            "and https://m.aliexpress.com/p/coin-index/index.html?productIds=1005009999999999 "
+            "and https://www.aliexpress.com/store/123 and again "
+            "https://www.aliexpress.com/item/1005001234567890.html?spm=x")
+    links = app.classify_message_links(text)
+    assert [(link.kind, link.product_id) for link in links] == [
+        (app.LINK_KIND_PRODUCT, "1005001234567890"),
+        (app.LINK_KIND_SHORT, None),
+        (app.LINK_KIND_SHORT, None),
+        (app.LINK_KIND_PRODUCT, "1005009999999999"),
+        (app.LINK_KIND_PAGE, None),
+    ]
+    assert links[1].url == "https://s.click.aliexpress.com/e/_DlAbCdE"
+
+
+def test_classify_ignores_lookalike_hosts_and_plain_text():
+    assert app.classify_message_links("no links here") == []
+    assert app.classify_message_links("https://notaliexpress.com/item/1.html me@aliexpress.com") == []
+
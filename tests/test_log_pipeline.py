@@ -0,0 +1,31 @@
+import logging
+import queue
+
+from log_pipeline import LazyQueueHandler
+
+
+def _queued(msg, *args, mutate=None):
+    log_queue = queue.SimpleQueue()
+    LazyQueueHandler(log_queue).emit(logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None))
+    if mutate:
+        mutate()
+    return log_queue.get_nowait()
+
+
+def test_scalar_args_are_left_for_the_listener():
+    record = _queued("sent %s of %d (%.1f/s)", "batch", 3, 2.5)
+    assert record.args == ("batch", 3, 2.5)
+    assert record.getMessage() == "sent batch of 3 (2.5/s)"
+
+
+def test_mutable_args_are_formatted_at_the_call():
+    stats = {"sent": 1}
+    record = _queued("stats %s", stats, mutate=lambda: stats.update(sent=2))
+    assert record.args is None
+    assert record.getMessage() == "stats {'sent': 1}"
+
+
+def test_mapping_args_are_formatted_at_the_call():
+    state = {"chat": 5}
+    record = _queued("chat %(chat)s", state, mutate=lambda: state.update(chat=6))
+    assert record.getMessage() == "chat 5"
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from conftest import ROOT
+
+# Runs app.py as the main script, with its main() replaced by one parse_pool job that reports
+# what the spawned worker had imported.
+_RUN_APP_AS_SCRIPT = textwrap.dedent("""
+    import asyncio, runpy, sys
+    import app
+
+    def main():
+        from pools import parse_pool, shutdown_pools
+        from tests.parse_probe import imported_modules
+        print(sorted(asyncio.run(parse_pool.run(imported_modules))))
+        shutdown_pools()
+
+    app.main = main
+    runpy.run_path(app.__file__, run_name="__main__")
+""")
+
+
+def test_parse_workers_are_spawned():
+    from pools import parse_pool
+
+    executor = parse_pool._factory(1)
+    try:
+        assert executor._mp_context.get_start_method() == "spawn"
+    finally:
+        executor.shutdown()
+
+
+def test_parse_workers_do_not_rerun_app():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, "-c", _RUN_APP_AS_SCRIPT], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[]"
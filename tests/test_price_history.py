@@ -0,0 +1,36 @@
+from price_history import PriceHistoryStore, parse_price
+from storage import Database
+
+
+def _store(tmp_path):
+    return PriceHistoryStore(Database(str(tmp_path / "bot.db")))
+
+
+def test_due_alerts_fire_once_per_new_low(tmp_path):
+    store = _store(tmp_path)
+    store.add_watch(1, "100", "USD|EN|US", "Phone", 90.0)
+    store.add_watch(2, "100", "USD|EN|US", "Phone", 80.0)
+    store.add_watch(3, "100", "EUR|FR|FR", "Phone", 200.0)
+
+    assert store.due_alerts("USD|EN|US", {"100": 95.0}) == []
+    alerts = store.due_alerts("USD|EN|US", {"100": 85.0, "200": None})
+    assert alerts == [(1, "100", "Phone", 85.0)]
+    store.mark_notified(alerts)
+
+    # Same price again: no repeat. A new low: the first watch again, and now the second one too.
+    assert store.due_alerts("USD|EN|US", {"100": 85.0}) == []
+    assert sorted(store.due_alerts("USD|EN|US", {"100": 79.0})) == [(1, "100", "Phone", 79.0), (2, "100", "Phone", 79.0)]
+
+
+def test_due_alerts_are_per_locale(tmp_path):
+    store = _store(tmp_path)
+    store.add_watch(1, "100", "EUR|FR|FR", "Phone", 50.0)
+    assert store.due_alerts("USD|EN|US", {"100": 10.0}) == []
+    assert store.due_alerts("EUR|FR|FR", {"100": 10.0}) == [(1, "100", "Phone", 10.0)]
+
+
+def test_parse_price():
+    assert parse_price("1,299.50") == 1299.5
+    assert parse_price(" 12 ") == 12.0
+    assert parse_price("N/A") is None
+    assert parse_price(None) is None
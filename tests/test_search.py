@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("page_size, page, expected", [
+    (5, 0, [1]),
+    (5, 3, [1]),
+    (5, 4, [2]),
+    (7, 2, [1, 2]),
+    (7, 3, [2]),
+    (7, 5, [2, 3]),
+    (20, 1, [2]),
+    (30, 1, [2, 3]),
+])
+def test_search_api_pages(monkeypatch, page_size, page, expected):
+    monkeypatch.setattr(app, "SEARCH_PAGE_SIZE", page_size)
+    assert list(app._search_api_pages(page)) == expected
+
+
+def test_results_pages_are_sliced_across_api_pages(monkeypatch):
+    monkeypatch.setattr(app, "SEARCH_PAGE_SIZE", 7)
+    fetched = []
+
+    async def get_search_page(query, api_page, locale):
+        fetched.append(api_page)
+        first = (api_page - 1) * app.SEARCH_API_PAGE_SIZE
+        products = [(str(i), f"Product {i}", "1.00", "USD", "link") for i in range(first, first + app.SEARCH_API_PAGE_SIZE)]
+        return app.SearchPage(products, 45)
+
+    monkeypatch.setattr(app, "get_search_page", get_search_page)
+    monkeypatch.setattr(app, "search_cache", app.CacheWithExpiry(60))
+
+    async def shown(page):
+        text, _ = await app._render_search_page("phone", "id", page, app.DEFAULT_LOCALE)
+        return [line.split("Product ")[1].split("<")[0] for line in text.splitlines() if "Product " in line]
+
+    async def run():
+        return [await shown(page) for page in range(7)]
+
+    pages = asyncio.run(run())
+    assert [product for page in pages for product in page] == [str(i) for i in range(49)]
+    assert all(len(page) == 7 for page in pages)
+
+
+def test_next_page_prefetch_is_tracked(monkeypatch):
+    monkeypatch.setattr(app, "SEARCH_PAGE_SIZE", app.SEARCH_API_PAGE_SIZE)
+    monkeypatch.setattr(app, "search_cache", app.CacheWithExpiry(60))
+    release = None
+
+    async def get_search_page(query, api_page, locale):
+        if api_page > 1:
+            await release.wait()
+        products = [(str(i), f"Product {i}", "1.00", "USD", "link") for i in range(app.SEARCH_API_PAGE_SIZE)]
+        return app.SearchPage(products, 3 * app.SEARCH_API_PAGE_SIZE)
+
+    monkeypatch.setattr(app, "get_search_page", get_search_page)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        await app._render_search_page("phone", "id", 0, app.DEFAULT_LOCALE)
+        prefetches = set(app.background_tasks)
+        release.set()
+        await asyncio.gather(*prefetches)
+        await asyncio.sleep(0)
+        return prefetches
+
+    prefetches = asyncio.run(run())
+    assert len(prefetches) == 1
+    assert not app.background_tasks
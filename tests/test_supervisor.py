@@ -0,0 +1,34 @@
+import asyncio
+import types
+
+import app
+from storage import Database
+from supervisor import route_update, shard_for
+from user_settings import UserSettingsStore
+
+
+def _message(chat_id, user_id, text="hi"):
+    return {"update_id": 1, "message": {"message_id": 1, "date": 0, "text": text,
+                                        "chat": {"id": chat_id, "type": "group" if chat_id < 0 else "private"},
+                                        "from": {"id": user_id, "is_bot": False, "first_name": "A"}}}
+
+
+def test_routes_by_chat_and_sends_broadcast_to_the_primary_worker():
+    assert route_update(_message(1234, 1234), 4) == shard_for(1234, 4)
+    assert route_update(_message(1234, 1234, "/broadcast hello"), 4) == 0
+    assert route_update({"update_id": 1}, 4) == 0
+
+
+def test_locale_set_through_one_worker_is_seen_by_another(tmp_path, monkeypatch):
+    user_id, group_id = 1000, -100777
+    workers = 8
+    assert route_update(_message(user_id, user_id), workers) != route_update(_message(group_id, user_id), workers)
+
+    path = str(tmp_path / "bot.db")
+    # The private chat's worker saves the choice...
+    UserSettingsStore(Database(path)).set_locale(user_id, "EUR", "FR", "FR")
+    # ...and the group chat's worker, with its own connection and an empty cache, reads it.
+    monkeypatch.setattr(app, "user_settings", UserSettingsStore(Database(path)))
+    monkeypatch.setattr(app, "user_locales", app.CacheWithExpiry(60))
+    locale = asyncio.run(app.get_user_locale(types.SimpleNamespace(id=user_id)))
+    assert locale == app.Locale("EUR", "FR", "FR")
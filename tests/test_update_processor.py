@@ -0,0 +1,82 @@
+import asyncio
+import types
+
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def _update(chat_id):
+    return types.SimpleNamespace(effective_chat=None if chat_id is None else types.SimpleNamespace(id=chat_id))
+
+
+def test_each_chat_runs_in_order_and_chats_run_concurrently():
+    processor = ChatOrderedUpdateProcessor(4)
+    events = []
+    running = 0
+    most_running = 0
+
+    async def handle(chat_id, index, delay):
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        events.append((chat_id, index))
+        await asyncio.sleep(delay)
+        running -= 1
+
+    async def run():
+        # Chat 1's first update is the slowest: its later ones must still wait for it.
+        jobs = [(1, 0, 0.05), (1, 1, 0.0), (2, 0, 0.01), (1, 2, 0.0), (2, 1, 0.0), (None, 0, 0.0)]
+        await asyncio.gather(*(processor.process_update(_update(chat_id), handle(chat_id, index, delay))
+                               for chat_id, index, delay in jobs))
+
+    asyncio.run(run())
+    assert [index for chat_id, index in events if chat_id == 1] == [0, 1, 2]
+    assert [index for chat_id, index in events if chat_id == 2] == [0, 1]
+    assert most_running > 1
+    assert processor.stats()["completed"] == 6
+    assert processor.stats()["chats"] == 0
+
+
+def test_concurrency_limit():
+    processor = ChatOrderedUpdateProcessor(2)
+    running = 0
+    most_running = 0
+
+    async def handle():
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def run():
+        await asyncio.gather(*(processor.process_update(_update(chat_id), handle()) for chat_id in range(10)))
+
+    asyncio.run(run())
+    assert most_running == 2
+
+
+def test_arrival_of_pending_updates_is_tracked():
+    processor = ChatOrderedUpdateProcessor(1)
+    first, second = _update(1), _update(2)
+    seen = {}
+
+    async def handle(update):
+        await asyncio.sleep(0.001)
+        seen[id(update)] = (processor.pending, processor.arrived_at(update), processor.oldest_arrival())
+        await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(processor.process_update(first, handle(first)),
+                             processor.process_update(second, handle(second)))
+
+    asyncio.run(run())
+    pending, first_arrival, oldest = seen[id(first)]
+    assert pending == 2
+    assert oldest == first_arrival
+    pending, second_arrival, oldest = seen[id(second)]
+    # The second update waited for the only slot: its age counts from arrival, not from its start.
+    assert pending == 1
+    assert second_arrival <= first_arrival + 0.005
+    assert processor.pending == 0
+    assert processor.oldest_arrival() is None
+    assert processor.arrived_at(first) is None
@@ -0,0 +1,58 @@
+import asyncio
+import types
+
+import app
+from storage import Database
+from user_settings import UserSettingsStore
+
+
+def test_store_round_trip(tmp_path):
+    store = UserSettingsStore(Database(str(tmp_path / "bot.db")))
+    assert store.get_locale(42) is None
+    store.set_locale(42, "EUR", "FR", "FR")
+    assert store.get_locale(42) == ("EUR", "FR", "FR")
+    store.reset_locale(42)
+    assert store.get_locale(42) is None
+
+
+def test_locale_survives_a_restart(tmp_path):
+    path = str(tmp_path / "bot.db")
+    UserSettingsStore(Database(path)).set_locale(7, "", "ES", "ES")
+    # A new process: fresh connection and store, nothing in memory.
+    assert UserSettingsStore(Database(path)).get_locale(7) == ("", "ES", "ES")
+
+
+def test_get_user_locale_reads_the_shared_store(tmp_path, monkeypatch):
+    store = UserSettingsStore(Database(str(tmp_path / "bot.db")))
+    monkeypatch.setattr(app, "user_settings", store)
+    monkeypatch.setattr(app, "user_locales", app.CacheWithExpiry(60))
+    # Set through another worker: this process has nothing cached for the user.
+    store.set_locale(5, "EUR", "DE", "DE")
+
+    async def lookups():
+        return (await app.get_user_locale(types.SimpleNamespace(id=5)),
+                await app.get_user_locale(types.SimpleNamespace(id=6)),
+                await app.get_user_locale(None))
+
+    assert asyncio.run(lookups()) == (app.Locale("EUR", "DE", "DE"), app.DEFAULT_LOCALE, app.DEFAULT_LOCALE)
+
+
+def test_locale_command_saves_and_resets(tmp_path, monkeypatch):
+    store = UserSettingsStore(Database(str(tmp_path / "bot.db")))
+    monkeypatch.setattr(app, "user_settings", store)
+    monkeypatch.setattr(app, "user_locales", app.CacheWithExpiry(60))
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    def command(*args):
+        update = types.SimpleNamespace(effective_user=types.SimpleNamespace(id=9),
+                                       message=types.SimpleNamespace(reply_text=reply_text, reply_html=reply_text))
+        return app.locale_command(update, types.SimpleNamespace(args=list(args)))
+
+    asyncio.run(command("eur", "fr"))
+    assert store.get_locale(9) == ("EUR", "FR", app.DEFAULT_LOCALE.country)
+    asyncio.run(command("reset"))
+    assert store.get_locale(9) is None
+    assert asyncio.run(app.get_user_locale(types.SimpleNamespace(id=9))) == app.DEFAULT_LOCALE
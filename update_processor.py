@@ -0,0 +1,126 @@
+"""Concurrent update processing that keeps each chat's updates in order.
+
+python-telegram-bot processes one update at a time unless the application is
+given an update processor allowing more; then updates run in any order. The
+``ChatOrderedUpdateProcessor`` sits in between:
+
+* updates from different chats run concurrently, up to ``max_concurrent_updates``
+* updates from the same chat run one at a time, in arrival order (one lock per
+  chat, created on demand and dropped once the chat has nothing queued)
+* updates without a chat (inline queries) only take a concurrency slot
+
+A chat waiting for its own earlier update does not hold a concurrency slot, so
+one user sending a burst of slow links cannot stall everyone else. The time
+each update spends queued (for its chat, then for a slot) is recorded, and the
+arrival time of every update still pending (queued or running) is kept, so
+admission control can see the backlog and its age (see ``admission.py``).
+"""
+import asyncio
+import logging
+import time
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Per-chat ordering with a global concurrency limit.
+    Args:
+        max_concurrent_updates (int): Updates processed at the same time, all chats together.
+        max_pending_updates (int): Updates let in at once, running or waiting for their chat
+            (the base class limit); defaults to 8 x ``max_concurrent_updates``.
+    """
+
+    def __init__(self, max_concurrent_updates, max_pending_updates=None):
+        super().__init__(max_pending_updates or max_concurrent_updates * 8)
+        self.concurrency = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_queued: dict[int, int] = {}
+        # Arrival time of each pending update, by id(update); insertion order is arrival order.
+        self._arrivals: dict[int, float] = {}
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update, coroutine) -> None:
+        chat = getattr(update, "effective_chat", None)
+        chat_id = chat.id if chat is not None else None
+        queued_at = time.monotonic()
+        self._arrivals[id(update)] = queued_at
+        self.waiting += 1
+        started = False
+        try:
+            if chat_id is None:
+                async with self._slots:
+                    started = True
+                    await self._run(coroutine, queued_at)
+                return
+            lock = self._chat_locks.get(chat_id)
+            if lock is None:
+                lock = self._chat_locks[chat_id] = asyncio.Lock()
+            self._chat_queued[chat_id] = self._chat_queued.get(chat_id, 0) + 1
+            try:
+                # The chat lock first: a chat waiting for its previous update holds no slot.
+                async with lock, self._slots:
+                    started = True
+                    await self._run(coroutine, queued_at)
+            finally:
+                self._chat_queued[chat_id] -= 1
+                if not self._chat_queued[chat_id]:
+                    del self._chat_queued[chat_id]
+                    del self._chat_locks[chat_id]
+        finally:
+            del self._arrivals[id(update)]
+            if not started:
+                # Cancelled while queued (shutdown): the update is never processed.
+                self.waiting -= 1
+                coroutine.close()
+
+    async def _run(self, coroutine, queued_at) -> None:
+        waited = time.monotonic() - queued_at
+        self.waiting -= 1
+        self.running += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+            self.completed += 1
+
+    @property
+    def pending(self) -> int:
+        """Updates received and not finished yet: running, or queued for their chat or a slot."""
+        return len(self._arrivals)
+
+    def arrived_at(self, update) -> float | None:
+        """``time.monotonic()`` at which a pending ``update`` reached the processor."""
+        return self._arrivals.get(id(update))
+
+    def oldest_arrival(self) -> float | None:
+        for arrived in self._arrivals.values():
+            return arrived
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "waiting": self.waiting,
+            "pending": self.pending,
+            "chats": len(self._chat_locks),
+            "completed": self.completed,
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
@@ -0,0 +1,51 @@
+"""Per-user settings (currently the /locale choice), kept in the bot database.
+
+Settings live in SQLite rather than python-telegram-bot's ``user_data``, which
+is per process and in memory: they survive restarts, and in multi-process mode
+every worker sees the same choice whichever chat the user writes from. The bot
+reads them through a short-lived in-memory cache (see ``get_user_locale`` in
+app.py).
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_locales (
+    user_id INTEGER PRIMARY KEY,
+    currency TEXT NOT NULL,
+    language TEXT NOT NULL,
+    country TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class UserSettingsStore:
+    """
+    Users' locale settings. Methods are blocking; run them on ``io_pool``.
+    Args:
+        database (storage.Database): Database holding the table.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def _ready(self):
+        self.db.ensure_schema("user_settings", SCHEMA)
+        return self.db
+
+    def get_locale(self, user_id) -> tuple[str, str, str] | None:
+        """``(currency, language, country)`` chosen by the user, or None for the defaults."""
+        rows = self._ready().execute(
+            "SELECT currency, language, country FROM user_locales WHERE user_id = ?", (user_id,))
+        return tuple(rows[0]) if rows else None
+
+    def set_locale(self, user_id, currency, language, country) -> None:
+        self._ready().execute(
+            "INSERT OR REPLACE INTO user_locales (user_id, currency, language, country, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, currency, language, country, time.time()))
+
+    def reset_locale(self, user_id) -> None:
+        self._ready().execute("DELETE FROM user_locales WHERE user_id = ?", (user_id,))